@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark: candle archive startup and range reads vs archive size
+
+Writes archives of every configured pair at growing sizes, then measures
+opening them and filling a CandleStore (what the bot does on start), and
+the latency of one-day range reads against a full scan of the time column.
+
+Usage: python benchmarks/bench_archive.py [directory]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS
+from market.archive import CandleArchive
+from market.candles import CandleStore, TIME
+from market.stub_exchange import synthetic_klines
+
+
+def build(directory, count):
+    """Archives of `count` hourly candles for every pair"""
+    shutil.rmtree(directory, ignore_errors=True)
+    archive = CandleArchive(directory)
+    for pair in DEFAULT_TRADING_PAIRS:
+        series = archive.series(pair, '1h')
+        for start in range(0, count, 100_000):
+            series.append(synthetic_klines(pair, '1h', start * 3600, min(100_000, count - start)))
+    archive.close()
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.gettempdir(), 'bench_archive')
+    rng = np.random.default_rng(1)
+    for count in (10_000, 100_000, 1_000_000):
+        build(directory, count)
+        size = sum(entry.stat().st_size for entry in os.scandir(directory)) / 1e6
+
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            archive = CandleArchive(directory)
+            archive.open_all(DEFAULT_TRADING_PAIRS, ['1h'])
+            archive.load_into(CandleStore(DEFAULT_TRADING_PAIRS, ['1h']))
+            timings.append(time.perf_counter() - start)
+            archive.close()
+
+        archive = CandleArchive(directory)
+        series = archive.series(DEFAULT_TRADING_PAIRS[0], '1h')
+        starts = rng.integers(0, count - 24, 1000) * 3600.0
+        series.range(0, 1)
+        start = time.perf_counter()
+        for day in starts:
+            series.range(day, day + 86400)
+        indexed = (time.perf_counter() - start) / len(starts)
+        times = series.range()[TIME]
+        start = time.perf_counter()
+        for day in starts[:100]:
+            mask = (times >= day) & (times < day + 86400)
+            series.range()[:, mask]
+        scan = (time.perf_counter() - start) / 100
+        archive.close()
+        print(f"{count:>9,} candles/pair ({size:7.1f} MB): open + load {min(timings) * 1000:6.2f} ms, "
+              f"range read {indexed * 1e6:6.1f} us (full scan {scan * 1e6:8.1f} us)")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vectorized backtest of idea parameter sets
+
+Backtests a grid of take profit / stop / horizon / direction parameter sets
+over synthetic hourly history of every configured pair and reports ideas
+(entries x parameter sets) evaluated per second:
+  - a plain Python candle-by-candle loop (reference, small sample)
+  - the vectorized Backtester in one process
+  - sweep() across a process pool
+The loop results are also used to check the vectorized ones.
+
+Usage: python benchmarks/bench_backtest.py [candles] [workers]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS
+from market.backtest import Backtester, parameter_grid, idea_params, sweep, top, DIRECTIONS, WARMUP
+from market.candles import HIGH, LOW, CLOSE
+from market.stub_exchange import synthetic_klines
+
+
+def loop_backtest(candles, params, macd_side, max_horizon):
+    """Mean return per idea of each parameter set, one candle at a time"""
+    close, high, low = candles[CLOSE], candles[HIGH], candles[LOW]
+    results = []
+    for tps, stop, horizon, direction in params:
+        total = 0.0
+        entries = range(WARMUP, len(close) - max_horizon)
+        for i in entries:
+            side = direction or macd_side[i]
+            entry = close[i]
+            exits = [None, None, None]
+            for j in range(i + 1, i + 1 + horizon):
+                up, down = high[j] / entry - 1, 1 - low[j] / entry
+                favourable, adverse = (up, down) if side > 0 else (down, up)
+                # Stop first when both are touched within the candle
+                if adverse >= stop:
+                    exits = [-stop if value is None else value for value in exits]
+                    break
+                for k in range(3):
+                    if exits[k] is None and favourable >= tps[k]:
+                        exits[k] = tps[k]
+                if None not in exits:
+                    break
+            expiry = side * (close[i + horizon] / entry - 1)
+            total += sum(expiry if value is None else value for value in exits) / 3
+        results.append(total / len(entries))
+    return np.array(results)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    start_time = 1_600_000_000 // 3600 * 3600
+    history = {pair: synthetic_klines(pair, '1h', start_time, count).T for pair in DEFAULT_TRADING_PAIRS}
+    params = parameter_grid(
+        take_profits=[0.01, 0.02, 0.03, 0.05, 0.08, 0.12],
+        stops=[0.01, 0.02, 0.03, 0.05, 0.08],
+        horizons=[12, 24, 48, 96],
+        directions=list(DIRECTIONS.values())
+    )
+    max_horizon = int(params['horizon'].max())
+    print(f"{len(history)} pairs x {count} candles, {len(params)} parameter sets")
+
+    start = time.perf_counter()
+    backtester = Backtester(history, max_horizon)
+    prepare = time.perf_counter() - start
+    ideas = backtester.entries * len(params)
+    print(f"prepare: {prepare * 1000:.0f} ms for {backtester.entries} entries")
+
+    # Reference loop on one pair and a few parameter sets
+    symbol = DEFAULT_TRADING_PAIRS[0]
+    sample = params[::max(1, len(params) // 12)]
+    series = backtester.series[symbol]
+    macd_side = np.zeros(len(series.close), dtype=int)
+    macd_side[series.entries] = series.macd_side
+    start = time.perf_counter()
+    expected = loop_backtest(history[symbol], sample, macd_side, max_horizon)
+    loop_time = time.perf_counter() - start
+    loop_ideas = len(series.entries) * len(sample)
+    vectorized = backtester.evaluate(sample, [symbol])['pnl']
+    mismatch = np.max(np.abs(vectorized - expected))
+    print(f"python loop:  {loop_ideas / loop_time:12,.0f} ideas/s (max pnl difference {mismatch:.2e})")
+
+    start = time.perf_counter()
+    results = backtester.evaluate(params)
+    elapsed = time.perf_counter() - start
+    print(f"vectorized:   {ideas / elapsed:12,.0f} ideas/s ({elapsed:.2f} s)")
+
+    start = time.perf_counter()
+    swept = sweep(history, params, workers=workers)
+    elapsed = time.perf_counter() - start
+    print(f"sweep x{workers:<3d}:   {ideas / elapsed:12,.0f} ideas/s ({elapsed:.2f} s, incl. pool start)")
+    assert np.allclose(swept['pnl'], results['pnl'])
+
+    published = backtester.evaluate(idea_params(horizon=48))[0]
+    fills = ', '.join(f"TP{k + 1} {rate:.1%}" for k, rate in enumerate(published['tp_fill']))
+    print(f"published levels (48h, MACD direction): {fills}, stopped {published['stopped']:.1%}, "
+          f"expired {published['expired']:.1%}, pnl/idea {published['pnl']:+.3%}")
+    print("best parameter sets:")
+    for row in top(params, results, n=5):
+        print(f"  {row}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark: blocking telebot dispatch vs asyncio dispatch
+
+Both bots run the real handlers against a fake transport that sleeps for a
+simulated Telegram round trip, so the numbers reflect dispatch concurrency
+rather than network conditions. Outbox rate limits are lifted; an update
+counts as done once its result message is delivered.
+
+Usage: python benchmarks/bench_dispatch.py [updates] [rtt_ms]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from bot.handlers import setup_handlers
+from bot.async_handlers import setup_async_handlers
+from bot.outbox import ThreadedOutbox, AsyncOutbox
+from bot.messages import SUCCESS_ANALYSIS_STARTED
+from bot.responder import api_calls_per_request
+from utils.metrics import metrics
+
+TOKEN = '123456:BENCHMARK'
+UNLIMITED = {'global_rate': 1e9, 'chat_rate': 1e9, 'chat_burst': 1e9, 'workers': 256}
+logging.getLogger('crypto_bot').setLevel(logging.WARNING)
+
+COMMANDS = ['/idea', '/analyze', 'Думаю покупать BTC на откате']
+
+
+def make_updates(count):
+    """Build a mix of recorded-style updates for different chats"""
+    updates = []
+    for i in range(count):
+        text = COMMANDS[i % len(COMMANDS)]
+        entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else None
+        message = {
+            'message_id': i + 1,
+            'from': {'id': 1000 + i, 'is_bot': False, 'first_name': 'User'},
+            'chat': {'id': 1000 + i, 'type': 'private'},
+            'date': int(time.time()),
+            'text': text,
+        }
+        if entities:
+            message['entities'] = entities
+        updates.append(types.Update.de_json({'update_id': i + 1, 'message': message}))
+    return updates
+
+
+class FakeSyncBot(telebot.TeleBot):
+    """TeleBot whose API calls block for a fixed round trip"""
+
+    def __init__(self, rtt, **kwargs):
+        super().__init__(TOKEN, **kwargs)
+        self.rtt = rtt
+        self.calls = 0
+        self.results = 0
+        self.lock = threading.Lock()
+
+    def _call(self, text=None):
+        time.sleep(self.rtt)
+        with self.lock:
+            self.calls += 1
+            if text is not None and text != SUCCESS_ANALYSIS_STARTED:
+                self.results += 1
+        return types.Message.de_json({
+            'message_id': self.calls, 'date': 0,
+            'chat': {'id': 0, 'type': 'private'}
+        })
+
+    def send_message(self, chat_id, text=None, **kwargs):
+        return self._call(text)
+
+    def delete_message(self, *args, **kwargs):
+        return self._call()
+
+    def edit_message_text(self, text=None, **kwargs):
+        return self._call(text)
+
+    def send_chat_action(self, *args, **kwargs):
+        return self._call()
+
+
+class FakeAsyncBot(AsyncTeleBot):
+    """AsyncTeleBot whose API calls await a fixed round trip"""
+
+    def __init__(self, rtt):
+        super().__init__(TOKEN)
+        self.rtt = rtt
+        self.calls = 0
+        self.results = 0
+
+    async def _call(self, text=None):
+        await asyncio.sleep(self.rtt)
+        self.calls += 1
+        if text is not None and text != SUCCESS_ANALYSIS_STARTED:
+            self.results += 1
+        return types.Message.de_json({
+            'message_id': self.calls, 'date': 0,
+            'chat': {'id': 0, 'type': 'private'}
+        })
+
+    async def send_message(self, chat_id, text=None, **kwargs):
+        return await self._call(text)
+
+    async def delete_message(self, *args, **kwargs):
+        return await self._call()
+
+    async def edit_message_text(self, text=None, **kwargs):
+        return await self._call(text)
+
+    async def send_chat_action(self, *args, **kwargs):
+        return await self._call()
+
+
+def bench_sync(updates, rtt):
+    """Dispatch updates through the default threaded telebot worker pool"""
+    bot = FakeSyncBot(rtt)
+    outbox = ThreadedOutbox(bot, **UNLIMITED).start()
+    setup_handlers(bot, outbox=outbox)
+    start = time.perf_counter()
+    bot.process_new_updates(updates)
+    while bot.results < len(updates):
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    bot.worker_pool.close()
+    outbox.stop()
+    return elapsed, bot.calls
+
+
+def bench_async(updates, rtt):
+    """Dispatch updates through AsyncTeleBot"""
+    bot = FakeAsyncBot(rtt)
+    outbox = AsyncOutbox(bot, **UNLIMITED)
+    analyzer = setup_async_handlers(bot, outbox=outbox)
+
+    async def run():
+        start = time.perf_counter()
+        await bot.process_new_updates(updates)
+        while bot.results < len(updates):
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        await outbox.stop()
+        return elapsed, bot.calls
+
+    try:
+        return asyncio.run(run())
+    finally:
+        analyzer.shutdown()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+    updates = make_updates(count)
+
+    sync_time, sync_calls = bench_sync(updates, rtt)
+    sync_per_handler = api_calls_per_request()
+    metrics.reset()
+    async_time, async_calls = bench_async(updates, rtt)
+    async_per_handler = api_calls_per_request()
+
+    print(f"updates: {count}, simulated RTT: {rtt * 1000:.0f} ms")
+    print(f"telebot polling: {count / sync_time:10.1f} updates/s ({sync_time:.2f} s, "
+          f"{sync_calls / count:.2f} API calls/update)")
+    print(f"asyncio:         {count / async_time:10.1f} updates/s ({async_time:.2f} s, "
+          f"{async_calls / count:.2f} API calls/update)")
+    print(f"speedup:         {sync_time / async_time:10.1f}x")
+    print("API calls per request by handler (polling / asyncio):")
+    for handler in sorted(sync_per_handler):
+        print(f"  {handler:10s} {sync_per_handler[handler]:.2f} / {async_per_handler.get(handler, 0):.2f}")
+
+
+if __name__ == "__main__":
+    main()
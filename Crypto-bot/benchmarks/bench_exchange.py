@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark: market data fetch throughput against the local stub exchange
+
+Backfills every configured pair x timeframe through ExchangeClient at
+several concurrency limits and reports requests/s and latency percentiles.
+
+Usage: python benchmarks/bench_exchange.py [candles] [latency_ms]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market.candles import CandleStore
+from market.exchange import ExchangeClient, MarketDataService
+from market.indicators import IndicatorEngine
+from market.stub_exchange import StubExchange
+
+logging.getLogger('crypto_bot').setLevel(logging.WARNING)
+
+
+async def run(candles, latency):
+    stub = StubExchange(latency=latency)
+    url = await stub.start()
+    try:
+        for concurrency in (1, 8, 32):
+            store = CandleStore(capacity=candles)
+            client = ExchangeClient(url, max_concurrency=concurrency)
+            service = MarketDataService(client, store, IndicatorEngine(store))
+            async with client:
+                start = time.perf_counter()
+                await service.backfill(candles)
+                elapsed = time.perf_counter() - start
+                start = time.perf_counter()
+                await client.fetch_tickers(store.symbols)
+                ticker_time = time.perf_counter() - start
+            requests = client.stats['requests']
+            print(f"concurrency {concurrency:3d}: {requests} requests in {elapsed:.2f} s "
+                  f"({requests / elapsed:.0f} req/s), latency {client.latency_percentiles()}, "
+                  f"batched tickers {ticker_time * 1000:.1f} ms")
+    finally:
+        await stub.stop()
+
+
+def main():
+    candles = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    print(f"backfill of {candles} candles per series, stub latency {latency * 1000:.0f} ms")
+    asyncio.run(run(candles, latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serving /idea from the pre-rendered pool vs rendering on demand
+
+Backfills the candle store and indicator engine with synthetic candles,
+then times issuing ideas to chats: rendered on demand (what /idea and the
+"new idea" button did), popped from a filled IdeaPool, and from a pool
+whose candle just closed (every idea stale, so it falls back). Storage is
+disabled, so only the handler-side work is measured.
+
+Usage: python benchmarks/bench_idea_pool.py [requests] [candles]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES
+from market.candles import CandleStore, TIMEFRAME_SECONDS
+from market.indicators import IndicatorEngine
+from bot.storage import BotStorage
+from bot.trading_analyzer import TradingAnalyzer
+from bot.idea_pool import IdeaPool
+
+
+def fill_store(store: CandleStore, count: int, rng, now: float):
+    """Random-walk candles ending at the current candle of each series"""
+    for pair in DEFAULT_TRADING_PAIRS:
+        for timeframe in TIMEFRAMES:
+            step = TIMEFRAME_SECONDS[timeframe]
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+            spread = rng.random(count) * 0.01
+            times = (now // step - np.arange(count)[::-1]) * step
+            store.ingest(pair, timeframe, np.column_stack([
+                times, np.roll(close, 1), close * (1 + spread), close * (1 - spread), close, rng.random(count) * 1000
+            ]))
+
+
+def timed(take, requests: int) -> np.ndarray:
+    latencies = np.empty(requests)
+    for i in range(requests):
+        start = time.perf_counter()
+        take(i)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1e6
+
+
+def report(name: str, latencies: np.ndarray):
+    print(f"  {name:34s} p50 {np.percentile(latencies, 50):8.1f} us, p99 {np.percentile(latencies, 99):8.1f} us")
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    now = time.time()
+    store = CandleStore(capacity=count)
+    fill_store(store, count, np.random.default_rng(3), now)
+    engine = IndicatorEngine(store)
+    engine.backfill()
+    analyzer = TradingAnalyzer(store=store, indicators=engine, storage=BotStorage(''))
+    series = len(DEFAULT_TRADING_PAIRS) * len(TIMEFRAMES)
+    print(f"{requests:,} ideas over {series} series with {count:,} candles each")
+
+    report('on demand', timed(lambda i: analyzer.create_trading_idea(chat_id=i, user_id=i), requests))
+
+    # Pool deep enough for every request, filled ahead as the producer would
+    pool = IdeaPool(analyzer, size=requests // len(analyzer.idea_series()) + 1, store=store)
+    start = time.perf_counter()
+    pool.refill()
+    fill = time.perf_counter() - start
+    filled = len(pool)
+    report('pool hit', timed(lambda i: pool.take(chat_id=i, user_id=i), requests))
+    print(f"  (filling {filled:,} ideas took {fill * 1000:.0f} ms on the producer thread)")
+
+    # A candle closed for every series: pooled ideas are stale
+    pool.refill()
+    pool.clock = lambda: now + 7 * 86400
+    report('pool after candle close (fallback)', timed(lambda i: pool.take(chat_id=i, user_id=i), requests))
+
+
+if __name__ == "__main__":
+    main()
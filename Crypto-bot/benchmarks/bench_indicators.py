@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batch vs incremental indicator computation
+
+Covers every configured pair x timeframe with synthetic candles and compares
+three ways to keep indicators current:
+  - batch backfill of the whole history (vectorized, once at startup)
+  - O(1) incremental update per new candle (live series)
+  - recomputing the full history for every new candle (what we avoid)
+
+Usage: python benchmarks/bench_indicators.py [candles] [live_candles]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES
+from market.indicators import IndicatorState, compute_all, rsi, macd, stochastic, volume_profile
+
+
+def synthetic_candles(count, rng):
+    """Random-walk (6, n) candle window"""
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    spread = rng.random(count) * 0.01
+    return np.vstack([
+        np.arange(count) * 3600.0,
+        np.roll(close, 1),
+        close * (1 + spread),
+        close * (1 - spread),
+        close,
+        rng.random(count) * 1000
+    ])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    live = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = np.random.default_rng(42)
+    series = [synthetic_candles(count + live, rng) for _ in DEFAULT_TRADING_PAIRS for _ in TIMEFRAMES]
+    n_series = len(series)
+
+    # Batch backfill, one series at a time
+    start = time.perf_counter()
+    states = [IndicatorState.from_history(candles[:, :count]) for candles in series]
+    backfill = time.perf_counter() - start
+
+    # Batch over all series at once as a (series, time) matrix
+    matrix = np.stack([candles[:, :count] for candles in series], axis=1)
+    start = time.perf_counter()
+    rsi(matrix[4])
+    macd(matrix[4])
+    stochastic(matrix[2], matrix[3], matrix[4])
+    volume_profile(matrix[4], matrix[5])
+    stacked = time.perf_counter() - start
+
+    # Incremental updates for the live candles
+    start = time.perf_counter()
+    for state, candles in zip(states, series):
+        for candle in candles[:, count:].T:
+            state.update(candle)
+    incremental = time.perf_counter() - start
+    updates = n_series * live
+
+    # Full recompute per new candle, sampled
+    samples = 20
+    start = time.perf_counter()
+    for i in range(samples):
+        compute_all(series[i % n_series][:, i:count + i])
+    recompute = (time.perf_counter() - start) / samples
+
+    print(f"series: {n_series} ({len(DEFAULT_TRADING_PAIRS)} pairs x {len(TIMEFRAMES)} timeframes), "
+          f"{count} candles each")
+    print(f"batch backfill, per series:     {backfill * 1000:8.1f} ms total, "
+          f"{backfill / n_series * 1000:.2f} ms/series")
+    print(f"batch backfill, stacked matrix: {stacked * 1000:8.1f} ms total")
+    print(f"incremental update:             {incremental / updates * 1e6:8.1f} us/candle "
+          f"({updates} candles)")
+    print(f"full recompute per candle:      {recompute * 1e6:8.1f} us/candle")
+    print(f"incremental speedup:            {recompute / (incremental / updates):8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: support/resistance levels over long candle windows
+
+For `pairs` random-walk series, times building the volume profile and
+swing points of a `window`-candle window from scratch (vectorized, and as
+a plain Python loop over candles and bins for a few pairs), then catching
+the state up one closed candle at a time for `closes` candles. The
+incrementally updated states are checked against a rebuild over the final
+window.
+
+Usage: python benchmarks/bench_levels.py [pairs] [window] [closes]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from market.candles import HIGH, LOW, CLOSE, VOLUME
+from market.levels import LevelState, SWING
+
+
+def random_walk(count: int, rng) -> np.ndarray:
+    """(6, count) hourly candles"""
+    close = rng.uniform(1, 1000) * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.random(count) * 0.005)
+    low = np.minimum(open_, close) * (1 - rng.random(count) * 0.005)
+    return np.vstack([np.arange(count) * 3600.0, open_, high, low, close, rng.random(count) * 1000])
+
+
+def python_profile(candles: np.ndarray, step: float) -> tuple:
+    """Volume per bin and swing touches with a loop per candle and bin"""
+    volume, touches = {}, {}
+    for low, high, quantity in zip(candles[LOW].tolist(), candles[HIGH].tolist(), candles[VOLUME].tolist()):
+        first, last = int(low // step), int(high // step)
+        for index in range(first, last + 1):
+            overlap = min(high, (index + 1) * step) - max(low, index * step)
+            volume[index] = volume.get(index, 0.0) + quantity * overlap / (high - low)
+    highs, lows = candles[HIGH].tolist(), candles[LOW].tolist()
+    for i in range(SWING, len(highs) - SWING):
+        for values, pick in ((highs, max), (lows, min)):
+            if values[i] == pick(values[i - SWING:i + SWING + 1]):
+                index = int(values[i] // step)
+                touches[index] = touches.get(index, 0) + 1
+    return volume, touches
+
+
+def same_state(state: LevelState, reference: LevelState) -> float:
+    """Largest volume difference between two states with the same bins"""
+    volume = dict(zip(range(state.origin, state.origin + len(state.volume)), state.volume))
+    expected = dict(zip(range(reference.origin, reference.origin + len(reference.volume)), reference.volume))
+    if list(state.swings) != list(reference.swings):
+        return np.inf
+    return max(abs(volume.get(i, 0.0) - expected.get(i, 0.0)) for i in set(volume) | set(expected))
+
+
+def prices(state: LevelState, candles: np.ndarray) -> list:
+    levels = state.compute(candles[CLOSE, -1])
+    return [level['price'] for level in levels['support'] + levels['resistance']]
+
+
+def describe(levels: list) -> str:
+    return ', '.join(f"{level['price']:.2f} ({level['touches']} touches)" for level in levels) or 'none'
+
+
+def main():
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    closes = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    rng = np.random.default_rng(7)
+    series = [random_walk(window + closes, rng) for _ in range(pairs)]
+    print(f"{pairs} pairs, {window:,}-candle window, {closes} closes each")
+
+    started = time.perf_counter()
+    states = [LevelState.build(candles[:, :window], window) for candles in series]
+    build = (time.perf_counter() - started) / pairs
+    bins = np.mean([len(state.volume) for state in states])
+    print(f"  build (vectorized):  {build * 1e3:8.2f} ms per pair ({bins:,.0f} bins)")
+
+    sample = series[:min(3, pairs)]
+    started = time.perf_counter()
+    for candles, state in zip(sample, states):
+        python_profile(candles[:, :window], state.step)
+    loop = (time.perf_counter() - started) / len(sample)
+    print(f"  build (Python loop): {loop * 1e3:8.2f} ms per pair ({loop / build:,.0f}x slower)")
+
+    updates, computes = [], []
+    for candles, state in zip(series, states):
+        for end in range(window + 1, window + closes + 1):
+            closed = candles[:, :end]
+            started = time.perf_counter()
+            state.update(closed)
+            updated = time.perf_counter()
+            state.compute(closed[CLOSE, -1])
+            updates.append(updated - started)
+            computes.append(time.perf_counter() - updated)
+    updates, computes = np.array(updates) * 1e6, np.array(computes) * 1e6
+    print(f"  update per close:    p50 {np.percentile(updates, 50):7.1f} us, p99 {np.percentile(updates, 99):7.1f} us")
+    print(f"  levels per close:    p50 {np.percentile(computes, 50):7.1f} us, p99 {np.percentile(computes, 99):7.1f} us")
+    per_close = np.median(updates) + np.median(computes)
+    print(f"  incremental vs rebuilding on every close: {build * 1e6 / per_close:,.0f}x faster")
+
+    worst, different = 0.0, 0
+    for candles, state in zip(series, states):
+        reference = LevelState(state.step, window)
+        reference._add(candles[:, -window:])
+        reference._swings(candles, candles.shape[1] - window, candles.shape[1])
+        worst = max(worst, same_state(state, reference))
+        if prices(state, candles) != prices(reference, candles):
+            different += 1
+    print(f"  incremental vs rebuilt: max volume difference {worst:.2e}, {different} pairs with different levels")
+    levels = states[0].compute(series[0][CLOSE, -1])
+    print(f"  pair 0 at {series[0][CLOSE, -1]:.2f}: support {describe(levels['support'])}; "
+          f"resistance {describe(levels['resistance'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Load test: the real bot process against the fake Bot API server
+
+Starts benchmarks/fake_bot_api.py in-process, runs main.py as a child
+process pointed at it (TELEGRAM_API_URL) and feeds getUpdates a mix of
+/idea, /analyze, chart photos, free text and new_idea callbacks at a fixed
+rate, each from its own chat. An update counts as answered when the fake
+API accepts the first message for its chat that is not the "processing"
+placeholder. Reports throughput, p50/p99 latency from the update arriving
+at the API to the answer, Bot API calls per update and the 429s injected.
+Outbox rate limits are lifted unless `limits` is given, so the numbers
+show the bot's own overhead. `sharded` runs one worker process per CPU
+(at least two) behind the receiving process. The last line is JSON for
+comparing runs.
+
+Usage: python benchmarks/bench_load.py [updates] [rate] [polling|async|sharded] [latency_ms] [throttle_percent] [limits]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from fake_bot_api import FakeBotApi
+from bot.messages import SUCCESS_ANALYSIS_STARTED, ERROR_IMAGE_QUEUE_FULL
+
+TOKEN = '123456:LOADTEST'
+# Relative frequency of each kind of update
+MIX = (('idea', 3), ('analyze', 2), ('text', 3), ('photo', 1), ('callback', 1))
+# Distinct chart images; repeats hit the chart analysis cache
+CHARTS = 8
+UNLIMITED = {
+    'OUTBOX_GLOBAL_RATE': '1e9', 'OUTBOX_CHAT_RATE': '1e9',
+    'OUTBOX_CHAT_BURST': '1e9', 'OUTBOX_GROUP_RATE': '1e9', 'OUTBOX_WORKERS': '64'
+}
+
+
+def make_update(kind: str, n: int) -> dict:
+    """Update of the given kind from chat 100000 + n"""
+    chat_id = 100_000 + n
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Load', 'language_code': 'ru'}
+    message = {'message_id': n + 1, 'from': user, 'chat': {'id': chat_id, 'type': 'private'}, 'date': int(time.time())}
+    if kind == 'callback':
+        bot_message = dict(message, **{'from': {'id': 123456, 'is_bot': True, 'first_name': 'FakeBot'}, 'text': 'idea'})
+        return {'callback_query': {'id': str(n), 'from': user, 'chat_instance': str(chat_id),
+                                   'message': bot_message, 'data': 'new_idea'}}
+    if kind == 'photo':
+        file_id = f"chart{n % CHARTS}"
+        message['photo'] = [
+            {'file_id': f"{file_id}_s", 'file_unique_id': f"{file_id}_s", 'width': 320, 'height': 192, 'file_size': 9000},
+            {'file_id': file_id, 'file_unique_id': file_id, 'width': 1000, 'height': 600, 'file_size': 40000}
+        ]
+        return {'message': message}
+    text = {'idea': '/idea', 'analyze': '/analyze', 'text': 'Думаю покупать BTC на откате к поддержке, RSI внизу'}[kind]
+    message['text'] = text
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'message': message}
+
+
+def schedule(count: int) -> list:
+    """Kinds of `count` updates, interleaved according to MIX"""
+    cycle = [kind for kind, weight in MIX for _ in range(weight)]
+    order = np.random.default_rng(1).permutation(len(cycle) * (count // len(cycle) + 1))
+    return [cycle[i % len(cycle)] for i in order[:count]]
+
+
+async def run(count: int, rate: float, mode: str, latency: float, throttle_percent: float, limits: bool):
+    pushed = {}
+    answered = {}
+    kinds = {}
+    errors = 0
+
+    def on_call(method, params, now):
+        nonlocal errors
+        if method not in ('sendMessage', 'editMessageText'):
+            return
+        chat_id = int(params.get('chat_id') or 0)
+        text = params.get('text', '')
+        if chat_id in pushed and chat_id not in answered and text != SUCCESS_ANALYSIS_STARTED:
+            answered[chat_id] = now - pushed[chat_id]
+            errors += text.startswith('❌') or text == ERROR_IMAGE_QUEUE_FULL
+
+    api = FakeBotApi(latency, throttle_percent=throttle_percent, on_call=on_call)
+    url = await api.start()
+    env = dict(os.environ, BOT_TOKEN=TOKEN, TELEGRAM_API_URL=url, BOT_MODE=mode, UPDATE_SOURCE='polling',
+               SIGNALS_ENABLED='0', MARKET_DATA_REFRESH='0', LOG_LEVEL='ERROR', METRICS_PORT='0')
+    if mode == 'sharded':
+        env.update(BOT_MODE='polling', WORKER_PROCESSES=str(max(2, os.cpu_count() or 1)))
+    if not limits:
+        env.update(UNLIMITED)
+    bot = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, 'main.py'), cwd=ROOT, env=env)
+    try:
+        while not api.polls:
+            if bot.returncode is not None:
+                raise RuntimeError(f"bot exited with code {bot.returncode}")
+            await asyncio.sleep(0.05)
+
+        # Open loop: updates arrive at `rate` per second whether or not the bot keeps up
+        start = time.perf_counter()
+        for n, kind in enumerate(schedule(count)):
+            due = start + n / rate if rate else start
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = make_update(kind, n)
+            chat_id = 100_000 + n
+            kinds[chat_id] = kind
+            pushed[chat_id] = time.perf_counter()
+            api.push(update)
+        sent = time.perf_counter() - start
+
+        deadline = time.perf_counter() + 60 + 5 * (api.retry_after if throttle_percent else 0)
+        while len(answered) < count and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        # Trailing calls of answered updates (placeholder deletes, retries)
+        await asyncio.sleep(max(0.5, latency * 4))
+    finally:
+        bot.terminate()
+        await bot.wait()
+        await api.stop()
+
+    latencies = np.array(list(answered.values())) * 1000
+    calls = sum(value for method, value in api.calls.items() if method not in ('downloadFile', 'getMe'))
+    print(f"{count:,} updates at {rate:g}/s ({mode}), fake API latency {latency * 1000:.0f} ms, "
+          f"{throttle_percent:g}% answered 429, outbox limits {'on' if limits else 'lifted'}")
+    print(f"  answered:   {len(answered):,} of {count:,} ({errors} errors or rejections), fed in {sent:.2f} s")
+    print(f"  throughput: {len(answered) / elapsed:8.1f} updates/s")
+    if len(latencies):
+        print(f"  latency:    p50 {np.percentile(latencies, 50):7.1f} ms, p99 {np.percentile(latencies, 99):7.1f} ms, "
+              f"max {latencies.max():7.1f} ms")
+    for kind, _ in MIX:
+        chosen = np.array([answered[chat] for chat in answered if kinds[chat] == kind]) * 1000
+        if len(chosen):
+            print(f"    {kind:9s} p50 {np.percentile(chosen, 50):7.1f} ms, p99 {np.percentile(chosen, 99):7.1f} ms")
+    print(f"  API calls:  {calls / count:8.2f} per update "
+          f"({', '.join(f'{method} {value}' for method, value in sorted(api.calls.items()))}), "
+          f"{api.throttled} answered 429")
+    print(json.dumps({
+        'updates': count, 'rate': rate, 'mode': mode, 'answered': len(answered), 'errors': errors,
+        'throughput': round(len(answered) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)), 1) if len(latencies) else None,
+        'api_calls_per_update': round(calls / count, 3), 'throttled': api.throttled
+    }))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'polling'
+    latency = (float(sys.argv[4]) if len(sys.argv) > 4 else 20) / 1000
+    throttle_percent = float(sys.argv[5]) if len(sys.argv) > 5 else 0
+    limits = len(sys.argv) > 6 and sys.argv[6] == 'limits'
+    asyncio.run(run(count, rate, mode, latency, throttle_percent, limits))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: logging overhead per request on the handler thread
+
+Each simulated request logs what a text handler logs (the request with
+the first 50 characters of the message, then the reply). The baseline is
+the previous logger: a StreamHandler formatting and writing f-strings on
+the calling thread. It is compared with the queue mode (the handler only
+enqueues the record), queue mode with sampling and JSON records. Output
+goes to a fast sink and to a slow one that stalls every write, like a
+stdout pipe whose reader falls behind.
+
+Usage: python benchmarks/bench_logging.py [requests] [stall_us]
+"""
+
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logger import configure, stop_listener, REQUEST, REPLY
+from utils.metrics import metrics
+
+TEXT = "Что думаете о BTC? Пробой 70000 выглядит убедительно, но объёмы падают уже третий день подряд"
+
+
+class SlowSink(io.StringIO):
+    """Stream whose writes take `stall` seconds"""
+
+    def __init__(self, stall: float):
+        super().__init__()
+        self.stall = stall
+
+    def write(self, text: str) -> int:
+        time.sleep(self.stall)
+        return super().write(text)
+
+
+def eager(logger: logging.Logger, user_id: int):
+    """Today's handler logs: f-strings formatted before the call"""
+    logger.info(f"User {user_id} sent text for analysis: {TEXT[:50]}...")
+    logger.info(f"Text analysis sent to user {user_id}")
+
+
+def lazy(logger: logging.Logger, user_id: int):
+    """Handler logs with arguments formatted by the handler writing them"""
+    logger.info("User %s sent text for analysis: %.50s...", user_id, TEXT, extra=REQUEST)
+    logger.info("Text analysis sent to user %s", user_id, extra=REPLY)
+
+
+def run(requests: int, stall: float, mode: str, fmt: str, sampling: str, log) -> tuple:
+    """Returns (handler microseconds per request, seconds until the output is written)"""
+    logger = logging.getLogger(f"bench_logging.{mode}.{fmt}.{sampling}.{stall}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    sink = SlowSink(stall) if stall else io.StringIO()
+    listener = configure(logger, stream=sink, mode=mode, fmt=fmt, queue_size=requests * 2, sampling=sampling)
+    start = time.perf_counter()
+    for user_id in range(requests):
+        log(logger, user_id)
+    handler = time.perf_counter() - start
+    if listener is not None:
+        stop_listener(listener)
+    drained = time.perf_counter() - start
+    configure(logger, stream=io.StringIO(), mode='sync')
+    return handler / requests * 1e6, drained
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    stall = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1e6
+    cases = (
+        ('sync, f-strings (before)', 'sync', 'text', '', eager),
+        ('sync, lazy', 'sync', 'text', '', lazy),
+        ('queue, lazy', 'queue', 'text', '', lazy),
+        ('queue, lazy, sampled 10%', 'queue', 'text', 'request=0.1,reply=0.1', lazy),
+        ('queue, lazy, json', 'queue', 'json', '', lazy),
+    )
+    for sink, delay in (('fast sink', 0), (f"slow sink ({stall * 1e6:.0f} us per write)", stall)):
+        # The slow sink needs fewer requests for the synchronous cases to finish
+        count = requests if not delay else max(requests // 10, 1)
+        print(f"{count:,} requests, 2 records each, {sink}")
+        for name, mode, fmt, sampling, log in cases:
+            per_request, drained = run(count, delay, mode, fmt, sampling, log)
+            print(f"  {name:26s} {per_request:8.2f} us per request on the handler thread, "
+                  f"all written after {drained:6.2f} s")
+    print(f"dropped records: {metrics.get('log_dropped_total'):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: scanning the whole universe of pairs and timeframes
+
+Fills a candle store with random-walk candles for `symbols` synthetic pairs
+(plus the configured ones) on every timeframe, then times full scans and
+compares the scores against scoring each series on its own. The RSI and
+MACD direction of the best setups are checked against compute_all() over
+the full history.
+
+Usage: python benchmarks/bench_scan.py [symbols] [candles] [scans]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES
+from market.candles import CandleStore, TIMEFRAME_SECONDS
+from market.indicators import compute_all
+from market.scanner import MarketScanner
+
+
+def fill_store(store: CandleStore, count: int, rng, now: float):
+    """Random-walk candles ending at the current candle of each series"""
+    for symbol in store.symbols:
+        for timeframe in TIMEFRAMES:
+            step = TIMEFRAME_SECONDS[timeframe]
+            close = rng.uniform(0.01, 1000) * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+            spread = rng.random(count) * 0.01
+            times = (now // step - np.arange(count)[::-1]) * step
+            store.series(symbol, timeframe).extend(np.column_stack([
+                times, np.roll(close, 1), close * (1 + spread), close * (1 - spread), close, rng.random(count) * 1000
+            ]))
+
+
+def main():
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    scans = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    now = time.time()
+    pairs = DEFAULT_TRADING_PAIRS + [f"SYM{i}/USDT" for i in range(symbols)]
+    store = CandleStore(pairs, capacity=count)
+    fill_store(store, count, np.random.default_rng(11), now)
+    scanner = MarketScanner(store)
+    print(f"{len(pairs):,} pairs x {len(TIMEFRAMES)} timeframes, {count:,} candles each, "
+          f"lookback {scanner.lookback}")
+
+    timings = []
+    for _ in range(scans):
+        result = scanner.scan(now)
+        timings.append(result.seconds)
+    timings = np.array(timings) * 1000
+    print(f"  full scan:    p50 {np.percentile(timings, 50):7.1f} ms, max {timings.max():7.1f} ms "
+          f"({len(result):,} series)")
+
+    # The same scores one series at a time
+    timeframe = TIMEFRAMES[0]
+    sample = pairs[:200]
+    start = time.perf_counter()
+    single = [MarketScanner.score(scanner.stack(timeframe, now, [symbol])[1])['score'][0] for symbol in sample]
+    elapsed = time.perf_counter() - start
+    per_series = elapsed / len(sample)
+    print(f"  per series:   {per_series * 1e3:7.2f} ms, "
+          f"{per_series * len(result):,.1f} s for the universe one series at a time")
+    batch = {setup['pair']: setup['score'] for setup in result.top(timeframe=timeframe)}
+    differences = [abs(batch.get(symbol, 0.0) - score) for symbol, score in zip(sample, single)]
+    print(f"  batch vs per series: max score difference {max(differences):.2e}")
+
+    mismatches = 0
+    for setup in result.top(20):
+        values = compute_all(store.closed_window(setup['pair'], setup['timeframe'], now))
+        side = 1 if values['macd_hist'] >= 0 else -1
+        if abs(values['rsi'] - setup['rsi']) > 1e-3 or side != setup['side']:
+            mismatches += 1
+    print(f"  top 20 vs compute_all over the full history: {mismatches} mismatches")
+    for setup in result.top(5):
+        print(f"    {setup['pair']:12s} {setup['timeframe']:3s} {setup['trade_type']:5s} score {setup['score']:.2f} "
+              f"strength {setup['strength']:.2f} R/R {setup['rr']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: signal fan-out to subscribers through a local fake Bot API
+
+Subscribes N chats to one series, publishes a signal with
+SignalBroadcaster and delivers it through AsyncTeleBot + AsyncOutbox to an
+aiohttp server that mimics sendMessage (optionally answering 403 for a
+share of chats, as for users who blocked the bot). Reports the time to
+render and queue the signal, the time until every message is delivered
+with rate limits lifted, and how long the same fan-out takes at the
+configured OUTBOX_GLOBAL_RATE. Rendering once is compared with rendering
+the idea per subscriber.
+
+Usage: python benchmarks/bench_signals.py [subscribers] [rtt_ms] [blocked_percent]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from bot.outbox import AsyncOutbox
+from bot.signals import SignalBroadcaster
+from bot.subscriptions import SubscriptionRegistry
+from bot.trading_analyzer import TradingAnalyzer
+from config import OUTBOX_GLOBAL_RATE
+
+TOKEN = '123456:BENCHMARK'
+PAIR, TIMEFRAME = 'BTC/USDT', '4h'
+logging.getLogger('crypto_bot').setLevel(logging.CRITICAL)
+
+
+class FakeBotApi:
+    """sendMessage endpoint with a fixed round trip; chats % blocked_every == 0 get 403"""
+
+    def __init__(self, rtt: float, blocked_every: int = 0):
+        self.rtt = rtt
+        self.blocked_every = blocked_every
+        self.sent = 0
+        self.message_id = 0
+
+    async def send_message(self, request: web.Request):
+        data = await request.post()
+        await asyncio.sleep(self.rtt)
+        chat_id = int(data['chat_id'])
+        if self.blocked_every and chat_id % self.blocked_every == 0:
+            return web.json_response({'ok': False, 'error_code': 403,
+                                      'description': 'Forbidden: bot was blocked by the user'}, status=403)
+        self.sent += 1
+        self.message_id += 1
+        return web.json_response({'ok': True, 'result': {
+            'message_id': self.message_id, 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}, 'text': data.get('text', '')
+        }})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post('/bot{token}/sendMessage', self.send_message)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def run(subscribers, rtt, blocked_percent):
+    blocked_every = round(100 / blocked_percent) if blocked_percent else 0
+    api = FakeBotApi(rtt, blocked_every)
+    url = await api.start()
+    asyncio_helper.API_URL = url + '/bot{0}/{1}'
+    asyncio_helper.REQUEST_LIMIT = 256
+
+    bot = AsyncTeleBot(TOKEN)
+    outbox = AsyncOutbox(bot, global_rate=1e9, chat_rate=1e9, chat_burst=1e9, workers=256).start()
+    registry = SubscriptionRegistry(path=None)
+    for chat_id in range(1, subscribers + 1):
+        registry.subscribe(chat_id, PAIR, TIMEFRAME)
+    analyzer = TradingAnalyzer()
+    broadcaster = SignalBroadcaster(outbox, registry, analyzer)
+
+    start = time.perf_counter()
+    done = broadcaster.publish(PAIR, TIMEFRAME)
+    queued = time.perf_counter() - start
+    outcome = await asyncio.wrap_future(done)
+    delivered = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        analyzer.generate_trading_idea(PAIR, TIMEFRAME)
+    per_user_render = (time.perf_counter() - start) / 1000 * subscribers
+
+    print(f"{subscribers} subscribers, fake API round trip {rtt * 1000:.0f} ms")
+    print(f"  render once + queue:       {queued * 1000:8.1f} ms "
+          f"(rendering per subscriber would add {per_user_render * 1000:.0f} ms)")
+    print(f"  delivered (no rate limit): {delivered:8.2f} s ({subscribers / delivered:,.0f} msg/s), "
+          f"{outcome['sent']} sent, {outcome['failed']} blocked")
+    print(f"  subscribers left:          {len(registry)} (blocked chats unsubscribed)")
+    print(f"  at OUTBOX_GLOBAL_RATE={OUTBOX_GLOBAL_RATE:g}/s:   {subscribers / OUTBOX_GLOBAL_RATE / 60:8.1f} min")
+
+    await outbox.stop()
+    await asyncio_helper.session_manager.session.close()
+    await api.stop()
+
+
+def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    blocked_percent = float(sys.argv[3]) if len(sys.argv) > 3 else 1
+    asyncio.run(run(subscribers, rtt, blocked_percent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sustained write throughput of the bot database
+
+Handler threads simulate requests that each remember the user and issue an
+idea (one in ten also subscribes). BotStorage queues the writes and commits
+them in batches from its writer thread; the baseline commits every write
+on the handler thread, one transaction each. Reports requests/s, the time
+a handler spends on storage per request, rows committed per second and the
+latency of the indexed lookups on the resulting database.
+
+Usage: python benchmarks/bench_storage.py [requests] [threads] [directory]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES
+from bot.storage import BotStorage, connect, migrate, UPSERT_USER, INSERT_IDEA, INSERT_SUBSCRIPTION
+from utils.metrics import metrics
+
+USERS = 10_000
+
+
+def request_writes(n: int, idea_id: int):
+    """Statements of one simulated request"""
+    now = time.time()
+    user = n % USERS
+    pair = DEFAULT_TRADING_PAIRS[n % len(DEFAULT_TRADING_PAIRS)]
+    timeframe = TIMEFRAMES[n % len(TIMEFRAMES)]
+    writes = [
+        (UPSERT_USER, (user, user, f"user{user}", 'ru', now, now)),
+        (INSERT_IDEA, (idea_id, user, user, pair, timeframe, 1, 100.0, 102.0, 105.0, 108.0, 97.0, 'medium', now, f"LONG {pair} {timeframe}"))
+    ]
+    if n % 10 == 0:
+        writes.append((INSERT_SUBSCRIPTION, (user, pair, timeframe, now)))
+    return writes
+
+
+def run_threads(threads: int, requests: int, handle):
+    """Call handle(n) for n in range(requests) spread over threads; returns seconds"""
+    def worker(offset):
+        for n in range(offset, requests, threads):
+            handle(n)
+    pool = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def batched(path: str, requests: int, threads: int):
+    """Writes queued by handlers and group-committed; returns (elapsed, handler seconds, commits)"""
+    storage = BotStorage(path).start()
+
+    def handle(n):
+        for sql, params in request_writes(n, storage.next_idea_id()):
+            storage._write(sql, params)
+
+    start = time.perf_counter()
+    handler_time = run_threads(threads, requests, handle)
+    storage.flush()
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return elapsed, handler_time, metrics.get('storage_commits_total')
+
+
+def unbatched(path: str, requests: int, threads: int):
+    """Every write committed by the handler thread itself; returns seconds"""
+    migrate(connect(path))
+    local = threading.local()
+    ids = iter(range(1, requests + 1))
+    lock = threading.Lock()
+
+    def handle(n):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = connect(path)
+        with lock:
+            idea_id = next(ids)
+        for sql, params in request_writes(n, idea_id):
+            connection.execute(sql, params)
+
+    return run_threads(threads, requests, handle)
+
+
+def lookups(path: str):
+    """Mean latency of the indexed queries in microseconds"""
+    storage = BotStorage(path)
+    timings = {}
+    for name, query in (
+        ('ideas of a user', lambda i: storage.user_ideas(i % USERS, 10)),
+        ('ideas of a pair', lambda i: storage.pair_ideas(DEFAULT_TRADING_PAIRS[i % 8], '4h', 10)),
+        ('open ideas of a pair', lambda i: storage._query(
+            "SELECT idea_id FROM ideas WHERE status = 'open' AND pair = ? LIMIT 100", (DEFAULT_TRADING_PAIRS[i % 8],))),
+        ('user by id', lambda i: storage.user(i % USERS)),
+    ):
+        start = time.perf_counter()
+        for i in range(1000):
+            query(i)
+        timings[name] = (time.perf_counter() - start) / 1000 * 1e6
+    storage.close()
+    return timings
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    directory = sys.argv[3] if len(sys.argv) > 3 else tempfile.mkdtemp(prefix='bench_storage')
+    os.makedirs(directory, exist_ok=True)
+    rows = sum(len(request_writes(n, 0)) for n in range(requests))
+
+    path = os.path.join(directory, 'batched.db')
+    elapsed, handler_time, commits = batched(path, requests, threads)
+    print(f"{requests:,} requests ({rows:,} rows) from {threads} handler threads")
+    print(f"  batched:   {requests / elapsed:10,.0f} req/s sustained, {rows / elapsed:10,.0f} rows/s, "
+          f"{handler_time / requests * threads * 1e6:6.1f} us of handler time per request, "
+          f"{commits:,.0f} commits ({rows / max(commits, 1):,.0f} rows each)")
+
+    baseline_requests = min(requests, 10_000)
+    elapsed = unbatched(os.path.join(directory, 'unbatched.db'), baseline_requests, threads)
+    baseline_rows = sum(len(request_writes(n, 0)) for n in range(baseline_requests))
+    print(f"  unbatched: {baseline_requests / elapsed:10,.0f} req/s sustained, {baseline_rows / elapsed:10,.0f} rows/s, "
+          f"{elapsed / baseline_requests * threads * 1e6:6.1f} us of handler time per request "
+          f"(one commit per row, {baseline_requests:,} requests)")
+
+    for name, latency in lookups(path).items():
+        print(f"  {name + ':':22s} {latency:8.1f} us")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
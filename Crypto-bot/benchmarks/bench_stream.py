@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: websocket market feed ingestion against the stub exchange
+
+Runs StreamingMarketDataService against the stub's trade and 1h kline
+streams with the stub clock `speed` times faster than real time, drops the
+connection halfway (refusing reconnects for a second, so hours are missed)
+and checks afterwards that the store holds every 1h candle exactly as the
+exchange has it and that 4h/1d/1w candles equal the roll-up of their
+hours. Then times handling single trade and kline messages.
+
+Usage: python benchmarks/bench_stream.py [hours] [speed] [messages]
+"""
+
+import os
+import sys
+import time
+import json
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES
+from market.candles import CandleStore, TIMEFRAME_SECONDS, TIME, OPEN, HIGH, LOW, CLOSE, VOLUME
+from market.exchange import ExchangeClient, exchange_symbol
+from market.indicators import IndicatorEngine
+from market.stub_exchange import StubExchange, accelerated_clock, synthetic_klines
+from market.stream import StreamingMarketDataService, BASE_TIMEFRAME
+
+logging.getLogger('crypto_bot').setLevel(logging.ERROR)
+
+
+def check(service: StreamingMarketDataService) -> list:
+    """Differences between the store and the exchange, as messages"""
+    problems = []
+    store = service.store
+    step = TIMEFRAME_SECONDS[BASE_TIMEFRAME]
+    for symbol in store.symbols:
+        builder = service.builders[store.registry.id(symbol)]
+        hours = store.series(symbol, BASE_TIMEFRAME).window()
+        # Candles the service has seen close
+        closed = hours[:, hours[TIME] <= builder.closed_time]
+        if np.any(np.diff(hours[TIME]) != step):
+            problems.append(f"{symbol}: missing 1h candles")
+        expected = synthetic_klines(exchange_symbol(symbol), BASE_TIMEFRAME, closed[TIME, 0], closed.shape[1]).T
+        if not np.allclose(closed, expected, rtol=1e-7):
+            problems.append(f"{symbol}: 1h candles differ from the exchange")
+        for timeframe in TIMEFRAMES[1:]:
+            candle = store.series(symbol, timeframe).last()
+            part = hours[:, (hours[TIME] >= candle[TIME]) & (hours[TIME] < candle[TIME] + TIMEFRAME_SECONDS[timeframe])]
+            part = part[:, part[TIME] <= builder.closed_time]
+            if not part.shape[1]:
+                continue
+            rolled = [candle[TIME], part[OPEN, 0], part[HIGH].max(), part[LOW].min(), part[CLOSE, -1], part[VOLUME].sum()]
+            if not np.allclose(candle, rolled, rtol=1e-7):
+                problems.append(f"{symbol} {timeframe}: candle is not the roll-up of its hours")
+    return problems
+
+
+async def replay(hours: float, speed: float):
+    clock = accelerated_clock(speed)
+    stub = StubExchange(now=clock)
+    url = await stub.start()
+    store = CandleStore(capacity=500)
+    closes = {timeframe: 0 for timeframe in TIMEFRAMES}
+    service = StreamingMarketDataService(ExchangeClient(url), store, IndicatorEngine(store),
+                                         url=url.replace('http', 'ws', 1), backoff=0.05)
+    on_close = service._on_close
+
+    def counted(symbol, timeframe, candle):
+        closes[timeframe] += 1
+        on_close(symbol, timeframe, candle)
+
+    service._on_close = counted
+    task = asyncio.create_task(service.run())
+    try:
+        duration = hours * 3600 / speed
+        start = time.perf_counter()
+        await asyncio.sleep(duration / 2)
+        await stub.drop_streams(refuse=1.0)
+        await asyncio.sleep(duration / 2)
+        elapsed = time.perf_counter() - start
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await stub.stop()
+
+    stats = service.stats
+    print(f"{len(store.symbols)} pairs, {hours:g} h of trading at {speed:g}x in {elapsed:.1f} s, "
+          f"one dropped connection")
+    print(f"  messages:  {stats['messages']:,} ({stats['trades']:,} trades, {stats['klines']:,} klines), "
+          f"{stats['messages'] / elapsed:,.0f}/s")
+    print(f"  closed:    {', '.join(f'{timeframe} {count}' for timeframe, count in closes.items())}")
+    print(f"  connects:  {stats['connects']}, {stats['gap_candles']} 1h candles fetched over REST")
+    problems = check(service)
+    print(f"  store:     {'consistent with the exchange' if not problems else '; '.join(problems)}")
+
+
+def handling(messages: int):
+    """Per-message cost of handle() including JSON decoding"""
+    store = CandleStore(capacity=500)
+    service = StreamingMarketDataService(ExchangeClient(), store, IndicatorEngine(store))
+    service.sync_builders()
+    symbol = exchange_symbol(DEFAULT_TRADING_PAIRS[0])
+    step = TIMEFRAME_SECONDS[BASE_TIMEFRAME]
+    start = time.time() // step * step
+    rng = np.random.default_rng(5)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, messages)))
+    highs, lows = np.maximum.accumulate(prices), np.minimum.accumulate(prices)
+    times = start + np.arange(messages) * (step * 0.9 / messages)
+    trades = [json.dumps({'stream': f"{symbol.lower()}@trade", 'data': {
+        'e': 'trade', 's': symbol, 'p': f"{price:.8f}", 'q': '0.01000000', 'T': int(at * 1000)
+    }}) for price, at in zip(prices, times)]
+    klines = [json.dumps({'stream': f"{symbol.lower()}@kline_1h", 'data': {'e': 'kline', 's': symbol, 'k': {
+        't': int(start * 1000), 'i': '1h', 'o': '100', 'h': f"{highs[i]:.8f}",
+        'l': f"{lows[i]:.8f}", 'c': f"{price:.8f}", 'v': f"{i:.8f}", 'x': False
+    }}}) for i, price in enumerate(prices)]
+    for name, batch in (('trade', trades), ('kline', klines)):
+        started = time.perf_counter()
+        for message in batch:
+            service.handle(json.loads(message))
+        elapsed = time.perf_counter() - started
+        print(f"  {name:6s} message: {elapsed / messages * 1e6:6.2f} us ({messages / elapsed:,.0f}/s)")
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 48
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 7200
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    asyncio.run(replay(hours, speed))
+    handling(messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the symbol registry over a full exchange listing
+
+Loads a synthetic listing of `symbols` pairs into a SymbolRegistry, then
+times reloading it with a few pairs listed, halted and delisted, lookups by
+name, exchange name and ID, and finding a series in a candle store by name
+and by ID against the former dict keyed by (symbol, timeframe). Finally
+compares the memory of the metadata columns with a dict per symbol.
+
+Usage: python benchmarks/bench_symbols.py [symbols] [lookups]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import TIMEFRAMES
+from market.candles import CandleStore
+from market.symbols import SymbolRegistry, exchange_symbol, TRADING
+
+
+def listing(pairs: list, statuses: dict = None) -> list:
+    statuses = statuses or {}
+    return [{'pair': pair, 'status': statuses.get(pair, 'TRADING'), 'tick_size': 0.01} for pair in pairs]
+
+
+def per_call(function, values) -> float:
+    """Microseconds per call of function(value)"""
+    started = time.perf_counter()
+    for value in values:
+        function(value)
+    return (time.perf_counter() - started) / len(values) * 1e6
+
+
+def main():
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    pairs = [f"SYM{i}/USDT" for i in range(symbols)]
+    rng = np.random.default_rng(3)
+
+    registry = SymbolRegistry([])
+    started = time.perf_counter()
+    registry.load(listing(pairs))
+    first = time.perf_counter() - started
+    # A day's changes: ten new pairs, ten halted, ten gone
+    changed = pairs[10:] + [f"NEW{i}/USDT" for i in range(10)]
+    started = time.perf_counter()
+    new = registry.load(listing(changed, {pair: 'HALT' for pair in pairs[10:20]}))
+    reload = time.perf_counter() - started
+    print(f"{len(registry):,} symbols")
+    print(f"  load:    first {first * 1e3:6.2f} ms, reload {reload * 1e3:6.2f} ms ({len(new)} new, "
+          f"{int(np.sum(registry.status[:len(registry)] != TRADING))} not trading)")
+
+    names = [pairs[i] for i in rng.integers(0, symbols, lookups)]
+    exchange_names = [exchange_symbol(name) for name in names]
+    ids = [registry.id(name) for name in names]
+    print(f"  id(name)          {per_call(registry.id, names):6.3f} us")
+    print(f"  exchange_id(name) {per_call(registry.exchange_id, exchange_names):6.3f} us")
+    print(f"  name(id)          {per_call(registry.name, ids):6.3f} us")
+    started = time.perf_counter()
+    trading = registry.trading()
+    print(f"  trading():        {(time.perf_counter() - started) * 1e6:6.1f} us for {len(trading):,} IDs")
+
+    store = CandleStore(pairs, capacity=1, registry=registry)
+    series = {(symbol, timeframe): store.series(symbol, timeframe) for symbol in pairs for timeframe in TIMEFRAMES}
+    timeframe = TIMEFRAMES[0]
+    print(f"  series by (name, timeframe) dict  {per_call(lambda name: series[(name, timeframe)], names):6.3f} us")
+    print(f"  series by name                    {per_call(lambda name: store.get(name, timeframe), names):6.3f} us")
+    print(f"  series by ID                      {per_call(lambda i: store.get_by_id(i, timeframe), ids):6.3f} us")
+
+    columns = registry.tick_size.nbytes + registry.status.nbytes + registry.quote.nbytes
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    metadata = {pair: {'tick_size': 0.01, 'status': 'TRADING', 'quote': 'USDT'} for pair in pairs}
+    dicts = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"  metadata: columns {columns / len(registry):5.1f} B/symbol (capacity {len(registry.status):,}), "
+          f"dict per symbol {dicts / len(metadata):5.1f} B/symbol")
+
+
+if __name__ == "__main__":
+    main()
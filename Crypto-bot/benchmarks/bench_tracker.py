@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: TP/SL hit detection per price tick vs number of open ideas
+
+Opens N ideas spread over the configured pairs with levels around a
+random-walk price, then replays ticks through IdeaTracker (heap index per
+pair) and through a scan of every open idea of the pair, both as a Python
+loop and as a NumPy mask over level arrays. Notifications go to a counting
+outbox, so only detection and bookkeeping are measured. Reports
+microseconds per tick and checks that every method finds the same hits.
+
+Usage: python benchmarks/bench_tracker.py [ticks]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS, IDEA_TAKE_PROFITS, IDEA_STOP_LOSS
+from bot.storage import BotStorage
+from bot.tracker import IdeaTracker, STOP
+
+PRICE = 100.0
+
+
+class CountingOutbox:
+    """Outbox stand-in that only counts calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def send_message(self, *args, **kwargs):
+        self.calls += 1
+
+    def edit_message_text(self, *args, **kwargs):
+        self.calls += 1
+
+
+def make_ideas(count: int, rng) -> list:
+    """Ideas with entries spread +-5% around PRICE"""
+    ideas = []
+    for idea_id in range(1, count + 1):
+        side = 1 if rng.random() < 0.5 else -1
+        entry = PRICE * (1 + rng.uniform(-0.05, 0.05))
+        levels = tuple(entry * (1 + side * level) for level in IDEA_TAKE_PROFITS) + (entry * (1 - side * IDEA_STOP_LOSS),)
+        ideas.append({
+            'idea_id': idea_id,
+            'chat_id': idea_id,
+            'pair': DEFAULT_TRADING_PAIRS[idea_id % len(DEFAULT_TRADING_PAIRS)],
+            'trade_type': 'LONG' if side > 0 else 'SHORT',
+            'side': side,
+            'levels': levels,
+            'text': ''
+        })
+    return ideas
+
+
+def scan_loop(ideas: list, ticks: list) -> tuple:
+    """Check every open idea of the pair on every tick; returns (seconds, hits)"""
+    open_ideas = {}
+    for idea in ideas:
+        open_ideas.setdefault(idea['pair'], {})[idea['idea_id']] = [idea['side'], idea['levels'], 0]
+    hits = 0
+    start = time.perf_counter()
+    for pair, price in ticks:
+        pending = open_ideas[pair]
+        for idea_id, state in list(pending.items()):
+            side, levels, done = state
+            for level, target in enumerate(levels):
+                if done & (1 << level):
+                    continue
+                rising = (side > 0) == (level != STOP)
+                if (price >= target) if rising else (price <= target):
+                    done |= 1 << level
+                    hits += 1
+                    if level == STOP or level == 2:
+                        break
+            state[2] = done
+            if done & (1 << STOP) or done & (1 << 2):
+                del pending[idea_id]
+    return time.perf_counter() - start, hits
+
+
+def scan_numpy(ideas: list, ticks: list) -> tuple:
+    """Vectorized scan of all pending levels of the pair on every tick"""
+    arrays = {}
+    for pair in DEFAULT_TRADING_PAIRS:
+        chosen = [idea for idea in ideas if idea['pair'] == pair]
+        levels = np.array([idea['levels'] for idea in chosen])
+        rising = np.array([[(idea['side'] > 0) == (level != STOP) for level in range(4)] for idea in chosen])
+        arrays[pair] = [levels, rising, np.zeros(levels.shape, dtype=bool)]
+    hits = 0
+    start = time.perf_counter()
+    for pair, price in ticks:
+        levels, rising, done = arrays[pair]
+        reached = np.where(rising, price >= levels, price <= levels) & ~done
+        if reached.any():
+            closed = done[:, STOP] | done[:, 2]
+            reached &= ~closed[:, None]
+            done |= reached
+            hits += int(reached.sum())
+    return time.perf_counter() - start, hits
+
+
+def main():
+    count_ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rng = np.random.default_rng(7)
+    for count in (1_000, 10_000, 100_000):
+        ideas = make_ideas(count, rng)
+        # Random walk per pair: about 0.05% per tick
+        ticks = []
+        prices = dict.fromkeys(DEFAULT_TRADING_PAIRS, PRICE)
+        for pair in rng.choice(DEFAULT_TRADING_PAIRS, count_ticks):
+            prices[pair] *= 1 + rng.normal(0, 0.0005)
+            ticks.append((str(pair), prices[pair]))
+
+        tracker = IdeaTracker(CountingOutbox(), BotStorage(''))
+        for idea in ideas:
+            tracker.watch(idea, idea['idea_id'])
+        quiet = []
+        indexed_hits = 0
+        start = time.perf_counter()
+        for pair, price in ticks:
+            tick = time.perf_counter()
+            hit = tracker.on_price(pair, price)
+            if not hit:
+                quiet.append(time.perf_counter() - tick)
+            indexed_hits += hit
+        indexed = time.perf_counter() - start
+
+        # The Python scan is slow: fewer ticks for many ideas
+        loop_ticks = max(count_ticks * 1000 // count, 100)
+        loop, loop_hits = scan_loop(ideas, ticks[:loop_ticks])
+        vectorized, numpy_hits = scan_numpy(ideas, ticks)
+        match = 'match' if indexed_hits == numpy_hits else f"MISMATCH {indexed_hits} vs {numpy_hits}"
+        print(f"{count:>8,} open ideas, {count_ticks:,} ticks, {indexed_hits:,} levels hit ({match})")
+        print(f"  heap index:  {indexed / count_ticks * 1e6:9.2f} us/tick "
+              f"({np.median(quiet) * 1e6:.2f} us for ticks without hits, incl. notifications otherwise)")
+        print(f"  numpy scan:  {vectorized / count_ticks * 1e6:9.2f} us/tick")
+        print(f"  python scan: {loop / loop_ticks * 1e6:9.2f} us/tick ({loop_ticks:,} ticks, {loop_hits:,} hits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Local fake Telegram Bot API server for load tests
+
+Serves getUpdates (long polling) from an in-memory update queue and
+answers sendMessage, editMessageText, deleteMessage, sendChatAction,
+answerCallbackQuery, getFile and file downloads (synthetic candlestick
+charts) the way Telegram does, after a configurable latency. Every call is
+recorded. A share of the message calls can be answered with 429 and
+retry_after to exercise the bot's backoff.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>. Run on
+its own, updates can be queued with POST /control/updates (a JSON update
+or a list of them) and call counts read from GET /control/stats.
+
+Usage: python benchmarks/fake_bot_api.py [port] [latency_ms] [throttle_percent]
+"""
+
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+import urllib.parse
+import zlib
+from collections import Counter, deque
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+# Calls that may be answered with 429
+THROTTLED_METHODS = ('sendMessage', 'editMessageText', 'deleteMessage')
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+
+
+def draw_chart(seed: int, width: int = 1000, height: int = 600, candles: int = 80) -> bytes:
+    """PNG of a random-walk candlestick chart in TradingView colors"""
+    rng = random.Random(seed)
+    prices = [100.0]
+    for _ in range(candles):
+        prices.append(prices[-1] * (1 + rng.gauss(0, 0.01)))
+    low, high = min(prices) * 0.98, max(prices) * 1.02
+    image = Image.new('RGB', (width, height), (19, 23, 34))
+    draw = ImageDraw.Draw(image)
+    step = (width - 40) / candles
+
+    def y(price):
+        return 20 + (high - price) / (high - low) * (height - 40)
+
+    for i in range(candles):
+        start, end = prices[i], prices[i + 1]
+        top = max(start, end) * (1 + abs(rng.gauss(0, 0.004)))
+        bottom = min(start, end) * (1 - abs(rng.gauss(0, 0.004)))
+        color = (38, 166, 154) if end >= start else (239, 83, 80)
+        x = 20 + i * step
+        draw.line([(x + step / 2, y(top)), (x + step / 2, y(bottom))], fill=color, width=1)
+        draw.rectangle([x + 1, y(max(start, end)), x + step - 2, y(min(start, end)) + 1], fill=color)
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+class FakeBotApi:
+    """In-memory Bot API
+
+    on_call(method, params, now), when set, is called for every recorded
+    call after its latency, which lets a load generator see replies as the
+    bot would get them acknowledged.
+    """
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, throttle_percent: float = 0.0,
+                 retry_after: int = 1, on_call=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = round(100 / throttle_percent) if throttle_percent else 0
+        self.retry_after = retry_after
+        self.on_call = on_call
+        self.updates = deque()
+        self.update_id = 0
+        self.message_id = 0
+        self.calls = Counter()
+        self.throttled = 0
+        self.polls = 0
+        self.charts = {}
+        self._arrived = None
+        self._throttle_count = 0
+
+    def push(self, update: dict) -> int:
+        """Queue an update for getUpdates; returns its update_id"""
+        self.update_id += 1
+        self.updates.append(dict(update, update_id=self.update_id))
+        if self._arrived is not None:
+            self._arrived.set()
+        return self.update_id
+
+    async def params(self, request: web.Request) -> dict:
+        """Call parameters from the query string, a form or a JSON body"""
+        params = dict(request.query)
+        if not request.can_read_body:
+            return params
+        if request.content_type == 'application/json':
+            params.update(await request.json())
+        elif request.content_type == 'application/x-www-form-urlencoded':
+            # aiohttp only parses forms of POST requests; AsyncTeleBot also sends them with GET
+            params.update(urllib.parse.parse_qsl(await request.text()))
+        else:
+            params.update(await request.post())
+        return params
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        params = await self.params(request)
+        if method == 'getUpdates':
+            return await self.get_updates(params)
+
+        await asyncio.sleep(self.latency + (random.uniform(0, self.jitter) if self.jitter else 0))
+        self.calls[method] += 1
+        if self.throttle_every and method in THROTTLED_METHODS:
+            self._throttle_count += 1
+            if self._throttle_count % self.throttle_every == 0:
+                self.throttled += 1
+                return web.json_response({
+                    'ok': False, 'error_code': 429,
+                    'description': f"Too Many Requests: retry after {self.retry_after}",
+                    'parameters': {'retry_after': self.retry_after}
+                }, status=429)
+        if self.on_call is not None:
+            self.on_call(method, params, time.perf_counter())
+        return web.json_response({'ok': True, 'result': self.result(method, params)})
+
+    def result(self, method: str, params: dict):
+        if method in ('sendMessage', 'editMessageText'):
+            if method == 'sendMessage':
+                self.message_id += 1
+            message_id = int(params.get('message_id') or self.message_id)
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', '')
+            }
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getFile':
+            file_id = params.get('file_id', '')
+            return {'file_id': file_id, 'file_unique_id': file_id, 'file_path': f"photos/{file_id}.png"}
+        return True
+
+    async def get_updates(self, params: dict):
+        """Long polling: waits up to `timeout` seconds for updates"""
+        self.polls += 1
+        offset = int(params.get('offset') or 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        timeout = float(params.get('timeout') or 0)
+        if not self.updates and timeout > 0:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        batch = [self.updates[i] for i in range(min(limit, len(self.updates)))]
+        return web.json_response({'ok': True, 'result': batch})
+
+    async def file(self, request: web.Request):
+        """Chart image; one per file id"""
+        file_id = request.match_info['path'].rsplit('/', 1)[-1].split('.')[0]
+        data = self.charts.get(file_id)
+        if data is None:
+            data = self.charts[file_id] = draw_chart(zlib.crc32(file_id.encode()))
+        await asyncio.sleep(self.latency)
+        self.calls['downloadFile'] += 1
+        return web.Response(body=data, content_type='image/png')
+
+    async def control_updates(self, request: web.Request):
+        payload = await request.json()
+        for update in payload if isinstance(payload, list) else [payload]:
+            self.push(update)
+        return web.json_response({'ok': True, 'pending': len(self.updates)})
+
+    async def control_stats(self, request: web.Request):
+        return web.json_response({
+            'calls': dict(self.calls), 'throttled': self.throttled,
+            'polls': self.polls, 'pending': len(self.updates)
+        })
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving on the running loop; returns the base URL"""
+        self._arrived = asyncio.Event()
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.file)
+        app.router.add_post('/control/updates', self.control_updates)
+        app.router.add_get('/control/stats', self.control_stats)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def serve(port: int, latency: float, throttle_percent: float):
+    api = FakeBotApi(latency, throttle_percent=throttle_percent)
+    url = await api.start(port=port)
+    print(f"Fake Bot API on {url} (TELEGRAM_API_URL={url}), latency {latency * 1000:.0f} ms, "
+          f"{throttle_percent:g}% of message calls answered 429")
+    while True:
+        await asyncio.sleep(10)
+        print(json.dumps({'calls': dict(api.calls), 'throttled': api.throttled, 'pending': len(api.updates)}))
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    throttle_percent = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    try:
+        asyncio.run(serve(port, latency, throttle_percent))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Asyncio Telegram bot message handlers
+"""
+
+import asyncio
+import functools
+import time
+from telebot.async_telebot import AsyncTeleBot
+from telebot.util import extract_command, extract_arguments
+from utils.logger import setup_logger, REQUEST, REPLY
+from utils.metrics import metrics
+from utils.profiler import profiler
+from bot.messages import (
+    WELCOME_MESSAGE,
+    HELP_MESSAGE,
+    ERROR_GENERAL,
+    ERROR_INVALID_COMMAND,
+    ERROR_PROCESSING_IMAGE,
+    SCAN_USAGE
+)
+from bot.trading_analyzer import AsyncTradingAnalyzer
+from bot.outbox import AsyncOutbox, api_timer
+from bot.responder import Responder
+from bot.photo_pipeline import ChartPipeline, pick_photo_size, error_message
+from bot.subscriptions import SubscriptionRegistry, subscription_reply
+from bot.storage import BotStorage, bot_storage
+from bot.tracker import IdeaTracker
+from bot.idea_pool import IdeaPool
+from config import MAX_CONCURRENT_UPDATES, ANALYSIS_WORKERS, TIMEFRAMES
+
+logger = setup_logger()
+
+
+def setup_async_handlers(bot: AsyncTeleBot, analyzer: AsyncTradingAnalyzer = None,
+                         outbox: AsyncOutbox = None, max_concurrent: int = MAX_CONCURRENT_UPDATES,
+                         pipeline: ChartPipeline = None, subscriptions: SubscriptionRegistry = None,
+                         storage: BotStorage = None, tracker: IdeaTracker = None,
+                         idea_pool: IdeaPool = None):
+    """Setup all bot message handlers for asyncio dispatch
+
+    AsyncTeleBot runs the handlers of every update in a batch concurrently,
+    so a slow Telegram round trip for one user no longer stalls the others.
+    The semaphore caps the number of updates in flight at once. Replies
+    go through the rate-limited outbox, started on first use, and the
+    responder picks the cheapest way to show each analysis result.
+    """
+
+    analyzer = analyzer or AsyncTradingAnalyzer(max_workers=ANALYSIS_WORKERS)
+    outbox = outbox or AsyncOutbox(bot)
+    responder = Responder(outbox)
+    limiter = asyncio.Semaphore(max_concurrent)
+    pipeline = pipeline or ChartPipeline()
+    subscriptions = subscriptions if subscriptions is not None else SubscriptionRegistry()
+    storage = storage if storage is not None else bot_storage
+    tracker = tracker if tracker is not None else IdeaTracker(outbox, storage)
+    idea_pool = idea_pool if idea_pool is not None else IdeaPool(analyzer.analyzer).start()
+
+    async def take_idea(chat_id: int, user_id: int) -> dict:
+        """Pre-rendered idea; generated in the executor only if none is ready"""
+        idea = idea_pool.take(chat_id=chat_id, user_id=user_id, create=analyzer.create_trading_idea)
+        return await idea if asyncio.iscoroutine(idea) else idea
+
+    def bounded(handler):
+        """Limit the number of concurrently running handlers
+
+        Also remembers the user behind every update (a queued write),
+        times the handler including the wait for a slot and hands it to
+        the profiler.
+        """
+        name = handler.__name__[len('handle_'):]
+        @functools.wraps(handler)
+        async def wrapper(update):
+            start = time.perf_counter()
+            request = profiler.begin(name)
+            try:
+                storage.record_update(update)
+                async with limiter:
+                    await handler(update)
+            finally:
+                profiler.end(request)
+                metrics.observe('handler_seconds', time.perf_counter() - start, handler=name)
+        return wrapper
+
+    def download(handler: str):
+        """Image downloader for the chart pipeline"""
+        async def fetch(file_id):
+            metrics.inc('telegram_api_calls_total', handler=handler, method='get_file')
+            with api_timer('get_file'):
+                file_info = await bot.get_file(file_id)
+            with api_timer('download_file'):
+                return await bot.download_file(file_info.file_path)
+        return fetch
+
+    async def reply_chart(handler: str, message, photo_info: dict):
+        """Analyze a chart image in the pipeline and deliver the result"""
+        chat_id = message.chat.id
+        try:
+            pending = pipeline.submit_async(
+                download(handler),
+                photo_info['file_id'],
+                photo_info.get('file_size'),
+                file_unique_id=photo_info.get('file_unique_id'),
+                render=lambda chart: analyzer.analyzer.analyze_photo(photo_info, chart)
+            )
+        except Exception as e:
+            # Rejected before any work was done
+            metrics.inc('handler_requests_total', handler=handler)
+            outbox.send_message(chat_id, error_message(e), handler=handler)
+            return
+
+        try:
+            # Slow path, the responder shows the typing indicator meanwhile
+            await responder.reply_async(handler, chat_id, pending, slow=True, parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Error analyzing image from user {message.from_user.id}: {e}")
+            outbox.send_message(chat_id, error_message(e), handler=handler)
+
+    @bot.message_handler(commands=['start'])
+    @bounded
+    async def handle_start(message):
+        """Handle /start command"""
+        try:
+            logger.info("User %s started the bot", message.from_user.id, extra=REQUEST)
+
+            responder.send(
+                'start',
+                message.chat.id,
+                WELCOME_MESSAGE,
+                parse_mode='HTML'
+            )
+
+        except Exception as e:
+            logger.error(f"Error handling /start: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='start')
+
+    @bot.message_handler(commands=['help'])
+    @bounded
+    async def handle_help(message):
+        """Handle /help command"""
+        try:
+            logger.info("User %s requested help", message.from_user.id, extra=REQUEST)
+
+            responder.send(
+                'help',
+                message.chat.id,
+                HELP_MESSAGE,
+                parse_mode='HTML'
+            )
+
+        except Exception as e:
+            logger.error(f"Error handling /help: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='help')
+
+    @bot.message_handler(commands=['idea'])
+    @bounded
+    async def handle_idea(message):
+        """Handle /idea command - generate trading idea"""
+        try:
+            logger.info("User %s requested trading idea", message.from_user.id, extra=REQUEST)
+
+            idea = None
+
+            async def create():
+                nonlocal idea
+                idea = await take_idea(message.chat.id, message.from_user.id)
+                return idea['text']
+
+            op = await responder.reply_async('idea', message.chat.id, create(), parse_mode='HTML')
+            # Report TP/SL hits and tick them off in the idea message
+            tracker.watch(idea, op)
+
+            logger.info("Trading idea sent to user %s", message.from_user.id, extra=REPLY)
+
+        except Exception as e:
+            logger.error(f"Error handling /idea: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='idea')
+
+    @bot.message_handler(commands=['analyze'])
+    @bounded
+    async def handle_analyze(message):
+        """Handle /analyze command - market analysis"""
+        try:
+            logger.info("User %s requested market analysis", message.from_user.id, extra=REQUEST)
+
+            await responder.reply_async(
+                'analyze',
+                message.chat.id,
+                analyzer.analyze_market(),
+                parse_mode='HTML'
+            )
+
+            logger.info("Market analysis sent to user %s", message.from_user.id, extra=REPLY)
+
+        except Exception as e:
+            logger.error(f"Error handling /analyze: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='analyze')
+
+    @bot.message_handler(commands=['scan'])
+    @bounded
+    async def handle_scan(message):
+        """Handle /scan command - best setups over every pair"""
+        try:
+            logger.info("User %s requested market scan", message.from_user.id, extra=REQUEST)
+
+            timeframe = extract_arguments(message.text).strip() or None
+            if timeframe is not None and timeframe not in TIMEFRAMES:
+                responder.send('scan', message.chat.id, SCAN_USAGE.format(timeframes=', '.join(TIMEFRAMES)),
+                               parse_mode='HTML')
+                return
+
+            await responder.reply_async(
+                'scan',
+                message.chat.id,
+                analyzer.scan_market(timeframe),
+                parse_mode='HTML'
+            )
+
+            logger.info("Market scan sent to user %s", message.from_user.id, extra=REPLY)
+
+        except Exception as e:
+            logger.error(f"Error handling /scan: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='scan')
+
+    @bot.message_handler(commands=['subscribe', 'unsubscribe', 'subscriptions'])
+    @bounded
+    async def handle_subscription(message):
+        """Handle /subscribe, /unsubscribe and /subscriptions"""
+        try:
+            command = extract_command(message.text)
+            logger.info("User %s sent /%s", message.from_user.id, command, extra=REQUEST)
+
+            reply = subscription_reply(subscriptions, command, message.chat.id, extract_arguments(message.text))
+            responder.send(command, message.chat.id, reply, parse_mode='HTML')
+
+        except Exception as e:
+            logger.error(f"Error handling /subscribe: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='subscribe')
+
+    @bot.message_handler(content_types=['photo'])
+    @bounded
+    async def handle_photo(message):
+        """Handle photo uploads for chart analysis"""
+        try:
+            logger.info("User %s sent a photo for analysis", message.from_user.id, extra=REQUEST)
+
+            # Smallest size that is still sharp enough for analysis
+            photo = pick_photo_size(message.photo)
+            photo_info = {
+                'file_id': photo.file_id,
+                'file_unique_id': photo.file_unique_id,
+                'width': photo.width,
+                'height': photo.height,
+                'file_size': photo.file_size,
+                'caption': message.caption
+            }
+
+            await reply_chart('photo', message, photo_info)
+
+            logger.info("Photo analysis sent to user %s", message.from_user.id, extra=REPLY)
+
+        except Exception as e:
+            logger.error(f"Error handling photo: {e}")
+            outbox.send_message(message.chat.id, ERROR_PROCESSING_IMAGE, handler='photo')
+
+    @bot.message_handler(content_types=['document'])
+    @bounded
+    async def handle_document(message):
+        """Handle document uploads"""
+        try:
+            logger.info("User %s sent a document", message.from_user.id, extra=REQUEST)
+
+            # Check if it's an image file
+            if message.document.mime_type and message.document.mime_type.startswith('image/'):
+                photo_info = {
+                    'file_id': message.document.file_id,
+                    'file_unique_id': message.document.file_unique_id,
+                    'file_name': message.document.file_name,
+                    'mime_type': message.document.mime_type,
+                    'file_size': message.document.file_size,
+                    'caption': message.caption
+                }
+
+                await reply_chart('document', message, photo_info)
+            else:
+                responder.send(
+                    'document',
+                    message.chat.id,
+                    "❌ Поддерживаются только изображения. Отправьте скриншот торгового графика."
+                )
+
+        except Exception as e:
+            logger.error(f"Error handling document: {e}")
+            outbox.send_message(message.chat.id, ERROR_PROCESSING_IMAGE, handler='document')
+
+    @bot.message_handler(content_types=['text'])
+    @bounded
+    async def handle_text(message):
+        """Handle text messages - analyze trading ideas"""
+        try:
+            # Skip if it's a command we don't recognize
+            if message.text.startswith('/'):
+                responder.send('text', message.chat.id, ERROR_INVALID_COMMAND)
+                return
+
+            logger.info("User %s sent text for analysis: %.50s...", message.from_user.id, message.text, extra=REQUEST)
+
+            await responder.reply_async(
+                'text',
+                message.chat.id,
+                analyzer.analyze_text_idea(message.text),
+                parse_mode='HTML'
+            )
+
+            logger.info("Text analysis sent to user %s", message.from_user.id, extra=REPLY)
+
+        except Exception as e:
+            logger.error(f"Error handling text: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='text')
+
+    @bot.callback_query_handler(func=lambda call: True)
+    @bounded
+    async def handle_callback(call):
+        """Handle inline keyboard callbacks"""
+        try:
+            logger.info("User %s pressed callback: %s", call.from_user.id, call.data, extra=REQUEST)
+
+            metrics.inc('handler_requests_total', handler='callback')
+
+            # Answer callback to remove loading state
+            with api_timer('answer_callback_query'):
+                await bot.answer_callback_query(call.id)
+            metrics.inc('telegram_api_calls_total', handler='callback', method='answer_callback_query')
+
+            if call.data == 'new_idea':
+                idea = await take_idea(call.message.chat.id, call.from_user.id)
+                outbox.edit_message_text(
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text=idea['text'],
+                    parse_mode='HTML',
+                    handler='callback'
+                )
+                tracker.watch(idea, call.message.message_id)
+
+        except Exception as e:
+            logger.error(f"Error handling callback: {e}")
+            await bot.answer_callback_query(call.id, "❌ Произошла ошибка")
+
+    return analyzer
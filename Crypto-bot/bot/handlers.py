@@ -2,9 +2,14 @@
 Telegram bot message handlers
 """
 
+import functools
+import time
 import telebot
 from telebot import types
-from utils.logger import setup_logger
+from telebot.util import extract_command, extract_arguments
+from utils.logger import setup_logger, REQUEST, REPLY
+from utils.metrics import metrics
+from utils.profiler import profiler
 from bot.messages import (
     WELCOME_MESSAGE, 
     HELP_MESSAGE,
@@ -14,26 +19,104 @@ from bot.messages import (
     ERROR_INVALID_FORMAT,
     SUCCESS_ANALYSIS_STARTED,
     SUCCESS_IDEA_GENERATED,
-    SUCCESS_MARKET_ANALYZED
+    SUCCESS_MARKET_ANALYZED,
+    SCAN_USAGE
 )
 from bot.trading_analyzer import TradingAnalyzer
-from config import SUPPORTED_IMAGE_FORMATS
+from bot.outbox import ThreadedOutbox, api_timer
+from bot.responder import Responder
+from bot.photo_pipeline import ChartPipeline, pick_photo_size, error_message
+from bot.subscriptions import SubscriptionRegistry, subscription_reply
+from bot.storage import BotStorage, bot_storage
+from bot.tracker import IdeaTracker
+from bot.idea_pool import IdeaPool
+from config import SUPPORTED_IMAGE_FORMATS, TIMEFRAMES
 
 # Initialize logger and analyzer
 logger = setup_logger()
 analyzer = TradingAnalyzer()
 
-def setup_handlers(bot: telebot.TeleBot):
-    """Setup all bot message handlers"""
+def setup_handlers(bot: telebot.TeleBot, outbox: ThreadedOutbox = None, pipeline: ChartPipeline = None,
+                   subscriptions: SubscriptionRegistry = None, storage: BotStorage = None,
+                   tracker: IdeaTracker = None, idea_pool: IdeaPool = None):
+    """Setup all bot message handlers
+
+    Replies go through the rate-limited outbox; handlers never block on
+    Telegram round trips. The responder picks the cheapest way to show
+    each analysis result.
+    """
+
+    if outbox is None:
+        outbox = ThreadedOutbox(bot).start()
+    responder = Responder(outbox)
+    pipeline = pipeline or ChartPipeline()
+    subscriptions = subscriptions if subscriptions is not None else SubscriptionRegistry()
+    storage = storage if storage is not None else bot_storage
+    tracker = tracker if tracker is not None else IdeaTracker(outbox, storage)
+    idea_pool = idea_pool if idea_pool is not None else IdeaPool(analyzer).start()
+    
+    def tracked(handler):
+        """Remember the user behind every update (a queued write)
+
+        Also times the handler and hands it to the profiler.
+        """
+        name = handler.__name__[len('handle_'):]
+        @functools.wraps(handler)
+        def wrapper(update):
+            start = time.perf_counter()
+            request = profiler.begin(name)
+            try:
+                storage.record_update(update)
+                handler(update)
+            finally:
+                profiler.end(request)
+                metrics.observe('handler_seconds', time.perf_counter() - start, handler=name)
+        return wrapper
+    
+    def download(handler: str):
+        """Image downloader for the chart pipeline"""
+        def fetch(file_id):
+            metrics.inc('telegram_api_calls_total', handler=handler, method='get_file')
+            with api_timer('get_file'):
+                file_path = bot.get_file(file_id).file_path
+            with api_timer('download_file'):
+                return bot.download_file(file_path)
+        return fetch
+    
+    def reply_chart(handler: str, message, photo_info: dict):
+        """Queue a chart image for analysis and reply when it is done"""
+        chat_id = message.chat.id
+        try:
+            future = pipeline.submit(
+                download(handler),
+                photo_info['file_id'],
+                photo_info.get('file_size'),
+                file_unique_id=photo_info.get('file_unique_id'),
+                render=lambda chart: analyzer.analyze_photo(photo_info, chart)
+            )
+        except Exception as e:
+            # Rejected before any work was done
+            metrics.inc('handler_requests_total', handler=handler)
+            outbox.send_message(chat_id, error_message(e), handler=handler)
+            return
+        
+        def on_error(e):
+            logger.error(f"Error analyzing image from user {message.from_user.id}: {e}")
+            outbox.send_message(chat_id, error_message(e), handler=handler)
+        
+        # Slow path, show the typing indicator meanwhile
+        responder.reply_future(handler, chat_id, future, slow=True, on_error=on_error, parse_mode='HTML')
     
     @bot.message_handler(commands=['start'])
+    @tracked
     def handle_start(message):
         """Handle /start command"""
         try:
-            logger.info(f"User {message.from_user.id} started the bot")
+            logger.info("User %s started the bot", message.from_user.id, extra=REQUEST)
             
             # Send welcome message
-            bot.send_message(
+            responder.send(
+                'start',
                 message.chat.id,
                 WELCOME_MESSAGE,
                 parse_mode='HTML'
@@ -41,15 +124,17 @@ def setup_handlers(bot: telebot.TeleBot):
             
         except Exception as e:
             logger.error(f"Error handling /start: {e}")
-            bot.send_message(message.chat.id, ERROR_GENERAL)
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='start')
     
     @bot.message_handler(commands=['help'])
+    @tracked
     def handle_help(message):
         """Handle /help command"""
         try:
-            logger.info(f"User {message.from_user.id} requested help")
+            logger.info("User %s requested help", message.from_user.id, extra=REQUEST)
             
-            bot.send_message(
+            responder.send(
+                'help',
                 message.chat.id,
                 HELP_MESSAGE,
                 parse_mode='HTML'
@@ -57,184 +142,208 @@ def setup_handlers(bot: telebot.TeleBot):
             
         except Exception as e:
             logger.error(f"Error handling /help: {e}")
-            bot.send_message(message.chat.id, ERROR_GENERAL)
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='help')
     
     @bot.message_handler(commands=['idea'])
+    @tracked
     def handle_idea(message):
         """Handle /idea command - generate trading idea"""
         try:
-            logger.info(f"User {message.from_user.id} requested trading idea")
+            logger.info("User %s requested trading idea", message.from_user.id, extra=REQUEST)
             
-            # Send processing message
-            processing_msg = bot.send_message(message.chat.id, SUCCESS_ANALYSIS_STARTED)
+            ideas = []
             
-            # Generate trading idea
-            trading_idea = analyzer.generate_trading_idea()
+            def create():
+                idea = idea_pool.take(chat_id=message.chat.id, user_id=message.from_user.id)
+                ideas.append(idea)
+                return idea['text']
             
-            # Delete processing message and send result
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-            bot.send_message(
-                message.chat.id,
-                trading_idea,
-                parse_mode='HTML'
-            )
+            # Reply directly if the idea is ready within the latency budget
+            op = responder.reply('idea', message.chat.id, create, parse_mode='HTML')
+            # Report TP/SL hits and tick them off in the idea message
+            tracker.watch(ideas[0], op)
             
-            logger.info(f"Trading idea sent to user {message.from_user.id}")
+            logger.info("Trading idea sent to user %s", message.from_user.id, extra=REPLY)
             
         except Exception as e:
             logger.error(f"Error handling /idea: {e}")
-            bot.send_message(message.chat.id, ERROR_GENERAL)
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='idea')
     
     @bot.message_handler(commands=['analyze'])
+    @tracked
     def handle_analyze(message):
         """Handle /analyze command - market analysis"""
         try:
-            logger.info(f"User {message.from_user.id} requested market analysis")
+            logger.info("User %s requested market analysis", message.from_user.id, extra=REQUEST)
+            
+            responder.reply(
+                'analyze',
+                message.chat.id,
+                analyzer.analyze_market,
+                parse_mode='HTML'
+            )
             
-            # Send processing message
-            processing_msg = bot.send_message(message.chat.id, SUCCESS_ANALYSIS_STARTED)
+            logger.info("Market analysis sent to user %s", message.from_user.id, extra=REPLY)
             
-            # Generate market analysis
-            market_analysis = analyzer.analyze_market()
+        except Exception as e:
+            logger.error(f"Error handling /analyze: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='analyze')
+    
+    @bot.message_handler(commands=['scan'])
+    @tracked
+    def handle_scan(message):
+        """Handle /scan command - best setups over every pair"""
+        try:
+            logger.info("User %s requested market scan", message.from_user.id, extra=REQUEST)
             
-            # Delete processing message and send result
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-            bot.send_message(
+            timeframe = extract_arguments(message.text).strip() or None
+            if timeframe is not None and timeframe not in TIMEFRAMES:
+                responder.send('scan', message.chat.id, SCAN_USAGE.format(timeframes=', '.join(TIMEFRAMES)),
+                               parse_mode='HTML')
+                return
+            
+            responder.reply(
+                'scan',
                 message.chat.id,
-                market_analysis,
+                lambda: analyzer.scan_market(timeframe),
                 parse_mode='HTML'
             )
             
-            logger.info(f"Market analysis sent to user {message.from_user.id}")
+            logger.info("Market scan sent to user %s", message.from_user.id, extra=REPLY)
             
         except Exception as e:
-            logger.error(f"Error handling /analyze: {e}")
-            bot.send_message(message.chat.id, ERROR_GENERAL)
+            logger.error(f"Error handling /scan: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='scan')
+    
+    @bot.message_handler(commands=['subscribe', 'unsubscribe', 'subscriptions'])
+    @tracked
+    def handle_subscription(message):
+        """Handle /subscribe, /unsubscribe and /subscriptions"""
+        try:
+            command = extract_command(message.text)
+            logger.info("User %s sent /%s", message.from_user.id, command, extra=REQUEST)
+            
+            reply = subscription_reply(subscriptions, command, message.chat.id, extract_arguments(message.text))
+            responder.send(command, message.chat.id, reply, parse_mode='HTML')
+            
+        except Exception as e:
+            logger.error(f"Error handling /subscribe: {e}")
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='subscribe')
     
     @bot.message_handler(content_types=['photo'])
+    @tracked
     def handle_photo(message):
         """Handle photo uploads for chart analysis"""
         try:
-            logger.info(f"User {message.from_user.id} sent a photo for analysis")
-            
-            # Send processing message
-            processing_msg = bot.send_message(message.chat.id, SUCCESS_ANALYSIS_STARTED)
+            logger.info("User %s sent a photo for analysis", message.from_user.id, extra=REQUEST)
             
-            # Get photo info
-            photo = message.photo[-1]  # Get the highest resolution photo
+            # Smallest size that is still sharp enough for analysis
+            photo = pick_photo_size(message.photo)
             photo_info = {
                 'file_id': photo.file_id,
+                'file_unique_id': photo.file_unique_id,
                 'width': photo.width,
                 'height': photo.height,
-                'file_size': photo.file_size
+                'file_size': photo.file_size,
+                'caption': message.caption
             }
             
-            # Analyze photo
-            analysis_result = analyzer.analyze_photo(photo_info)
-            
-            # Delete processing message and send result
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-            bot.send_message(
-                message.chat.id,
-                analysis_result,
-                parse_mode='HTML'
-            )
+            reply_chart('photo', message, photo_info)
             
-            logger.info(f"Photo analysis sent to user {message.from_user.id}")
+            logger.info("Photo from user %s queued for analysis", message.from_user.id, extra=REPLY)
             
         except Exception as e:
             logger.error(f"Error handling photo: {e}")
-            bot.send_message(message.chat.id, ERROR_PROCESSING_IMAGE)
+            outbox.send_message(message.chat.id, ERROR_PROCESSING_IMAGE, handler='photo')
     
     @bot.message_handler(content_types=['document'])
+    @tracked
     def handle_document(message):
         """Handle document uploads"""
         try:
-            logger.info(f"User {message.from_user.id} sent a document")
+            logger.info("User %s sent a document", message.from_user.id, extra=REQUEST)
             
             # Check if it's an image file
             if message.document.mime_type and message.document.mime_type.startswith('image/'):
                 # Treat as image
-                processing_msg = bot.send_message(message.chat.id, SUCCESS_ANALYSIS_STARTED)
-                
                 photo_info = {
                     'file_id': message.document.file_id,
+                    'file_unique_id': message.document.file_unique_id,
                     'file_name': message.document.file_name,
                     'mime_type': message.document.mime_type,
-                    'file_size': message.document.file_size
+                    'file_size': message.document.file_size,
+                    'caption': message.caption
                 }
                 
-                analysis_result = analyzer.analyze_photo(photo_info)
-                
-                bot.delete_message(message.chat.id, processing_msg.message_id)
-                bot.send_message(
-                    message.chat.id,
-                    analysis_result,
-                    parse_mode='HTML'
-                )
+                reply_chart('document', message, photo_info)
             else:
-                bot.send_message(
+                responder.send(
+                    'document',
                     message.chat.id,
                     "❌ Поддерживаются только изображения. Отправьте скриншот торгового графика."
                 )
                 
         except Exception as e:
             logger.error(f"Error handling document: {e}")
-            bot.send_message(message.chat.id, ERROR_PROCESSING_IMAGE)
+            outbox.send_message(message.chat.id, ERROR_PROCESSING_IMAGE, handler='document')
     
     @bot.message_handler(content_types=['text'])
+    @tracked
     def handle_text(message):
         """Handle text messages - analyze trading ideas"""
         try:
             # Skip if it's a command we don't recognize
             if message.text.startswith('/'):
-                bot.send_message(message.chat.id, ERROR_INVALID_COMMAND)
+                responder.send('text', message.chat.id, ERROR_INVALID_COMMAND)
                 return
             
-            logger.info(f"User {message.from_user.id} sent text for analysis: {message.text[:50]}...")
-            
-            # Send processing message
-            processing_msg = bot.send_message(message.chat.id, SUCCESS_ANALYSIS_STARTED)
-            
-            # Analyze the text
-            analysis_result = analyzer.analyze_text_idea(message.text)
+            logger.info("User %s sent text for analysis: %.50s...", message.from_user.id, message.text, extra=REQUEST)
             
-            # Delete processing message and send result
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-            bot.send_message(
+            responder.reply(
+                'text',
                 message.chat.id,
-                analysis_result,
+                analyzer.analyze_text_idea,
+                message.text,
                 parse_mode='HTML'
             )
             
-            logger.info(f"Text analysis sent to user {message.from_user.id}")
+            logger.info("Text analysis sent to user %s", message.from_user.id, extra=REPLY)
             
         except Exception as e:
             logger.error(f"Error handling text: {e}")
-            bot.send_message(message.chat.id, ERROR_GENERAL)
+            outbox.send_message(message.chat.id, ERROR_GENERAL, handler='text')
     
     @bot.callback_query_handler(func=lambda call: True)
+    @tracked
     def handle_callback(call):
         """Handle inline keyboard callbacks"""
         try:
-            logger.info(f"User {call.from_user.id} pressed callback: {call.data}")
+            logger.info("User %s pressed callback: %s", call.from_user.id, call.data, extra=REQUEST)
+            
+            metrics.inc('handler_requests_total', handler='callback')
             
             # Answer callback to remove loading state
-            bot.answer_callback_query(call.id)
+            with api_timer('answer_callback_query'):
+                bot.answer_callback_query(call.id)
+            metrics.inc('telegram_api_calls_total', handler='callback', method='answer_callback_query')
             
             # Handle different callback data
             if call.data == 'new_idea':
-                # Generate new trading idea
-                trading_idea = analyzer.generate_trading_idea()
-                bot.edit_message_text(
+                # Pre-rendered idea, generated on demand only if none is ready
+                idea = idea_pool.take(chat_id=call.message.chat.id, user_id=call.from_user.id)
+                outbox.edit_message_text(
                     chat_id=call.message.chat.id,
                     message_id=call.message.message_id,
-                    text=trading_idea,
-                    parse_mode='HTML'
+                    text=idea['text'],
+                    parse_mode='HTML',
+                    handler='callback'
                 )
+                tracker.watch(idea, call.message.message_id)
             
         except Exception as e:
             logger.error(f"Error handling callback: {e}")
             bot.answer_callback_query(call.id, "❌ Произошла ошибка")
     
     # Note: Middleware functionality moved to individual handlers for better compatibility
+
+    return outbox
@@ -0,0 +1,154 @@
+"""
+Pool of pre-rendered trading ideas per pair and timeframe
+"""
+
+import threading
+import time
+from collections import deque
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from market.candles import CandleStore, candle_store, TIMEFRAME_SECONDS
+from bot.signals import last_close
+from config import IDEA_POOL_SIZE, IDEA_POOL_MAX_AGE
+
+logger = setup_logger()
+
+
+class IdeaPool:
+    """Keeps a few rendered ideas ready for every series
+
+    A producer thread renders up to `size` ideas ahead of demand for each
+    series ideas are drawn from (the best scanned setups, see
+    TradingAnalyzer.idea_series). take() pops one in O(1) from a series the
+    analyzer picks and issues it to the chat; only when the series has none
+    left is an idea rendered on demand.
+    Ideas are tied to the candle they were built on: once that candle
+    closes (by the clock, or a newer candle shows up in the store) or after
+    `max_age` seconds, they are discarded instead of served.
+    """
+
+    def __init__(self, analyzer, size: int = IDEA_POOL_SIZE, max_age: float = IDEA_POOL_MAX_AGE,
+                 store: CandleStore = None, clock=time.time):
+        self.analyzer = analyzer
+        self.size = size
+        self.max_age = max_age
+        self.store = store or candle_store
+        self.clock = clock
+        # Deques per (pair, timeframe), added as series become idea candidates
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._wanted = threading.Condition(self._lock)
+        self._running = False
+        self._drained = False
+        self._thread = None
+
+    def __len__(self) -> int:
+        return sum(len(pool) for pool in self._pools.values())
+
+    def candle(self, pair: str, timeframe: str, now: float) -> tuple:
+        """Identifies the candle an idea of the series is built on"""
+        buffer = self.store.get(pair, timeframe)
+        return last_close(now, timeframe), buffer.last_time if buffer is not None else 0.0
+
+    def _fresh(self, entry: tuple, now: float) -> bool:
+        candle, created, idea = entry
+        return now - created < self.max_age and candle == self.candle(idea['pair'], idea['timeframe'], now)
+
+    def pop(self, pair: str = None, timeframe: str = None):
+        """A rendered idea of the series (picked by the analyzer when not given), or None"""
+        pair, timeframe = self.analyzer.pick_series(pair, timeframe)
+        now = self.clock()
+        with self._lock:
+            pool = self._pools.get((pair, timeframe))
+            while pool:
+                entry = pool.popleft()
+                if self._fresh(entry, now):
+                    self._wake()
+                    metrics.inc('idea_pool_requests_total', result='hit')
+                    return entry[2]
+                metrics.inc('idea_pool_expired_total')
+            self._wake()
+        metrics.inc('idea_pool_requests_total', result='miss')
+        return None
+
+    def _wake(self):
+        """Ask the producer to refill (lock held)"""
+        self._drained = True
+        self._wanted.notify()
+
+    def take(self, pair: str = None, timeframe: str = None, chat_id: int = None, user_id: int = None,
+             create=None) -> dict:
+        """Issue an idea to a chat, from the pool or rendered on demand
+
+        create(pair, timeframe, chat_id, user_id) renders the idea when the
+        series has none ready (the analyzer's create_trading_idea() by
+        default); its result is returned as is, so an async one leaves a
+        coroutine for the caller to await.
+        """
+        pair, timeframe = self.analyzer.pick_series(pair, timeframe)
+        idea = self.pop(pair, timeframe)
+        if idea is None:
+            return (create or self.analyzer.create_trading_idea)(pair, timeframe, chat_id, user_id)
+        return self.analyzer.issue_trading_idea(idea, chat_id, user_id)
+
+    def refill(self) -> int:
+        """Drop stale ideas and render the missing ones; returns the number rendered"""
+        rendered = 0
+        wanted = set(self.analyzer.idea_series())
+        with self._lock:
+            for series in wanted:
+                self._pools.setdefault(series, deque())
+            pools = list(self._pools.items())
+        for (pair, timeframe), pool in pools:
+            now = self.clock()
+            with self._lock:
+                while pool and not self._fresh(pool[0], now):
+                    pool.popleft()
+                    metrics.inc('idea_pool_expired_total')
+                # Series no longer among the candidates keep their fresh ideas
+                missing = self.size - len(pool) if (pair, timeframe) in wanted else 0
+            for _ in range(missing):
+                candle = self.candle(pair, timeframe, now)
+                try:
+                    idea = self.analyzer.render_trading_idea(pair, timeframe)
+                except Exception as e:
+                    logger.error(f"Error rendering pooled idea for {pair} {timeframe}: {e}")
+                    break
+                with self._lock:
+                    pool.append((candle, now, idea))
+                rendered += 1
+        metrics.set('idea_pool_size', len(self))
+        return rendered
+
+    def _next_expiry(self, now: float) -> float:
+        """Seconds until the oldest idea expires (by age or candle close)"""
+        with self._lock:
+            created = [pool[0][1] for pool in self._pools.values() if pool]
+            timeframes = {timeframe for _, timeframe in self._pools} or set(self.analyzer.timeframes)
+        age = min(created) + self.max_age - now if created else self.max_age
+        close = min(last_close(now, timeframe) + TIMEFRAME_SECONDS[timeframe] - now for timeframe in timeframes)
+        return max(min(age, close), 0.01)
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                self._drained = False
+            self.refill()
+            delay = self._next_expiry(self.clock())
+            with self._lock:
+                # Woken by a pop, or when ideas go stale
+                if self._running and not self._drained:
+                    self._wanted.wait(delay)
+
+    def start(self):
+        """Fill the pool in a background thread"""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='idea-pool', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._wanted.notify_all()
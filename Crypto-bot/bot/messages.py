@@ -13,6 +13,8 @@ WELCOME_MESSAGE = """
 /help - Показать помощь
 /idea - Получить торговую идею
 /analyze - Анализ рынка
+/scan - Лучшие сетапы по всем парам
+/subscribe - Подписаться на сигналы
 
 Вы также можете отправить мне:
 📷 Скриншот графика для анализа
@@ -28,6 +30,12 @@ HELP_MESSAGE = """
 <b>/help</b> - Показать это сообщение
 <b>/idea</b> - Получить случайную торговую идею
 <b>/analyze</b> - Получить анализ текущего рынка
+<b>/scan</b> - Лучшие сетапы по всем парам и таймфреймам (<code>/scan 4h</code> — только по одному)
+
+<b>🔔 Сигналы:</b>
+<b>/subscribe BTC/USDT 4h</b> - Получать сигнал по паре при закрытии каждой свечи
+<b>/unsubscribe BTC/USDT 4h</b> - Отписаться (без аргументов — от всех сигналов)
+<b>/subscriptions</b> - Ваши подписки
 
 <b>🖼️ Анализ скриншотов:</b>
 Отправьте скриншот торгового графика, и я дам рекомендации по входу/выходу.
@@ -85,6 +93,21 @@ ANALYSIS_RESULT_TEMPLATE = """
 <i>Обновлено: {timestamp}</i>
 """
 
+SCAN_RESULT_TEMPLATE = """
+<b>🔎 Лучшие сетапы{scope}</b>
+
+{items}
+
+<i>Просканировано серий: {series} за {elapsed:.0f} мс · {timestamp}</i>
+"""
+SCAN_RESULT_ITEM = "{rank}. {emoji} <b>{pair}</b> {timeframe} {trade_type} — сила {strength:.2f}, R/R {rr:.1f}, RSI {rsi:.0f}"
+SCAN_EMPTY = "ℹ️ Пока нет рыночных данных для сканирования. Попробуйте позже."
+SCAN_USAGE = "ℹ️ Укажите таймфрейм или ничего: <code>/scan</code>, <code>/scan 4h</code>\nТаймфреймы: {timeframes}"
+
+KEY_LEVELS_ITEM = "• <b>{pair}</b> ({timeframe}): поддержка {support}; сопротивление {resistance}"
+KEY_LEVEL = "{price} ({touches} кас.)"
+KEY_LEVELS_NONE = "нет"
+
 PHOTO_ANALYSIS_TEMPLATE = """
 <b>🖼️ Анализ графика</b>
 
@@ -110,6 +133,26 @@ ERROR_GENERAL = "❌ Произошла ошибка. Попробуйте по
 ERROR_INVALID_COMMAND = "❌ Неизвестная команда. Используйте /help для просмотра доступных команд."
 ERROR_PROCESSING_IMAGE = "❌ Ошибка при обработке изображения. Попробуйте отправить другое изображение."
 ERROR_INVALID_FORMAT = "❌ Неподдерживаемый формат файла. Поддерживаются: JPG, PNG, GIF, WebP."
+ERROR_IMAGE_QUEUE_FULL = "⏳ Сейчас анализируется слишком много графиков. Попробуйте через минуту."
+ERROR_IMAGE_TOO_LARGE = "❌ Изображение слишком большое. Максимальный размер — 20 МБ."
+ERROR_CHART_NOT_FOUND = "❌ Не удалось найти свечи на изображении. Отправьте скриншот свечного графика."
+
+# Signal subscriptions
+SUBSCRIBE_USAGE = "ℹ️ Укажите пару и таймфрейм, например: <code>/subscribe BTC/USDT 4h</code>\nДоступные пары: {pairs}\nТаймфреймы: {timeframes}"
+SUBSCRIBE_DONE = "🔔 Вы подписаны на сигналы {pair} {timeframe}. Сигнал придёт при закрытии свечи."
+SUBSCRIBE_EXISTS = "ℹ️ Вы уже подписаны на сигналы {pair} {timeframe}."
+UNSUBSCRIBE_DONE = "🔕 Подписка отменена ({count})."
+UNSUBSCRIBE_NONE = "ℹ️ Подходящих подписок не найдено."
+SUBSCRIPTIONS_LIST = "<b>🔔 Ваши подписки:</b>\n{items}"
+SUBSCRIPTIONS_EMPTY = "ℹ️ У вас нет подписок. Используйте /subscribe BTC/USDT 4h"
+
+# Idea tracking: level hits and the status line added to the idea message
+IDEA_TARGETS_HIT = "🎯 <b>Идея #{idea_id}</b> ({pair} {trade_type}): {levels} — цена {price}"
+IDEA_STOPPED = "🛡️ <b>Идея #{idea_id}</b> ({pair} {trade_type}): сработал стоп-лосс — цена {price}"
+IDEA_STATUS = "\n<b>📍 Статус:</b> {status}"
+IDEA_STATUS_OPEN = "достигнуты {levels}"
+IDEA_STATUS_DONE = "все цели достигнуты, идея закрыта ✅"
+IDEA_STATUS_STOPPED = "стоп-лосс, идея закрыта ❌"
 
 # Success messages
 SUCCESS_ANALYSIS_STARTED = "✅ Начинаю анализ..."
@@ -0,0 +1,587 @@
+"""
+Outbound delivery queue with Telegram-aware rate limiting
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from telebot import apihelper
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from config import (
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_CHAT_RATE,
+    OUTBOX_CHAT_BURST,
+    OUTBOX_GROUP_RATE,
+    OUTBOX_WORKERS
+)
+
+logger = setup_logger()
+
+# Priority lanes, lower value is delivered first
+PRIORITY_RESULT = 0
+PRIORITY_PLACEHOLDER = 1
+PRIORITY_BROADCAST = 2
+LANES = 3
+
+# Idle chats are forgotten once their rate limit has fully recovered
+CHAT_IDLE_SECONDS = 60
+
+
+@contextlib.contextmanager
+def api_timer(method: str):
+    """Time a Bot API call in telegram_api_seconds; failures are counted by error code"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        code = getattr(e, 'error_code', None) or type(e).__name__
+        metrics.inc('telegram_api_errors_total', method=method, code=code)
+        raise
+    finally:
+        metrics.observe('telegram_api_seconds', time.perf_counter() - start, method=method)
+
+
+class TokenBucket:
+    """Token bucket rate limiter"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        # Below one token (e.g. the global rate split over many workers) the
+        # bucket would never allow a call
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Refill and return seconds until a token is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Consume one token; call after wait_time() returned 0"""
+        self.tokens -= 1
+
+
+class OutboundOp:
+    """Queued Bot API call; its future resolves with the API result
+
+    Operations dropped by coalescing resolve with None without an API call.
+    Broadcast operations have no future: on_done(op, result, error) is
+    called instead, which keeps queueing tens of thousands of them cheap.
+    """
+
+    def __init__(self, method: str, chat_id, kwargs: dict, priority: int, target=None,
+                 handler: str = None, delay: float = 0.0, on_done=None):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.priority = priority
+        self.target = target
+        self.handler = handler or 'other'
+        self.queued_at = time.monotonic()
+        self.not_before = time.monotonic() + delay if delay > 0 else 0.0
+        self.on_done = on_done
+        self.future = Future() if on_done is None else None
+        self.attempts = 0
+        self.state = 'queued'
+
+    def result(self, timeout: float = None):
+        """Block until delivered and return the API result"""
+        return self.future.result(timeout)
+
+    def done(self) -> bool:
+        return self.future.done() if self.future is not None else self.state in ('done', 'failed', 'dropped')
+
+    def resolve(self, result=None, error: Exception = None):
+        """Publish the outcome to the future or the on_done callback"""
+        if self.future is None:
+            self.on_done(self, result, error)
+        elif error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+class _Chat:
+    """Per-chat FIFO of pending operations"""
+
+    __slots__ = ('chat_id', 'ops', 'bucket', 'busy', 'lane', 'last_used')
+
+    def __init__(self, chat_id, bucket: TokenBucket):
+        self.chat_id = chat_id
+        self.ops = deque()
+        self.bucket = bucket
+        self.busy = False
+        self.lane = None
+        self.last_used = time.monotonic()
+
+
+class Outbox:
+    """Rate-limited outbound queue in front of the Bot API
+
+    Calls are queued per chat and delivered in order within a chat. A global
+    token bucket keeps the bot under Telegram's overall limit and a per-chat
+    bucket under the per-chat limit (stricter for groups). Chats whose next
+    operation is a result are served before chats waiting on placeholders.
+
+    Redundant operations are merged before they reach the API: deleting a
+    message that is still queued drops both calls, and editing a queued
+    message rewrites its text in place. A send can be deferred with delay:
+    until then it stays queued, so a placeholder that is edited or deleted
+    within the delay never costs an API call. 429 responses are retried after the
+    advertised retry_after, network errors with exponential backoff.
+
+    send_message/edit_message_text/delete_message mirror the TeleBot
+    signatures, accept an OutboundOp wherever a message_id is expected and
+    return an OutboundOp instead of blocking. The handler tag is used to
+    count API calls per handler (telegram_api_calls_total).
+    """
+
+    def __init__(self, bot, global_rate: float = OUTBOX_GLOBAL_RATE, chat_rate: float = OUTBOX_CHAT_RATE,
+                 chat_burst: float = OUTBOX_CHAT_BURST, group_rate: float = OUTBOX_GROUP_RATE,
+                 max_retries: int = 5, workers: int = OUTBOX_WORKERS):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._chats = {}
+        self._ready = [deque() for _ in range(LANES)]
+        self._waiting = []
+        self._seq = itertools.count()
+        self._depth = 0
+        self._last_prune = time.monotonic()
+        self._running = False
+
+    # Public API
+
+    def send_message(self, chat_id, text: str, priority: int = PRIORITY_RESULT,
+                     handler: str = None, delay: float = 0.0, **kwargs) -> OutboundOp:
+        """Queue a sendMessage call, optionally not before delay seconds"""
+        op = OutboundOp('send_message', chat_id, dict(kwargs, text=text), priority,
+                        handler=handler, delay=delay)
+        with self._lock:
+            self._enqueue(op)
+        return op
+
+    def broadcast(self, chat_ids, text: str, handler: str = 'broadcast', on_done=None, **kwargs) -> list:
+        """Queue the same sendMessage for many chats in one step
+
+        All operations share one kwargs dict, so the text is rendered and
+        stored once. They go to the lowest priority lane: interactive
+        replies and placeholders are always delivered first. With on_done,
+        outcomes are reported through on_done(op, result, error) instead of
+        per-operation futures.
+        """
+        kwargs = dict(kwargs, text=text)
+        ops = [OutboundOp('send_message', chat_id, kwargs, PRIORITY_BROADCAST, handler=handler, on_done=on_done)
+               for chat_id in chat_ids]
+        with self._lock:
+            for op in ops:
+                chat = self._chat(op.chat_id)
+                chat.ops.append(op)
+                self._schedule(chat)
+            self._set_depth(self._depth + len(ops))
+            self._wakeup(self.workers)
+        return ops
+
+    def send_chat_action(self, chat_id, action: str, handler: str = None) -> OutboundOp:
+        """Queue a sendChatAction call (e.g. the 'typing' indicator)"""
+        op = OutboundOp('send_chat_action', chat_id, {'action': action}, PRIORITY_PLACEHOLDER, handler=handler)
+        with self._lock:
+            self._enqueue(op)
+        return op
+
+    def edit_message_text(self, text: str, chat_id=None, message_id=None,
+                          priority: int = PRIORITY_RESULT, handler: str = None, **kwargs) -> OutboundOp:
+        """Queue an editMessageText call, merging it into pending operations"""
+        op = OutboundOp('edit_message_text', chat_id, dict(kwargs, text=text), priority,
+                        target=message_id, handler=handler)
+        with self._lock:
+            merged = self._merge_edit(op)
+            if merged is not None:
+                metrics.inc('outbox_coalesced_total')
+                return merged
+            self._enqueue(op)
+        return op
+
+    def delete_message(self, chat_id, message_id, priority: int = PRIORITY_PLACEHOLDER,
+                       handler: str = None) -> OutboundOp:
+        """Queue a deleteMessage call; free if the message was never sent"""
+        op = OutboundOp('delete_message', chat_id, {}, priority, target=message_id, handler=handler)
+        with self._lock:
+            if self._cancel_queued(op):
+                op.state = 'dropped'
+                op.resolve(True)
+                return op
+            self._enqueue(op)
+        return op
+
+    @property
+    def depth(self) -> int:
+        """Number of queued operations"""
+        return self._depth
+
+    # Queue bookkeeping (called with the lock held)
+
+    def _chat(self, chat_id) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if group else self.chat_rate
+            chat = _Chat(chat_id, TokenBucket(rate, self.chat_burst))
+            self._chats[chat_id] = chat
+        return chat
+
+    def _enqueue(self, op: OutboundOp):
+        chat = self._chat(op.chat_id)
+        chat.ops.append(op)
+        self._set_depth(self._depth + 1)
+        self._schedule(chat)
+        self._wakeup()
+
+    def _schedule(self, chat: _Chat, delay: float = 0.0):
+        """Put a chat with pending operations on a ready lane or the timer heap"""
+        if chat.busy or not chat.ops:
+            return
+        now = time.monotonic()
+        if chat.ops[0].not_before > now:
+            delay = max(delay, chat.ops[0].not_before - now)
+        if delay > 0:
+            chat.lane = 'waiting'
+            heapq.heappush(self._waiting, (now + delay, next(self._seq), chat))
+            return
+        lane = chat.ops[0].priority
+        if chat.lane is None or (isinstance(chat.lane, int) and lane < chat.lane):
+            chat.lane = lane
+            self._ready[lane].append(chat)
+
+    def _remove(self, chat: _Chat, op: OutboundOp):
+        chat.ops.remove(op)
+        op.state = 'dropped'
+        op.resolve()
+        self._set_depth(self._depth - 1)
+        metrics.inc('outbox_coalesced_total')
+
+    def _cancel_queued(self, delete_op: OutboundOp) -> bool:
+        """Drop a queued send and its pending edits when it gets deleted"""
+        target = delete_op.target
+        if not isinstance(target, OutboundOp) or target.state != 'queued':
+            return False
+        chat = self._chats[target.chat_id]
+        for pending in list(chat.ops):
+            if pending is target or pending.target is target:
+                self._remove(chat, pending)
+        # Head of the queue may have changed lane
+        if chat.lane is not None and chat.lane != 'waiting':
+            self._schedule(chat)
+        return True
+
+    def _merge_edit(self, op: OutboundOp):
+        """Fold an edit into a queued send or edit of the same message"""
+        target = op.target
+        if isinstance(target, OutboundOp) and target.state == 'queued':
+            target.kwargs.update(op.kwargs)
+            # The real content is ready: no reason to hold a deferred send back
+            target.priority = min(target.priority, op.priority)
+            if target.not_before:
+                target.not_before = 0.0
+                chat = self._chats[target.chat_id]
+                if chat.lane == 'waiting':
+                    chat.lane = None
+                self._schedule(chat)
+                self._wakeup()
+            return target
+        chat = self._chats.get(op.chat_id)
+        if chat is None:
+            return None
+        for pending in reversed(chat.ops):
+            if pending.method == 'edit_message_text' and pending.target == target:
+                pending.kwargs.update(op.kwargs)
+                return pending
+        return None
+
+    def _set_depth(self, depth: int):
+        self._depth = depth
+        metrics.set('outbox_queue_depth', depth)
+
+    def _pick(self, now: float):
+        """Pick the next operation to deliver (lock held)
+
+        Returns (op, delay): op is None when nothing can be sent yet and
+        delay is how long to wait before asking again (None: until woken).
+        """
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, chat = heapq.heappop(self._waiting)
+            if chat.lane == 'waiting':
+                chat.lane = None
+                self._schedule(chat)
+
+        if now - self._last_prune > CHAT_IDLE_SECONDS:
+            self._prune(now)
+
+        for lane, ready in enumerate(self._ready):
+            while ready:
+                chat = ready[0]
+                if chat.lane != lane or chat.busy or not chat.ops:
+                    ready.popleft()
+                    if chat.lane == lane:
+                        chat.lane = None
+                    continue
+
+                global_wait = self.global_bucket.wait_time(now)
+                if global_wait > 0:
+                    return None, global_wait
+
+                ready.popleft()
+                chat.lane = None
+                if chat.ops[0].not_before > now:
+                    self._schedule(chat)
+                    continue
+                chat_wait = chat.bucket.wait_time(now)
+                if chat_wait > 0:
+                    self._schedule(chat, chat_wait)
+                    continue
+
+                self.global_bucket.take()
+                chat.bucket.take()
+                op = chat.ops.popleft()
+                op.state = 'inflight'
+                op.attempts += 1
+                metrics.inc('telegram_api_calls_total', handler=op.handler, method=op.method)
+                chat.busy = True
+                chat.last_used = now
+                self._set_depth(self._depth - 1)
+                return op, 0.0
+
+        if self._waiting:
+            return None, self._waiting[0][0] - now
+        return None, None
+
+    def _prune(self, now: float):
+        self._last_prune = now
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.ops and not chat.busy and now - chat.last_used > CHAT_IDLE_SECONDS:
+                del self._chats[chat_id]
+
+    def _prepare(self, op: OutboundOp):
+        """Resolve message handles into the API call arguments
+
+        Returns None when the call became pointless (its target failed).
+        """
+        kwargs = dict(op.kwargs)
+        target = op.target
+        if isinstance(target, OutboundOp):
+            if not target.done() or target.future.exception() is not None:
+                return None
+            message = target.future.result()
+            if message is None:
+                return None
+            target = message.message_id
+        if op.method == 'send_message':
+            return (op.chat_id,), kwargs
+        if op.method == 'delete_message':
+            return (op.chat_id, target), kwargs
+        if op.method == 'send_chat_action':
+            return (op.chat_id, kwargs['action']), {}
+        return (), dict(kwargs, chat_id=op.chat_id, message_id=target)
+
+    def _complete(self, op: OutboundOp, result=None, error: Exception = None):
+        """Record the outcome of a delivery attempt"""
+        final = False
+        with self._lock:
+            chat = self._chats[op.chat_id]
+            chat.busy = False
+            delay = None
+            if error is not None:
+                delay = self._retry_delay(error, op.attempts)
+                if delay is not None:
+                    op.state = 'queued'
+                    chat.ops.appendleft(op)
+                    self._set_depth(self._depth + 1)
+                    metrics.inc('outbox_retries_total')
+                    logger.warning(f"Retrying {op.method} to chat {op.chat_id} in {delay:.1f}s: {error}")
+                else:
+                    op.state = 'failed'
+                    final = True
+                    metrics.inc('outbox_failed_total')
+                    logger.error(f"Failed to deliver {op.method} to chat {op.chat_id}: {error}")
+            else:
+                op.state = 'done'
+                final = True
+                metrics.inc('outbox_sent_total')
+                # From the handler queueing the call to the API accepting it
+                metrics.observe('outbox_delivery_seconds', time.monotonic() - op.queued_at, handler=op.handler)
+            self._schedule(chat, delay or 0.0)
+            self._wakeup()
+        # Outside the lock: callbacks (e.g. unsubscribing a blocked chat) must
+        # not hold up the other chats
+        if final:
+            op.resolve(result, error)
+
+    def _retry_delay(self, error: Exception, attempts: int):
+        """Seconds to wait before retrying, or None if the error is final"""
+        if attempts > self.max_retries:
+            return None
+        error_code = getattr(error, 'error_code', None)
+        if error_code == 429:
+            parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+            return float(parameters.get('retry_after', 1))
+        if error_code is not None and error_code < 500:
+            return None
+        if error_code is not None or isinstance(error, (apihelper.ApiException, OSError, TimeoutError)):
+            return min(0.5 * 2 ** (attempts - 1), 30.0)
+        return None
+
+    def _skip(self, op: OutboundOp):
+        """Complete an operation whose target no longer exists"""
+        with self._lock:
+            chat = self._chats[op.chat_id]
+            chat.busy = False
+            op.state = 'dropped'
+            self._schedule(chat)
+            self._wakeup()
+        op.resolve()
+
+    # Delivery loop, implemented by the thread and asyncio variants
+
+    def _wakeup(self, count: int = 1):
+        raise NotImplementedError
+
+
+class ThreadedOutbox(Outbox):
+    """Outbox delivered by worker threads calling a blocking TeleBot"""
+
+    def __init__(self, bot, **kwargs):
+        super().__init__(bot, **kwargs)
+        self._cond = threading.Condition(self._lock)
+        self._threads = []
+
+    def start(self):
+        """Start delivery threads"""
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stop delivery threads after in-flight calls return"""
+        with self._lock:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _wakeup(self, count: int = 1):
+        self._cond.notify(count)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    if not self._running:
+                        return
+                    op, delay = self._pick(time.monotonic())
+                    if op is not None:
+                        break
+                    self._cond.wait(delay)
+
+            call = self._prepare(op)
+            if call is None:
+                self._skip(op)
+                continue
+            args, kwargs = call
+            try:
+                with api_timer(op.method):
+                    result = getattr(self.bot, op.method)(*args, **kwargs)
+            except Exception as e:
+                self._complete(op, error=e)
+            else:
+                self._complete(op, result=result)
+
+
+class AsyncOutbox(Outbox):
+    """Outbox delivered by an asyncio task calling an AsyncTeleBot"""
+
+    def __init__(self, bot, **kwargs):
+        super().__init__(bot, **kwargs)
+        self._event = None
+        self._loop = None
+        self._task = None
+        self._inflight = set()
+
+    def start(self):
+        """Start the delivery task on the running loop"""
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        """Stop delivery after in-flight calls return"""
+        self._running = False
+        self._task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def _wakeup(self, count: int = 1):
+        if self._loop is None:
+            # First use from a handler; the loop is running by now
+            self.start()
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def _run(self):
+        limiter = asyncio.Semaphore(self.workers)
+        while self._running:
+            self._event.clear()
+            with self._lock:
+                op, delay = self._pick(time.monotonic())
+            if op is None:
+                try:
+                    await asyncio.wait_for(self._event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await limiter.acquire()
+            task = asyncio.create_task(self._deliver(op))
+            self._inflight.add(task)
+            task.add_done_callback(lambda t: (self._inflight.discard(t), limiter.release()))
+
+    async def _deliver(self, op: OutboundOp):
+        call = self._prepare(op)
+        if call is None:
+            self._skip(op)
+            return
+        args, kwargs = call
+        try:
+            with api_timer(op.method):
+                result = await getattr(self.bot, op.method)(*args, **kwargs)
+        except Exception as e:
+            self._complete(op, error=e)
+        else:
+            self._complete(op, result=result)
@@ -0,0 +1,298 @@
+"""
+Chart screenshot pipeline: download, then analyze in a process pool
+"""
+
+import asyncio
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from utils.cache import LRUCache
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.process import exit_with_parent
+from vision.chart import ChartNotFound, analyze_chart_image, image_hash, hamming
+from bot.messages import (
+    ERROR_PROCESSING_IMAGE,
+    ERROR_IMAGE_QUEUE_FULL,
+    ERROR_IMAGE_TOO_LARGE,
+    ERROR_CHART_NOT_FOUND
+)
+from config import (
+    PHOTO_WORKERS,
+    PHOTO_QUEUE_LIMIT,
+    PHOTO_MIN_RESOLUTION,
+    PHOTO_MAX_BYTES,
+    CHART_CACHE_ENTRIES,
+    CHART_CACHE_MAX_BYTES,
+    CHART_CACHE_DIR,
+    CHART_CACHE_DISK_BYTES,
+    CHART_HASH_DISTANCE
+)
+
+logger = setup_logger()
+
+
+class PipelineBusy(Exception):
+    """Too many images queued; the request was rejected without work"""
+
+
+class ImageTooLarge(Exception):
+    """Image exceeds the download limit"""
+
+
+def pick_photo_size(photos, min_resolution: int = PHOTO_MIN_RESOLUTION):
+    """Smallest photo size whose longer side reaches min_resolution
+
+    Telegram sends every photo in several sizes; charts stay readable well
+    below the original resolution, so there is no need to always download
+    the largest one. Falls back to the largest size.
+    """
+    by_area = sorted(photos, key=lambda photo: photo.width * photo.height)
+    for photo in by_area:
+        if max(photo.width, photo.height) >= min_resolution:
+            return photo
+    return by_area[-1]
+
+
+def error_message(error: Exception) -> str:
+    """User-facing text for a failed image request"""
+    if isinstance(error, PipelineBusy):
+        return ERROR_IMAGE_QUEUE_FULL
+    if isinstance(error, ImageTooLarge):
+        return ERROR_IMAGE_TOO_LARGE
+    if isinstance(error, ChartNotFound):
+        return ERROR_CHART_NOT_FOUND
+    return ERROR_PROCESSING_IMAGE
+
+
+class ChartCache:
+    """Chart features by Telegram file_unique_id, with a perceptual hash fallback
+
+    file_unique_id is the same for every forward of a file, so repeats are
+    answered before anything is downloaded. A re-uploaded copy gets a new
+    id but hashes within a few bits of the original, which still saves the
+    analysis. Features are stored under their image hash; ids point to it.
+    """
+
+    def __init__(self, store: LRUCache = None, max_distance: int = CHART_HASH_DISTANCE):
+        self.store = store if store is not None else LRUCache(
+            CHART_CACHE_ENTRIES,
+            CHART_CACHE_MAX_BYTES,
+            directory=CHART_CACHE_DIR or None,
+            max_disk_bytes=CHART_CACHE_DISK_BYTES,
+            name='chart'
+        )
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._hashes = OrderedDict()
+        self._index = None
+        # Hashes of results kept on disk from earlier runs
+        for key in self.store.keys():
+            if key.startswith('hash:'):
+                self._hashes[bytes.fromhex(key[5:])] = None
+
+    def by_id(self, file_unique_id: str):
+        """Features of an already analysed file, or None"""
+        if not file_unique_id:
+            return None
+        digest = self.store.get(f"id:{file_unique_id}")
+        features = self.store.get(f"hash:{digest}") if digest else None
+        metrics.inc('chart_cache_lookups_total', result='id_hit' if features is not None else 'id_miss')
+        return features
+
+    def by_hash(self, digest: bytes):
+        """Features of the nearest known image within max_distance bits, or None"""
+        with self._lock:
+            if self._index is None and self._hashes:
+                keys = list(self._hashes)
+                self._index = (keys, np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(len(keys), -1))
+            index = self._index
+        features = None
+        if index is not None:
+            keys, matrix = index
+            distances = hamming(matrix, digest)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.max_distance:
+                features = self.store.get(f"hash:{keys[best].hex()}")
+        metrics.inc('chart_cache_lookups_total', result='hash_hit' if features is not None else 'hash_miss')
+        return features
+
+    def put(self, file_unique_id: str, digest: bytes, features: dict):
+        """Remember features for an image hash and file id"""
+        self.store.put(f"hash:{digest.hex()}", features)
+        if file_unique_id:
+            self.store.put(f"id:{file_unique_id}", digest.hex())
+        with self._lock:
+            self._hashes[digest] = None
+            self._hashes.move_to_end(digest)
+            while len(self._hashes) > self.store.max_entries:
+                self._hashes.popitem(last=False)
+            self._index = None
+
+
+class ChartPipeline:
+    """Bounded download + analysis pipeline for chart images
+
+    Decoding and analysis are CPU-bound and run in a process pool, so they
+    never hold the GIL of the process handling updates. Requests beyond
+    `max_pending` (queued or in progress) are rejected immediately with
+    PipelineBusy instead of growing an unbounded backlog. Results are
+    cached, so repeated screenshots skip the download and the analysis.
+    """
+
+    def __init__(self, workers: int = PHOTO_WORKERS, max_pending: int = PHOTO_QUEUE_LIMIT,
+                 max_bytes: int = PHOTO_MAX_BYTES, executor=None, cache: ChartCache = None):
+        self.cache = cache or ChartCache()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self._pool = executor
+        self._downloads = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix='photo-download')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def depth(self) -> int:
+        """Images queued or in progress"""
+        return self._pending
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned workers do not inherit the bot's threads and locks,
+                # and do not outlive the bot if it is killed
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=exit_with_parent
+                )
+            return self._pool
+
+    def _acquire(self, file_size):
+        """Reserve a pipeline slot or reject the request"""
+        if file_size and file_size > self.max_bytes:
+            metrics.inc('photo_rejected_total', reason='too_large')
+            raise ImageTooLarge(f"{file_size} bytes")
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.inc('photo_rejected_total', reason='busy')
+                logger.warning(f"Photo pipeline full ({self._pending} pending), rejecting request")
+                raise PipelineBusy(f"{self._pending} images pending")
+            self._pending += 1
+            metrics.set('photo_queue_depth', self._pending)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+            metrics.set('photo_queue_depth', self._pending)
+
+    def _hash(self, data: bytes) -> Future:
+        """Hash downloaded bytes in the process pool (decoding them holds the GIL)"""
+        if len(data) > self.max_bytes:
+            raise ImageTooLarge(f"{len(data)} bytes")
+        metrics.inc('photo_download_bytes_total', len(data))
+        return self._executor().submit(image_hash, data)
+
+    def _analyze(self, data: bytes) -> Future:
+        """Start the analysis of downloaded bytes in the process pool"""
+        return self._executor().submit(analyze_chart_image, data)
+
+    def _cached(self, file_unique_id: str, render):
+        """Future of a cached result for the file, or None"""
+        features = self.cache.by_id(file_unique_id)
+        if features is None:
+            return None
+        result = Future()
+        try:
+            result.set_result(render(features) if render else features)
+        except Exception as e:
+            result.set_exception(e)
+        return result
+
+    def submit(self, download, file_id: str, file_size: int = None, render=None,
+               file_unique_id: str = None) -> Future:
+        """Download and analyze an image in the background
+
+        download(file_id) returns the image bytes and runs on a download
+        thread. The returned Future resolves to the chart features, passed
+        through render() when given. Raises PipelineBusy or ImageTooLarge
+        right away when the request cannot be taken.
+        """
+        cached = self._cached(file_unique_id, render)
+        if cached is not None:
+            return cached
+        self._acquire(file_size)
+        result = Future()
+
+        def deliver(features):
+            result.set_result(render(features) if render else features)
+
+        def finish(digest, analysis: Future):
+            try:
+                features = analysis.result()
+                self.cache.put(file_unique_id, digest, features)
+                deliver(features)
+            except Exception as e:
+                result.set_exception(e)
+            finally:
+                self._release()
+
+        def fetch():
+            try:
+                data = download(file_id)
+                # Each pending request has a download thread of its own, so
+                # waiting here holds up no other request
+                digest = self._hash(data).result()
+                features = self.cache.by_hash(digest)
+                if features is None:
+                    analysis = self._analyze(data)
+            except Exception as e:
+                self._release()
+                result.set_exception(e)
+                return
+            if features is None:
+                analysis.add_done_callback(lambda done: finish(digest, done))
+                return
+            # A copy of an image analysed before
+            self._release()
+            try:
+                self.cache.put(file_unique_id, digest, features)
+                deliver(features)
+            except Exception as e:
+                result.set_exception(e)
+
+        self._downloads.submit(fetch)
+        return result
+
+    def submit_async(self, download, file_id: str, file_size: int = None, render=None,
+                     file_unique_id: str = None):
+        """Asyncio variant of submit(); download is a coroutine function
+
+        The slot is reserved immediately, so the returned coroutine must be
+        awaited to release it.
+        """
+        cached = self._cached(file_unique_id, render)
+        if cached is not None:
+            return asyncio.wrap_future(cached)
+        self._acquire(file_size)
+        return self._run_async(download, file_id, render, file_unique_id)
+
+    async def _run_async(self, download, file_id: str, render, file_unique_id: str):
+        try:
+            data = await download(file_id)
+            digest = await asyncio.wrap_future(self._hash(data))
+            features = self.cache.by_hash(digest)
+            if features is None:
+                features = await asyncio.wrap_future(self._analyze(data))
+            self.cache.put(file_unique_id, digest, features)
+            return render(features) if render else features
+        finally:
+            self._release()
+
+    def shutdown(self):
+        """Stop worker processes and download threads"""
+        self._downloads.shutdown(wait=False, cancel_futures=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
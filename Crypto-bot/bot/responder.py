@@ -0,0 +1,110 @@
+"""
+Adaptive reply strategy for analysis requests
+"""
+
+from bot.messages import SUCCESS_ANALYSIS_STARTED
+from bot.outbox import Outbox, PRIORITY_PLACEHOLDER
+from utils.metrics import metrics
+from config import RESPONSE_LATENCY_BUDGET
+
+# Telegram shows a chat action for about five seconds
+TYPING_INDICATOR_SECONDS = 5.0
+
+
+class Responder:
+    """Deliver analysis results with as few Bot API calls as possible
+
+    The "processing" placeholder is queued with a delay equal to the latency
+    budget. If the result is ready first, the edit is merged into the still
+    queued placeholder and the result goes out as a single sendMessage.
+    Otherwise the placeholder is shown and then edited in place, which is
+    two calls instead of send + delete + send.
+
+    Slow paths (chart images) start with a typing indicator and only fall
+    back to the placeholder once the indicator has expired.
+    """
+
+    def __init__(self, outbox: Outbox, latency_budget: float = RESPONSE_LATENCY_BUDGET):
+        self.outbox = outbox
+        self.latency_budget = latency_budget
+
+    def _start(self, handler: str, chat_id, slow: bool):
+        metrics.inc('handler_requests_total', handler=handler)
+        delay = self.latency_budget
+        if slow:
+            self.outbox.send_chat_action(chat_id, 'typing', handler=handler)
+            delay = max(delay, TYPING_INDICATOR_SECONDS)
+        return self.outbox.send_message(
+            chat_id,
+            SUCCESS_ANALYSIS_STARTED,
+            priority=PRIORITY_PLACEHOLDER,
+            handler=handler,
+            delay=delay
+        )
+
+    def _finish(self, handler: str, chat_id, placeholder, result: str, kwargs: dict):
+        return self.outbox.edit_message_text(result, chat_id, placeholder, handler=handler, **kwargs)
+
+    def send(self, handler: str, chat_id, text: str, **kwargs):
+        """Send a ready-made reply"""
+        metrics.inc('handler_requests_total', handler=handler)
+        return self.outbox.send_message(chat_id, text, handler=handler, **kwargs)
+
+    def reply(self, handler: str, chat_id, compute, *args, slow: bool = False, **kwargs):
+        """Run compute(*args) and deliver its text; kwargs go to the API call"""
+        placeholder = self._start(handler, chat_id, slow)
+        try:
+            result = compute(*args)
+        except Exception:
+            self.outbox.delete_message(chat_id, placeholder, handler=handler)
+            raise
+        return self._finish(handler, chat_id, placeholder, result, kwargs)
+
+    def reply_future(self, handler: str, chat_id, future, slow: bool = False, on_error=None, **kwargs):
+        """Deliver the text of a concurrent Future when it completes
+
+        Returns at once; the handler thread is not held while the result is
+        computed elsewhere. On failure the placeholder is dropped and
+        on_error(exception) is called.
+        """
+        placeholder = self._start(handler, chat_id, slow)
+
+        def deliver(done):
+            try:
+                result = done.result()
+            except Exception as e:
+                self.outbox.delete_message(chat_id, placeholder, handler=handler)
+                if on_error is not None:
+                    on_error(e)
+                return
+            self._finish(handler, chat_id, placeholder, result, kwargs)
+
+        future.add_done_callback(deliver)
+        return placeholder
+
+    async def reply_async(self, handler: str, chat_id, pending, slow: bool = False, **kwargs):
+        """Await the pending result and deliver its text"""
+        placeholder = self._start(handler, chat_id, slow)
+        try:
+            result = await pending
+        except Exception:
+            self.outbox.delete_message(chat_id, placeholder, handler=handler)
+            raise
+        return self._finish(handler, chat_id, placeholder, result, kwargs)
+
+
+def api_calls_per_request() -> dict:
+    """Bot API calls per handled request, by handler"""
+    calls = {}
+    requests = {}
+    for key, value in metrics.snapshot().items():
+        name, _, labels = key.partition('{')
+        if name not in ('telegram_api_calls_total', 'handler_requests_total'):
+            continue
+        handler = labels.split('handler="', 1)[1].split('"', 1)[0]
+        target = calls if name == 'telegram_api_calls_total' else requests
+        target[handler] = target.get(handler, 0) + value
+    return {
+        handler: calls.get(handler, 0) / count
+        for handler, count in requests.items() if count
+    }
@@ -0,0 +1,219 @@
+"""
+Sharded update handling: one receiving process, workers keyed by chat_id
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from market.candles import CandleStore, candle_store, TIME
+from config import SHARD_INDEX, SHARD_COUNT
+
+logger = setup_logger()
+
+# Update fields that carry a message, in the order Telegram documents them
+MESSAGE_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+
+def shard_of(chat_id: int, shards: int) -> int:
+    """Worker handling a chat"""
+    return chat_id % shards
+
+
+def owns_chat(chat_id: int) -> bool:
+    """Whether this process handles the chat (always, unless it is a shard worker)"""
+    return SHARD_COUNT <= 1 or shard_of(chat_id, SHARD_COUNT) == SHARD_INDEX
+
+
+def update_chat_id(update: dict) -> int:
+    """Chat a raw update belongs to; the sender for updates without a chat, else 0"""
+    for field in MESSAGE_FIELDS:
+        message = update.get(field)
+        if message is not None:
+            return message['chat']['id']
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        message = value.get('message')
+        if isinstance(message, dict) and 'chat' in message:
+            return message['chat']['id']
+        chat = value.get('chat')
+        if isinstance(chat, dict):
+            return chat['id']
+        sender = value.get('from') or value.get('user')
+        if isinstance(sender, dict):
+            return sender['id']
+    return 0
+
+
+class ShardRouter:
+    """Hands raw updates to worker processes by chat_id
+
+    Every worker has its own queue and handles its updates one at a time
+    in the order they arrived, so updates of a chat are processed in order
+    while the shards run on separate cores. `target(index, count, queue,
+    ready, reports)` runs in each worker (spawned, so it must be
+    importable), sets the `ready` event once it can handle updates and
+    returns when it reads None. Workers put (index, payload) on `reports`,
+    which are passed to on_report(index, payload) here. Workers that die
+    are started again on the next dispatch, with the updates still queued
+    for them.
+    """
+
+    def __init__(self, workers: int, target, env: dict = None, on_report=None):
+        self.workers = workers
+        self.target = target
+        self.env = dict(env or {})
+        self.on_report = on_report
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.ready = [self._context.Event() for _ in range(workers)]
+        self.reports = self._context.Queue()
+        self.processes = [None] * workers
+        self._lock = threading.Lock()
+
+    def _spawn(self, index: int):
+        # Spawned workers read their settings from the environment at import
+        env = dict(self.env, SHARD_INDEX=str(index), SHARD_COUNT=str(self.workers))
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            # Not a daemon: workers start process pools of their own
+            process = self._context.Process(target=self.target, name=f"shard-{index}",
+                                            args=(index, self.workers, self.queues[index], self.ready[index],
+                                                  self.reports))
+            process.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self.processes[index] = process
+
+    def start(self, timeout: float = 60.0):
+        """Start the workers and wait until they are ready"""
+        threading.Thread(target=self._follow_reports, name='shard-reports', daemon=True).start()
+        with self._lock:
+            for index in range(self.workers):
+                self._spawn(index)
+        deadline = time.monotonic() + timeout
+        for index, ready in enumerate(self.ready):
+            if not ready.wait(max(0.0, deadline - time.monotonic())):
+                logger.warning(f"Shard worker {index} is not ready after {timeout:.0f}s")
+        return self
+
+    def _check(self):
+        """Restart dead workers (lock held)"""
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Shard worker {index} exited with code {process.exitcode}, restarting")
+                metrics.inc('shard_restarts_total', shard=str(index))
+                self.ready[index].clear()
+                self._spawn(index)
+
+    def _follow_reports(self):
+        for index, payload in iter(self.reports.get, None):
+            if self.on_report is None:
+                continue
+            try:
+                self.on_report(index, payload)
+            except Exception as e:
+                logger.error(f"Error handling a report of shard worker {index}: {e}")
+
+    def send(self, shards, item):
+        """Queue an item other than updates (e.g. a rendered signal) for some workers"""
+        with self._lock:
+            self._check()
+            for index in shards:
+                self.queues[index].put(item)
+
+    def dispatch(self, updates: list):
+        """Queue raw updates (dicts) for the workers owning their chats"""
+        batches = {}
+        for update in updates:
+            batches.setdefault(shard_of(update_chat_id(update), self.workers), []).append(update)
+        with self._lock:
+            self._check()
+            for index, batch in batches.items():
+                self.queues[index].put(batch)
+                metrics.inc('shard_updates_total', len(batch), shard=str(index))
+
+    def stop(self, timeout: float = 10.0):
+        """Let workers finish their queues, then stop them"""
+        with self._lock:
+            for queue in self.queues:
+                queue.put(None)
+            deadline = time.monotonic() + timeout
+            for process in self.processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
+            self.reports.put(None)
+
+
+class StoreFollower:
+    """Follows a candle store written by another process
+
+    A worker keeps its own indicator states and idea tracker, but the
+    candles are filled by the receiving process. Every `interval` seconds
+    this compares each series with what it saw last: candles that closed
+    since go to the indicator engine, and the latest close of each symbol
+    that changed to on_price(symbol, price).
+    """
+
+    def __init__(self, engine, store: CandleStore = None, on_price=None, interval: float = 1.0):
+        self.engine = engine
+        self.store = store or candle_store
+        self.on_price = on_price
+        self.interval = interval
+        self._seen = {}
+        self._prices = {}
+        self._running = False
+
+    def poll(self) -> int:
+        """Catch up once; returns the number of closed candles fed"""
+        fed = 0
+        for (symbol, timeframe), buffer in self.store.items():
+            last = buffer.last_time
+            seen = self._seen.get((symbol, timeframe), 0.0)
+            if last == seen:
+                continue
+            self._seen[(symbol, timeframe)] = last
+            if not seen:
+                self.engine.backfill(symbol, timeframe)
+                continue
+            window = buffer.window()
+            closed = window[:, (window[TIME] >= seen) & (window[TIME] < last)]
+            for candle in closed.T.copy():
+                self.engine.on_candle_closed(symbol, timeframe, candle)
+            fed += closed.shape[1]
+        if self.on_price is not None:
+            for symbol in self.store.symbols:
+                price = self.store.last_price(symbol)
+                if price is None or price == self._prices.get(symbol):
+                    continue
+                self._prices[symbol] = price
+                try:
+                    self.on_price(symbol, price)
+                except Exception as e:
+                    logger.error(f"Error handling price update for {symbol}: {e}")
+        return fed
+
+    def _run(self):
+        while self._running:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error following the candle store: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._run, name='store-follower', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
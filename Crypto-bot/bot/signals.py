@@ -0,0 +1,171 @@
+"""
+Scheduled trading signals fanned out to subscribed chats
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from market.candles import TIMEFRAME_SECONDS, candle_open
+from bot.outbox import Outbox
+from bot.subscriptions import SubscriptionRegistry
+from config import TIMEFRAMES, SIGNAL_BATCH, SIGNAL_DELAY
+
+logger = setup_logger()
+
+def last_close(now: float, timeframe: str) -> float:
+    """Close time of the newest finished candle of a timeframe"""
+    return candle_open(now, timeframe)
+
+
+class SignalBroadcaster:
+    """Publishes one signal per series when its candle closes
+
+    A signal is generated and rendered once, only for series with
+    subscribers, then queued for every subscriber through the outbox in
+    batches (one lock acquisition each) on its lowest priority lane, so the
+    global rate limit is shared fairly with interactive replies. Chats that
+    blocked the bot (delivery failed with 403) are unsubscribed together
+    once the fan-out is done.
+    """
+
+    def __init__(self, outbox: Outbox, registry: SubscriptionRegistry, analyzer,
+                 pairs=None, timeframes=TIMEFRAMES,
+                 batch: int = SIGNAL_BATCH, delay: float = SIGNAL_DELAY, clock=time.time):
+        self.outbox = outbox
+        self.registry = registry
+        self.analyzer = analyzer
+        # None: every pair somebody subscribed to
+        self.pairs = list(pairs) if pairs is not None else None
+        self.timeframes = list(timeframes)
+        self.batch = batch
+        self.delay = delay
+        self.clock = clock
+        now = clock() - delay
+        # Candles that closed before startup do not get a signal
+        self._published = {timeframe: last_close(now, timeframe) for timeframe in self.timeframes}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, pair: str, timeframe: str) -> Future:
+        """Generate a signal for one series and queue it for its subscribers
+
+        The returned Future resolves to {'sent': n, 'failed': n} once every
+        subscriber has been served, or None when the series has none.
+        """
+        chat_ids = self.registry.subscribers(pair, timeframe)
+        if not len(chat_ids):
+            done = Future()
+            done.set_result(None)
+            return done
+        return self.deliver(pair, timeframe, self.render(pair, timeframe), chat_ids)
+
+    def render(self, pair: str, timeframe: str) -> str:
+        """Create (and store) the idea of a signal and return its message
+
+        Errors propagate: run_pending() logs them and skips the series.
+        """
+        text = self.analyzer.create_trading_idea(pair, timeframe)['text']
+        metrics.inc('signals_published_total', timeframe=timeframe)
+        return text
+
+    def deliver(self, pair: str, timeframe: str, text: str, chat_ids=None) -> Future:
+        """Queue a rendered signal for the subscribers of its series
+
+        Resolves like publish(); `chat_ids` defaults to the subscribers.
+        """
+        done = Future()
+        if chat_ids is None:
+            chat_ids = self.registry.subscribers(pair, timeframe)
+        if not len(chat_ids):
+            done.set_result(None)
+            return done
+        outcome = {'sent': 0, 'failed': 0}
+        blocked = []
+        lock = threading.Lock()
+
+        def delivered(op, result, error):
+            with lock:
+                outcome['sent' if error is None else 'failed'] += 1
+                if error is not None and getattr(error, 'error_code', None) == 403:
+                    # The user blocked the bot or left the chat
+                    blocked.append(op.chat_id)
+                finished = outcome['sent'] + outcome['failed'] == len(chat_ids)
+            if finished:
+                if blocked:
+                    self.registry.unsubscribe_chats(blocked)
+                metrics.inc('signal_deliveries_total', outcome['sent'], result='sent')
+                metrics.inc('signal_deliveries_total', outcome['failed'], result='failed')
+                done.set_result(dict(outcome))
+
+        for start in range(0, len(chat_ids), self.batch):
+            batch = chat_ids[start:start + self.batch].tolist()
+            self.outbox.broadcast(batch, text, handler='signal', on_done=delivered, parse_mode='HTML')
+        logger.info(f"Signal for {pair} {timeframe} queued for {len(chat_ids)} subscribers")
+        return done
+
+    def run_pending(self) -> int:
+        """Publish signals for every timeframe whose candle closed; returns the count"""
+        now = self.clock() - self.delay
+        published = 0
+        for timeframe in self.timeframes:
+            closed = last_close(now, timeframe)
+            if closed <= self._published[timeframe]:
+                continue
+            self._published[timeframe] = closed
+            for pair in self.pairs if self.pairs is not None else self.registry.subscribed_pairs(timeframe):
+                try:
+                    if self.registry.subscribers(pair, timeframe).size:
+                        self.publish(pair, timeframe)
+                        published += 1
+                except Exception as e:
+                    logger.error(f"Error publishing signal for {pair} {timeframe}: {e}")
+        return published
+
+    def next_run(self) -> float:
+        """Seconds until the next candle close (plus the delay)"""
+        now = self.clock() - self.delay
+        return min(last_close(now, timeframe) + TIMEFRAME_SECONDS[timeframe] - now
+                   for timeframe in self.timeframes)
+
+    def _run(self):
+        while not self._stop.wait(max(self.next_run(), 0.01)):
+            self.run_pending()
+
+    def start(self):
+        """Start the scheduler thread (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='signal-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class ShardSignalBroadcaster(SignalBroadcaster):
+    """Renders each signal once for all shard workers
+
+    Runs in the receiving process of the sharded mode with a
+    ShardSubscriptions registry, so a series gets a signal when any shard
+    has subscribers to it. The signal is rendered (and its idea stored)
+    once, then send(shards, pair, timeframe, text) hands it to those
+    shards, which deliver() it to their own subscribers: every subscriber
+    gets the same idea.
+    """
+
+    def __init__(self, send, registry, analyzer, **kwargs):
+        super().__init__(None, registry, analyzer, **kwargs)
+        self.send = send
+
+    def publish(self, pair: str, timeframe: str):
+        """Render a signal for one series and send it to the shards subscribed to it"""
+        shards = self.registry.subscribers(pair, timeframe)
+        if not len(shards):
+            return None
+        self.send(shards.tolist(), pair, timeframe, self.render(pair, timeframe))
+        logger.info(f"Signal for {pair} {timeframe} sent to {len(shards)} shards")
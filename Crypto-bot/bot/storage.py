@@ -0,0 +1,353 @@
+"""
+SQLite store of users, subscriptions and issued trading ideas
+"""
+
+import atexit
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from config import DATABASE_PATH, STORAGE_BATCH, STORAGE_FLUSH_INTERVAL, IDEA_ID_BLOCK
+
+logger = setup_logger()
+
+# Schema versions, applied in order on open (PRAGMA user_version)
+MIGRATIONS = [
+    """
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        username TEXT,
+        language TEXT,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE subscriptions (
+        chat_id INTEGER NOT NULL,
+        pair TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        created REAL NOT NULL,
+        PRIMARY KEY (chat_id, pair, timeframe)
+    ) WITHOUT ROWID;
+    CREATE TABLE ideas (
+        idea_id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        chat_id INTEGER,
+        pair TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        side INTEGER NOT NULL,
+        entry REAL NOT NULL,
+        tp1 REAL NOT NULL,
+        tp2 REAL NOT NULL,
+        tp3 REAL NOT NULL,
+        stop_loss REAL NOT NULL,
+        risk TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open',
+        created REAL NOT NULL,
+        closed REAL
+    );
+    CREATE INDEX ideas_by_user ON ideas (user_id, idea_id);
+    CREATE INDEX ideas_by_pair ON ideas (pair, timeframe, idea_id);
+    CREATE INDEX ideas_open ON ideas (pair, idea_id) WHERE status = 'open';
+    CREATE TABLE sequences (
+        name TEXT PRIMARY KEY,
+        next INTEGER NOT NULL
+    );
+    INSERT INTO sequences VALUES ('idea', 1);
+    """,
+    # Idea tracking: the message showing the idea, its text and the levels
+    # hit so far (bit i = TP(i+1), bit 3 = stop)
+    """
+    ALTER TABLE ideas ADD COLUMN message_id INTEGER;
+    ALTER TABLE ideas ADD COLUMN hits INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE ideas ADD COLUMN text TEXT;
+    """
+]
+
+UPSERT_USER = """
+    INSERT INTO users (user_id, chat_id, username, language, first_seen, last_seen, requests)
+    VALUES (?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (user_id) DO UPDATE SET
+        chat_id = excluded.chat_id,
+        username = excluded.username,
+        language = excluded.language,
+        last_seen = excluded.last_seen,
+        requests = requests + 1
+"""
+INSERT_SUBSCRIPTION = "INSERT OR IGNORE INTO subscriptions VALUES (?, ?, ?, ?)"
+DELETE_SUBSCRIPTIONS = """
+    DELETE FROM subscriptions
+    WHERE chat_id = ? AND (?2 IS NULL OR pair = ?2) AND (?3 IS NULL OR timeframe = ?3)
+"""
+INSERT_IDEA = """
+    INSERT INTO ideas (idea_id, user_id, chat_id, pair, timeframe, side, entry,
+                       tp1, tp2, tp3, stop_loss, risk, created, text)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+CLOSE_IDEA = "UPDATE ideas SET status = ?, closed = ? WHERE idea_id = ?"
+UPDATE_IDEA_HITS = "UPDATE ideas SET hits = ? WHERE idea_id = ?"
+UPDATE_IDEA_MESSAGE = "UPDATE ideas SET message_id = ? WHERE idea_id = ?"
+
+# Ends the writer thread
+_STOP = object()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Connection in autocommit mode with WAL journaling
+
+    WAL lets readers run while the writer commits; with synchronous=NORMAL
+    a commit only appends to the log, and fsync happens at checkpoints.
+    """
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute("PRAGMA busy_timeout = 5000")
+    return connection
+
+
+def migrate(connection: sqlite3.Connection):
+    """Bring the schema up to the latest version"""
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        connection.executescript(f"BEGIN; {script}; PRAGMA user_version = {number}; COMMIT;")
+        logger.info(f"Database schema migrated to version {number}")
+
+
+class BotStorage:
+    """Users, subscriptions and ideas in one SQLite database
+
+    Handlers never wait for the disk: writes are queued and a background
+    thread commits whatever has accumulated in one transaction (up to
+    `batch` statements, lingering `flush_interval` seconds for more), so
+    the cost of a commit is shared by every write in it. Reads use one
+    connection per thread and see committed data; flush() waits for
+    pending writes. Idea IDs increase monotonically across restarts: blocks
+    of `id_block` IDs are reserved in the database and handed out from
+    memory. Without a path nothing is stored and IDs restart from 1.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, batch: int = STORAGE_BATCH,
+                 flush_interval: float = STORAGE_FLUSH_INTERVAL, id_block: int = IDEA_ID_BLOCK):
+        self.path = path
+        self.batch = batch
+        self.flush_interval = flush_interval
+        self.id_block = id_block
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writer = None
+        self._sequence_connection = None
+        self._thread = None
+        self._next_id = self._id_limit = 1
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self):
+        """Open the database and start the writer thread (idempotent)"""
+        with self._lock:
+            if self._thread is None and self.path:
+                self._writer = connect(self.path)
+                migrate(self._writer)
+                self._thread = threading.Thread(target=self._run, name='storage-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+                logger.info(f"Database opened: {self.path}")
+        return self
+
+    def _write(self, sql: str, params: tuple):
+        if self.path:
+            self._queue.put((sql, params))
+
+    def _run(self):
+        while True:
+            writes = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(writes) < self.batch and writes[-1] is not _STOP:
+                try:
+                    writes.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self._commit([write for write in writes if isinstance(write, tuple)])
+            for write in writes:
+                if isinstance(write, threading.Event):
+                    write.set()
+            if writes[-1] is _STOP:
+                return
+
+    def _commit(self, writes: list):
+        """Run the writes in one transaction, consecutive equal statements via executemany"""
+        if not writes:
+            return
+        started = time.perf_counter()
+        try:
+            self._execute(writes)
+        except sqlite3.Error as e:
+            # Retry one by one so a single bad row does not lose the batch
+            logger.error(f"Error committing {len(writes)} writes, retrying one by one: {e}")
+            for write in writes:
+                try:
+                    self._execute([write])
+                except sqlite3.Error as e:
+                    metrics.inc('storage_errors_total')
+                    logger.error(f"Error writing to database: {e}")
+        metrics.inc('storage_writes_total', len(writes))
+        metrics.inc('storage_commits_total')
+        metrics.inc('storage_commit_seconds_total', time.perf_counter() - started)
+        metrics.set('storage_queue_depth', self._queue.qsize())
+
+    def _execute(self, writes: list):
+        connection = self._writer
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, group in itertools.groupby(writes, key=lambda write: write[0]):
+                connection.executemany(sql, [params for _, params in group])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every write queued so far is committed"""
+        if self._thread is None:
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Commit pending writes and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+        self._writer.close()
+        atexit.unregister(self.close)
+
+    def _reader(self) -> sqlite3.Connection:
+        """Read-only connection of the calling thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            self.start()
+            connection = self._local.connection = connect(self.path)
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        if not self.path:
+            return []
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    def next_idea_id(self) -> int:
+        """Next idea ID, unique and increasing across restarts"""
+        if self.path and self._thread is None:
+            self.start()
+        with self._lock:
+            if self._next_id >= self._id_limit:
+                self._reserve_ids()
+            idea_id = self._next_id
+            self._next_id += 1
+            return idea_id
+
+    def _reserve_ids(self):
+        """Claim the next block of IDs (lock held)"""
+        if not self.path:
+            self._id_limit = self._next_id + self.id_block
+            return
+        connection = self._sequences()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            start = connection.execute("SELECT next FROM sequences WHERE name = 'idea'").fetchone()[0]
+            # Never reuse IDs of ideas stored by other means
+            start = max(start, connection.execute("SELECT COALESCE(MAX(idea_id), 0) + 1 FROM ideas").fetchone()[0])
+            connection.execute("UPDATE sequences SET next = ? WHERE name = 'idea'", (start + self.id_block,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._next_id, self._id_limit = start, start + self.id_block
+
+    def _sequences(self) -> sqlite3.Connection:
+        """Connection used for ID reservations (lock held)"""
+        if self._sequence_connection is None:
+            self._sequence_connection = connect(self.path)
+        return self._sequence_connection
+
+    def record_user(self, user, chat_id: int):
+        """Remember a Telegram user and count the request"""
+        now = time.time()
+        self._write(UPSERT_USER, (user.id, chat_id, user.username, user.language_code, now, now))
+
+    def record_update(self, update):
+        """record_user() for a message or callback query"""
+        if update.from_user is None:
+            return
+        message = update if hasattr(update, 'chat') else update.message
+        chat_id = message.chat.id if message is not None else update.from_user.id
+        self.record_user(update.from_user, chat_id)
+
+    def record_idea(self, idea_id: int, pair: str, timeframe: str, side: int, entry: float,
+                    take_profits, stop_loss: float, risk: str, chat_id: int = None, user_id: int = None,
+                    text: str = None):
+        """Store an issued idea as open"""
+        tp1, tp2, tp3 = take_profits
+        self._write(INSERT_IDEA, (idea_id, user_id, chat_id, pair, timeframe, side, entry,
+                                  tp1, tp2, tp3, stop_loss, risk, time.time(), text))
+
+    def set_idea_message(self, idea_id: int, message_id: int):
+        """Remember the message that shows an idea"""
+        self._write(UPDATE_IDEA_MESSAGE, (message_id, idea_id))
+
+    def set_idea_hits(self, idea_id: int, hits: int):
+        """Levels of an idea hit so far (bit mask)"""
+        self._write(UPDATE_IDEA_HITS, (hits, idea_id))
+
+    def close_idea(self, idea_id: int, status: str):
+        """Mark an idea as no longer open ('tp3', 'stopped', 'expired', ...)"""
+        self._write(CLOSE_IDEA, (status, time.time(), idea_id))
+
+    def subscribe(self, chat_id: int, pair: str, timeframe: str):
+        self._write(INSERT_SUBSCRIPTION, (chat_id, pair, timeframe, time.time()))
+
+    def unsubscribe(self, chat_id: int, pair: str = None, timeframe: str = None):
+        """Remove matching subscriptions of a chat (all when no pair is given)"""
+        self._write(DELETE_SUBSCRIPTIONS, (chat_id, pair, timeframe))
+
+    def subscriptions(self) -> list:
+        """All (chat_id, pair, timeframe) subscriptions"""
+        return [(row['chat_id'], row['pair'], row['timeframe'])
+                for row in self._query("SELECT chat_id, pair, timeframe FROM subscriptions")]
+
+    def user(self, user_id: int):
+        """Stored user row, or None"""
+        rows = self._query("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        return rows[0] if rows else None
+
+    def user_ideas(self, user_id: int, limit: int = 10) -> list:
+        """Newest ideas issued to a user"""
+        return self._query("SELECT * FROM ideas WHERE user_id = ? ORDER BY idea_id DESC LIMIT ?", (user_id, limit))
+
+    def pair_ideas(self, pair: str, timeframe: str, limit: int = 10) -> list:
+        """Newest ideas for a series"""
+        return self._query(
+            "SELECT * FROM ideas WHERE pair = ? AND timeframe = ? ORDER BY idea_id DESC LIMIT ?",
+            (pair, timeframe, limit)
+        )
+
+    def open_ideas(self, pair: str = None) -> list:
+        """Ideas still open, optionally of one pair"""
+        if pair is None:
+            return self._query("SELECT * FROM ideas WHERE status = 'open' ORDER BY idea_id")
+        return self._query("SELECT * FROM ideas WHERE status = 'open' AND pair = ? ORDER BY idea_id", (pair,))
+
+
+# Shared store for the whole bot process
+bot_storage = BotStorage()
@@ -0,0 +1,257 @@
+"""
+Signal subscriptions of chats by trading pair and timeframe
+"""
+
+import fcntl
+import json
+import os
+import threading
+import numpy as np
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from bot.storage import BotStorage, bot_storage
+from bot.sharding import owns_chat
+from market.symbols import symbol_registry
+from bot.messages import (
+    SUBSCRIBE_USAGE,
+    SUBSCRIBE_DONE,
+    SUBSCRIBE_EXISTS,
+    UNSUBSCRIBE_DONE,
+    UNSUBSCRIBE_NONE,
+    SUBSCRIPTIONS_LIST,
+    SUBSCRIPTIONS_EMPTY
+)
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES, SUBSCRIPTIONS_FILE, SIGNAL_DEFAULT_TIMEFRAME
+
+logger = setup_logger()
+
+QUOTE = 'USDT'
+
+
+class InvalidSubscription(ValueError):
+    """Command arguments do not name a known pair or timeframe"""
+
+
+def parse_subscription(args: str, pairs=None, timeframes=TIMEFRAMES):
+    """'btc 4h' -> ('BTC/USDT', '4h')
+
+    Accepts BTC/USDT, BTCUSDT or BTC; the timeframe is None when omitted.
+    Without `pairs`, any pair trading in the symbol registry is accepted.
+    """
+    pair = timeframe = None
+    for token in args.split():
+        lowered = token.lower()
+        if lowered in timeframes:
+            timeframe = lowered
+            continue
+        symbol = token.upper().lstrip('$')
+        if '/' not in symbol:
+            base = symbol[:-len(QUOTE)] if symbol.endswith(QUOTE) and symbol != QUOTE else symbol
+            symbol = f"{base}/{QUOTE}"
+        if not (symbol_registry.is_trading(symbol) if pairs is None else symbol in pairs):
+            raise InvalidSubscription(token)
+        pair = symbol
+    if pair is None:
+        raise InvalidSubscription(args)
+    return pair, timeframe
+
+
+class SubscriptionRegistry:
+    """Chats subscribed to each (pair, timeframe) series
+
+    Fan-out reads the subscribers of a series as a NumPy array, built once
+    after every change and shared by all readers until the next one. With a
+    path, the registry is loaded from and saved to a JSON file; with a
+    database, changes are also written there and loaded back on start.
+    A shard worker only loads the chats it owns and, since the file is
+    shared, saves by merging its chats into the file under a file lock.
+    on_change(series) is called with series() after every change.
+    """
+
+    def __init__(self, path: str = SUBSCRIPTIONS_FILE, storage: BotStorage = None, on_change=None):
+        self.path = path
+        self.storage = storage if storage is not None else bot_storage
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._chats = {}
+        self._arrays = {}
+        if path and os.path.exists(path):
+            self.load()
+        if self.storage.enabled:
+            for chat_id, pair, timeframe in self.storage.subscriptions():
+                if owns_chat(chat_id):
+                    self._chats.setdefault((pair, timeframe), set()).add(chat_id)
+
+    def subscribe(self, chat_id: int, pair: str, timeframe: str) -> bool:
+        """Add a subscription; False if it already existed"""
+        with self._lock:
+            chats = self._chats.setdefault((pair, timeframe), set())
+            if chat_id in chats:
+                return False
+            chats.add(chat_id)
+            self._arrays.pop((pair, timeframe), None)
+        self.storage.subscribe(chat_id, pair, timeframe)
+        self._changed()
+        return True
+
+    def unsubscribe(self, chat_id: int, pair: str = None, timeframe: str = None) -> int:
+        """Remove matching subscriptions of a chat (all when no pair is given)"""
+        removed = 0
+        with self._lock:
+            for key, chats in self._chats.items():
+                if pair is not None and key[0] != pair:
+                    continue
+                if timeframe is not None and key[1] != timeframe:
+                    continue
+                if chat_id in chats:
+                    chats.discard(chat_id)
+                    self._arrays.pop(key, None)
+                    removed += 1
+        if removed:
+            self.storage.unsubscribe(chat_id, pair, timeframe)
+            self._changed()
+        return removed
+
+    def unsubscribe_chats(self, chat_ids) -> int:
+        """Remove every subscription of several chats, saving once"""
+        chat_ids = set(chat_ids)
+        removed = 0
+        with self._lock:
+            for key, chats in self._chats.items():
+                if not chats.isdisjoint(chat_ids):
+                    removed += len(chats & chat_ids)
+                    chats -= chat_ids
+                    self._arrays.pop(key, None)
+        if removed:
+            for chat_id in chat_ids:
+                self.storage.unsubscribe(chat_id, None, None)
+            self._changed()
+        return removed
+
+    def subscriptions(self, chat_id: int) -> list:
+        """(pair, timeframe) series a chat is subscribed to"""
+        with self._lock:
+            return sorted(key for key, chats in self._chats.items() if chat_id in chats)
+
+    def series(self) -> list:
+        """(pair, timeframe) series with subscribers"""
+        with self._lock:
+            return sorted(key for key, chats in self._chats.items() if chats)
+
+    def subscribed_pairs(self, timeframe: str) -> list:
+        """Pairs with subscribers on a timeframe"""
+        with self._lock:
+            return sorted(pair for (pair, series_timeframe), chats in self._chats.items()
+                          if series_timeframe == timeframe and chats)
+
+    def subscribers(self, pair: str, timeframe: str) -> np.ndarray:
+        """Chat ids subscribed to a series (read-only array)"""
+        key = (pair, timeframe)
+        with self._lock:
+            array = self._arrays.get(key)
+            if array is None:
+                array = np.fromiter(self._chats.get(key, ()), dtype=np.int64)
+                array.flags.writeable = False
+                self._arrays[key] = array
+            return array
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(chats) for chats in self._chats.values())
+
+    def _changed(self):
+        metrics.set('signal_subscriptions', len(self))
+        if self.path:
+            self.save()
+        if self.on_change is not None:
+            self.on_change(self.series())
+
+    def save(self):
+        """Write all subscriptions to the JSON file atomically"""
+        with self._lock:
+            data = {f"{pair} {timeframe}": set(chats) for (pair, timeframe), chats in self._chats.items() if chats}
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(f"{self.path}.lock", 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # Keep the chats of other shards
+                for key, chats in self._read().items():
+                    data.setdefault(key, set()).update(chat_id for chat_id in chats if not owns_chat(chat_id))
+                with open(temp, 'w') as f:
+                    json.dump({key: sorted(chats) for key, chats in data.items() if chats}, f)
+                os.replace(temp, self.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error saving subscriptions: {e}")
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def load(self):
+        """Replace subscriptions with the contents of the JSON file"""
+        try:
+            data = self._read()
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading subscriptions: {e}")
+            return
+        with self._lock:
+            self._chats = {
+                tuple(key.split(' ', 1)): {chat_id for chat_id in chats if owns_chat(chat_id)}
+                for key, chats in data.items()
+            }
+            self._arrays = {}
+
+
+class ShardSubscriptions:
+    """Series with subscribers in each shard worker, as the workers report them
+
+    Stands in for a SubscriptionRegistry in the receiving process of the
+    sharded mode: subscribers() returns the shards (not the chats) with
+    subscribers to a series.
+    """
+
+    def __init__(self, shards: int):
+        self._lock = threading.Lock()
+        self._series = [frozenset()] * shards
+
+    def update(self, shard: int, series):
+        """Replace the series a shard has subscribers for"""
+        with self._lock:
+            self._series[shard] = frozenset(tuple(key) for key in series)
+
+    def subscribed_pairs(self, timeframe: str) -> list:
+        """Pairs with subscribers on a timeframe in any shard"""
+        with self._lock:
+            return sorted({pair for series in self._series for pair, series_timeframe in series
+                           if series_timeframe == timeframe})
+
+    def subscribers(self, pair: str, timeframe: str) -> np.ndarray:
+        """Shards with subscribers to a series"""
+        with self._lock:
+            return np.array([shard for shard, series in enumerate(self._series) if (pair, timeframe) in series],
+                            dtype=np.int64)
+
+
+def subscription_reply(registry: SubscriptionRegistry, command: str, chat_id: int, args: str) -> str:
+    """Apply /subscribe, /unsubscribe or /subscriptions and return the reply text"""
+    if command == 'subscriptions':
+        keys = registry.subscriptions(chat_id)
+        if not keys:
+            return SUBSCRIPTIONS_EMPTY
+        return SUBSCRIPTIONS_LIST.format(items="\n".join(f"• {pair} {timeframe}" for pair, timeframe in keys))
+    try:
+        if command == 'unsubscribe' and not args.strip():
+            pair = timeframe = None
+        else:
+            pair, timeframe = parse_subscription(args)
+    except InvalidSubscription:
+        return SUBSCRIBE_USAGE.format(pairs=', '.join(DEFAULT_TRADING_PAIRS), timeframes=', '.join(TIMEFRAMES))
+    if command == 'unsubscribe':
+        removed = registry.unsubscribe(chat_id, pair, timeframe)
+        return UNSUBSCRIBE_DONE.format(count=removed) if removed else UNSUBSCRIBE_NONE
+    timeframe = timeframe or SIGNAL_DEFAULT_TIMEFRAME
+    if registry.subscribe(chat_id, pair, timeframe):
+        return SUBSCRIBE_DONE.format(pair=pair, timeframe=timeframe)
+    return SUBSCRIBE_EXISTS.format(pair=pair, timeframe=timeframe)
@@ -0,0 +1,266 @@
+"""
+Live tracking of open trading ideas: TP/SL hit detection and notifications
+"""
+
+import functools
+import heapq
+import threading
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from bot.outbox import Outbox, OutboundOp
+from bot.storage import BotStorage, bot_storage
+from bot.sharding import owns_chat
+from bot.messages import (
+    IDEA_TARGETS_HIT,
+    IDEA_STOPPED,
+    IDEA_STATUS,
+    IDEA_STATUS_OPEN,
+    IDEA_STATUS_DONE,
+    IDEA_STATUS_STOPPED
+)
+
+logger = setup_logger()
+
+# Level numbers within an idea; bit i of `hits` is set once level i is hit
+TP1, TP2, TP3, STOP = range(4)
+LEVEL_NAMES = ('TP1', 'TP2', 'TP3', 'SL')
+
+# Heaps are rebuilt once this share of their entries belongs to closed ideas
+STALE_SHARE = 0.5
+
+
+class LevelIndex:
+    """Pending price levels of one pair
+
+    Levels reached when the price rises (LONG targets, SHORT stops) are in
+    a min-heap, levels reached when it falls in a max-heap. A tick compares
+    the price with the two heap tops only, so it costs O(1) without hits
+    and O(log n) per hit; adding an idea is O(log n). Levels of ideas that
+    closed are skipped when they surface, and the heaps are rebuilt once
+    they are mostly stale.
+    """
+
+    def __init__(self):
+        self.rising = []
+        self.falling = []
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self.rising) + len(self.falling)
+
+    def add(self, price: float, idea_id: int, level: int, rising: bool):
+        if rising:
+            heapq.heappush(self.rising, (price, idea_id, level))
+        else:
+            heapq.heappush(self.falling, (-price, idea_id, level))
+
+    def pop_hits(self, low: float, high: float) -> list:
+        """Remove and return (idea_id, level, price) of levels within reach"""
+        hits = []
+        rising, falling = self.rising, self.falling
+        while rising and rising[0][0] <= high:
+            price, idea_id, level = heapq.heappop(rising)
+            hits.append((idea_id, level, price))
+        while falling and -falling[0][0] >= low:
+            price, idea_id, level = heapq.heappop(falling)
+            hits.append((idea_id, level, -price))
+        return hits
+
+    def compact(self, pending):
+        """Drop entries for which pending(idea_id, level) is false"""
+        self.rising = [entry for entry in self.rising if pending(entry[1], entry[2])]
+        self.falling = [entry for entry in self.falling if pending(entry[1], entry[2])]
+        heapq.heapify(self.rising)
+        heapq.heapify(self.falling)
+        self.stale = 0
+
+
+def mark_levels(idea: dict) -> str:
+    """Idea message with hit levels ticked and a status line"""
+    text = idea['text'].rstrip('\n')
+    hits = idea['hits']
+    tp1, tp2, tp3, stop_loss = idea['levels']
+    for level, price in ((TP1, tp1), (TP2, tp2), (TP3, tp3)):
+        if hits & (1 << level):
+            text = text.replace(f"• {LEVEL_NAMES[level]}: {price}", f"• {LEVEL_NAMES[level]}: {price} ✅", 1)
+    if hits & (1 << STOP):
+        text = text.replace(f"<b>🛡️ Стоп-лосс:</b> {stop_loss}", f"<b>🛡️ Стоп-лосс:</b> {stop_loss} ❌", 1)
+        status = IDEA_STATUS_STOPPED
+    elif hits & (1 << TP3):
+        status = IDEA_STATUS_DONE
+    else:
+        status = IDEA_STATUS_OPEN.format(levels=", ".join(
+            LEVEL_NAMES[level] for level in (TP1, TP2, TP3) if hits & (1 << level)
+        ))
+    return text + "\n" + IDEA_STATUS.format(status=status)
+
+
+class IdeaTracker:
+    """Watches the levels of open ideas and reports hits to their chats
+
+    Prices come from on_price() (a tick) or on_price_range() (the low and
+    high seen since the last call). A hit sends a notification in reply to
+    the idea message and edits that message to tick the level off. An idea
+    closes at TP3 or at its stop; when a stop and a target are both within
+    the same range, the stop is taken to have come first. Open ideas are
+    reloaded from the database on start.
+    """
+
+    def __init__(self, outbox: Outbox, storage: BotStorage = None):
+        self.outbox = outbox
+        self.storage = storage if storage is not None else bot_storage
+        self._lock = threading.Lock()
+        self._ideas = {}
+        self._messages = {}
+        self._index = {}
+        if self.storage.enabled:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._ideas)
+
+    def load(self) -> int:
+        """Track the open ideas stored in the database"""
+        loaded = 0
+        for row in self.storage.open_ideas():
+            if row['chat_id'] is None or row['text'] is None or not owns_chat(row['chat_id']):
+                continue
+            idea = {
+                'idea_id': row['idea_id'],
+                'chat_id': row['chat_id'],
+                'pair': row['pair'],
+                'trade_type': 'LONG' if row['side'] > 0 else 'SHORT',
+                'side': row['side'],
+                'levels': (row['tp1'], row['tp2'], row['tp3'], row['stop_loss']),
+                'text': row['text']
+            }
+            self._add(idea, row['message_id'], row['hits'])
+            loaded += 1
+        logger.info(f"Tracking {loaded} open ideas")
+        return loaded
+
+    def watch(self, idea: dict, message):
+        """Track an idea shown in its chat
+
+        `message` is the message id, or the outbox operation delivering the
+        idea (the id is filled in once it is sent).
+        """
+        if not isinstance(message, OutboundOp):
+            self.storage.set_idea_message(idea['idea_id'], message)
+            self._add(idea, message, 0)
+            return
+        self._add(idea, None, 0)
+        # An edited placeholder: the idea lives in the placeholder message
+        op = message if message.method == 'send_message' else message.target
+        if isinstance(op, OutboundOp) and op.future is not None:
+            op.future.add_done_callback(functools.partial(self._sent, idea['idea_id']))
+
+    def _add(self, idea: dict, message_id, hits: int):
+        entry = dict(idea, message_id=message_id, hits=hits)
+        side = entry['side']
+        with self._lock:
+            self._ideas[entry['idea_id']] = entry
+            if message_id is not None:
+                self._claim(entry)
+            index = self._index.setdefault(entry['pair'], LevelIndex())
+            for level, price in enumerate(entry['levels']):
+                if not hits & (1 << level):
+                    # Targets are reached in the direction of the trade, the stop against it
+                    index.add(price, entry['idea_id'], level, (side > 0) == (level != STOP))
+            metrics.set('ideas_tracked', len(self._ideas))
+
+    def _claim(self, entry: dict):
+        """Bind a message to an idea; an idea it showed before is no longer edited (lock held)"""
+        key = (entry['chat_id'], entry['message_id'])
+        previous = self._ideas.get(self._messages.get(key))
+        if previous is not None and previous is not entry:
+            previous['message_id'] = None
+        self._messages[key] = entry['idea_id']
+
+    def _sent(self, idea_id: int, future):
+        """The idea message was delivered: remember its id"""
+        if future.exception() is not None or future.result() is None:
+            return
+        message_id = future.result().message_id
+        with self._lock:
+            entry = self._ideas.get(idea_id)
+            if entry is not None:
+                entry['message_id'] = message_id
+                self._claim(entry)
+        self.storage.set_idea_message(idea_id, message_id)
+
+    def on_price(self, pair: str, price: float) -> int:
+        """Check a new price of a pair; returns the number of levels hit"""
+        return self.on_price_range(pair, price, price)
+
+    def on_price_range(self, pair: str, low: float, high: float) -> int:
+        """Check the price range traded since the last call"""
+        with self._lock:
+            index = self._index.get(pair)
+            if index is None:
+                return 0
+            hits = index.pop_hits(low, high)
+            if not hits:
+                return 0
+            reached = {}
+            for idea_id, level, price in hits:
+                entry = self._ideas.get(idea_id)
+                if entry is None or entry['hits'] & (1 << level):
+                    index.stale -= 1
+                    continue
+                reached.setdefault(idea_id, []).append((level, price))
+            updates = [self._apply(index, self._ideas[idea_id], levels) for idea_id, levels in reached.items()]
+            if index.stale > len(index) * STALE_SHARE:
+                index.compact(lambda idea_id, level: idea_id in self._ideas
+                              and not self._ideas[idea_id]['hits'] & (1 << level))
+            metrics.set('ideas_tracked', len(self._ideas))
+        for update in updates:
+            self._notify(*update)
+        return sum(len(levels) for _, levels, _ in updates)
+
+    def _apply(self, index: LevelIndex, entry: dict, levels: list):
+        """Record hit levels of an idea (lock held); returns what to notify"""
+        popped = {level for level, _ in levels}
+        stopped = [hit for hit in levels if hit[0] == STOP]
+        if stopped:
+            # A stop within the same range as a target is taken as first
+            levels = stopped
+        for level, _ in levels:
+            entry['hits'] |= 1 << level
+        status = None
+        if stopped:
+            status = 'stopped'
+        elif entry['hits'] & (1 << TP3):
+            status = 'tp3'
+        if status is not None:
+            # Whatever is still pending in the heaps is now stale
+            index.stale += sum(1 for level in range(4) if not entry['hits'] & (1 << level) and level not in popped)
+            del self._ideas[entry['idea_id']]
+            if self._messages.get((entry['chat_id'], entry['message_id'])) == entry['idea_id']:
+                del self._messages[(entry['chat_id'], entry['message_id'])]
+        for level, _ in levels:
+            metrics.inc('idea_levels_hit_total', level=LEVEL_NAMES[level])
+        return dict(entry), levels, status
+
+    def _notify(self, entry: dict, levels: list, status):
+        """Tell the chat about hit levels and update the idea message"""
+        idea_id, chat_id, message_id = entry['idea_id'], entry['chat_id'], entry['message_id']
+        try:
+            self.storage.set_idea_hits(idea_id, entry['hits'])
+            if status is not None:
+                self.storage.close_idea(idea_id, status)
+            template = IDEA_STOPPED if status == 'stopped' else IDEA_TARGETS_HIT
+            text = template.format(
+                idea_id=idea_id,
+                pair=entry['pair'],
+                trade_type=entry['trade_type'],
+                levels=", ".join(LEVEL_NAMES[level] for level, _ in levels),
+                price=levels[-1][1]
+            )
+            reply = {'reply_to_message_id': message_id} if message_id is not None else {}
+            self.outbox.send_message(chat_id, text, handler='tracker', parse_mode='HTML', **reply)
+            if message_id is not None:
+                self.outbox.edit_message_text(mark_levels(entry), chat_id, message_id,
+                                              handler='tracker', parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Error notifying idea #{idea_id} levels: {e}")
@@ -2,144 +2,464 @@
 Trading analysis and signal generation module
 """
 
+import asyncio
+import math
 import random
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime
-from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES, RISK_LEVELS
+from config import (
+    DEFAULT_TRADING_PAIRS,
+    TIMEFRAMES,
+    RISK_LEVELS,
+    IDEA_TAKE_PROFITS,
+    IDEA_STOP_LOSS,
+    ANALYSIS_CACHE_TTL,
+    ANALYSIS_CACHE_REFRESH_AHEAD,
+    SCAN_RESULTS,
+    SCAN_IDEA_TOP,
+    LEVELS_TIMEFRAME,
+    LEVELS_PAIRS
+)
+from utils.cache import TTLCache
+from utils.metrics import metrics
+from nlp.keywords import KeywordMatcher, keyword_matcher
+from market.candles import CandleStore, candle_store
+from market.indicators import IndicatorEngine, indicator_engine
+from market.scanner import MarketScanner, ScanResult
+from market.levels import LevelEngine
+from bot.storage import BotStorage, bot_storage
 from bot.messages import (
     TRADING_IDEA_TEMPLATE, 
     ANALYSIS_RESULT_TEMPLATE,
-    PHOTO_ANALYSIS_TEMPLATE
+    PHOTO_ANALYSIS_TEMPLATE,
+    SCAN_RESULT_TEMPLATE,
+    SCAN_RESULT_ITEM,
+    SCAN_EMPTY,
+    KEY_LEVELS_ITEM,
+    KEY_LEVEL,
+    KEY_LEVELS_NONE
 )
 
+# Cache keys of the shared /analyze snapshot and the latest scan
+MARKET_SNAPSHOT = 'market'
+SCAN_SNAPSHOT = 'scan'
+
+# How extracted price roles are shown to the user
+PRICE_ROLE_NAMES = {
+    'entry': 'вход',
+    'take': 'тейк',
+    'stop': 'стоп',
+    'support': 'поддержка',
+    'resistance': 'сопротивление'
+}
+
 class TradingAnalyzer:
     """Class for generating trading ideas and market analysis"""
     
-    def __init__(self):
+    def __init__(self, store: CandleStore = None, indicators: IndicatorEngine = None,
+                 cache: TTLCache = None, matcher: KeywordMatcher = None, storage: BotStorage = None,
+                 scanner: MarketScanner = None, levels: LevelEngine = None):
         self.trading_pairs = DEFAULT_TRADING_PAIRS
         self.timeframes = TIMEFRAMES
         self.risk_levels = RISK_LEVELS
+        self.store = store or candle_store
+        self.indicators = indicators or indicator_engine
+        self.matcher = matcher or keyword_matcher
+        self.storage = storage if storage is not None else bot_storage
+        self.scanner = scanner or MarketScanner(self.store)
+        self.levels = levels or LevelEngine(self.store)
+        # Idea candidates of the latest scan: (scan, series)
+        self._idea_series = (None, [])
+        # The market view is the same for every user, so it is built once
+        # per TTL and shared
+        self.cache = cache if cache is not None else TTLCache(
+            ANALYSIS_CACHE_TTL,
+            refresh_ahead=ANALYSIS_CACHE_REFRESH_AHEAD,
+            name='analysis'
+        )
     
-    def generate_trading_idea(self) -> str:
-        """Generate a random trading idea"""
-        try:
-            # Select random parameters
-            pair = random.choice(self.trading_pairs)
-            timeframe = random.choice(self.timeframes)
-            trade_type = random.choice(['LONG', 'SHORT'])
-            risk_level = random.choice(['low', 'medium', 'high'])
-            
-            # Generate price levels (simplified simulation)
-            base_price = random.uniform(0.1, 100000)
-            
-            if trade_type == 'LONG':
-                entry_price = round(base_price, 4)
-                tp1 = round(base_price * 1.02, 4)
-                tp2 = round(base_price * 1.05, 4)
-                tp3 = round(base_price * 1.08, 4)
-                stop_loss = round(base_price * 0.97, 4)
-            else:
-                entry_price = round(base_price, 4)
-                tp1 = round(base_price * 0.98, 4)
-                tp2 = round(base_price * 0.95, 4)
-                tp3 = round(base_price * 0.92, 4)
-                stop_loss = round(base_price * 1.03, 4)
-            
-            # Get risk settings
-            risk_settings = self.risk_levels[risk_level]
-            
-            # Generate reasoning
-            reasoning_options = [
-                "Техническая формация указывает на продолжение тренда",
-                "Пробитие ключевого уровня поддержки/сопротивления",
-                "Дивергенция на RSI сигнализирует о развороте",
-                "Формация треугольник завершается",
-                "Объемы подтверждают движение цены",
-                "Уровни Фибоначчи указывают на коррекцию"
+    def warm_cache(self):
+        """Keep the market snapshot and the scan refreshed in the background"""
+        self.cache.warm(SCAN_SNAPSHOT, self.scanner.scan)
+        self.cache.warm(MARKET_SNAPSHOT, self.build_market_analysis)
+    
+    def scan(self) -> ScanResult:
+        """Latest scan of every pair and timeframe (shared, once per TTL)"""
+        return self.cache.get(SCAN_SNAPSHOT, self.scanner.scan)
+    
+    def idea_series(self) -> list:
+        """Series ideas are drawn from: the top scanned setups, or every pair and timeframe"""
+        result = self.scan()
+        scanned, series = self._idea_series
+        if scanned is not result:
+            setups = result.top(SCAN_IDEA_TOP) if SCAN_IDEA_TOP else []
+            series = [(setup['pair'], setup['timeframe']) for setup in setups] or [
+                (pair, timeframe) for pair in self.trading_pairs for timeframe in self.timeframes
             ]
-            reasoning = random.choice(reasoning_options)
-            
-            # Generate idea ID
-            idea_id = random.randint(1000, 9999)
-            
-            # Format the message
-            message = TRADING_IDEA_TEMPLATE.format(
-                idea_id=idea_id,
-                pair=pair,
-                timeframe=timeframe,
-                trade_type=trade_type,
-                entry_price=entry_price,
-                tp1=tp1,
-                tp2=tp2,
-                tp3=tp3,
-                stop_loss=stop_loss,
-                risk_level=risk_level.upper(),
-                leverage=risk_settings['leverage'],
-                reasoning=reasoning,
-                risk_percent=risk_settings['risk_percent'],
-                timestamp=datetime.now().strftime("%d.%m.%Y %H:%M")
-            )
-            
-            return message
-            
+            self._idea_series = (result, series)
+        return series
+    
+    def pick_series(self, pair: str = None, timeframe: str = None) -> tuple:
+        """Series for an idea: one of the top scanned setups, else at random"""
+        if pair and timeframe:
+            return pair, timeframe
+        if not pair and not timeframe:
+            return random.choice(self.idea_series())
+        setups = self.scan().top(SCAN_IDEA_TOP, timeframe=timeframe, symbol=pair) if SCAN_IDEA_TOP else []
+        if setups:
+            setup = random.choice(setups)
+            return setup['pair'], setup['timeframe']
+        return pair or random.choice(self.trading_pairs), timeframe or random.choice(self.timeframes)
+    
+    @metrics.timed('analyzer_seconds', method='describe_indicators')
+    def describe_indicators(self, values: dict) -> list:
+        """Reasoning lines backed by computed indicator values"""
+        reasons = []
+        
+        if values['rsi'] < 30:
+            reasons.append(f"RSI {values['rsi']:.0f} — зона перепроданности")
+        elif values['rsi'] > 70:
+            reasons.append(f"RSI {values['rsi']:.0f} — зона перекупленности")
+        
+        if values['macd_hist'] > 0:
+            reasons.append("MACD выше сигнальной линии — бычий импульс")
+        elif values['macd_hist'] < 0:
+            reasons.append("MACD ниже сигнальной линии — медвежий импульс")
+        
+        if values['stoch_k'] < 20:
+            reasons.append("Перепроданность по Stochastic")
+        elif values['stoch_k'] > 80:
+            reasons.append("Перекупленность по Stochastic")
+        
+        if values['volume_ratio'] > 1.5:
+            reasons.append(f"Объемы подтверждают движение цены (x{values['volume_ratio']:.1f} к среднему)")
+        
+        # Nearest Fibonacci retracement within 1% of the price
+        close = values['close']
+        ratio, level = min(values['fibonacci'].items(), key=lambda item: abs(item[1] - close))
+        if close and abs(level - close) / close < 0.01 and 0 < ratio < 1:
+            reasons.append(f"Цена у уровня Фибоначчи {ratio} ({level:.4f})")
+        
+        return reasons
+    
+    @metrics.timed('analyzer_seconds', method='generate_trading_idea')
+    def generate_trading_idea(self, pair: str = None, timeframe: str = None,
+                              chat_id: int = None, user_id: int = None) -> str:
+        """Generate a trading idea, for a random series unless one is given"""
+        try:
+            return self.create_trading_idea(pair, timeframe, chat_id, user_id)['text']
         except Exception as e:
             return f"❌ Ошибка при генерации торговой идеи: {str(e)}"
     
+    @metrics.timed('analyzer_seconds', method='create_trading_idea')
+    def create_trading_idea(self, pair: str = None, timeframe: str = None,
+                            chat_id: int = None, user_id: int = None) -> dict:
+        """Create a trading idea: its levels and the rendered message
+
+        The idea is stored as open, for the user who asked for it (none for
+        broadcast signals). `levels` holds TP1-TP3 and the stop loss.
+        """
+        return self.issue_trading_idea(self.render_trading_idea(pair, timeframe), chat_id, user_id)
+    
+    @metrics.timed('analyzer_seconds', method='render_trading_idea')
+    def render_trading_idea(self, pair: str = None, timeframe: str = None) -> dict:
+        """Build an idea and its message without storing it
+
+        The idea id is reserved here; issue_trading_idea() stores the idea
+        once it is handed to a chat.
+        """
+        # Select the series among the best setups
+        pair, timeframe = self.pick_series(pair, timeframe)
+        trade_type = random.choice(['LONG', 'SHORT'])
+        risk_level = random.choice(['low', 'medium', 'high'])
+        
+        # Direction follows the MACD histogram when indicators are available
+        indicator_values = self.indicators.snapshot(pair, timeframe)
+        if indicator_values:
+            trade_type = 'LONG' if indicator_values['macd_hist'] >= 0 else 'SHORT'
+        
+        # Price levels from the latest candle of the pair
+        if indicator_values:
+            base_price = indicator_values['close']
+        else:
+            base_price = self.store.last_price(pair)
+        if base_price is None:
+            # No market data yet (simplified simulation)
+            base_price = random.uniform(0.1, 100000)
+        
+        # Levels move with the trade: up for LONG, down for SHORT
+        side = 1 if trade_type == 'LONG' else -1
+        entry_price = round(base_price, 4)
+        tp1, tp2, tp3 = (round(base_price * (1 + side * level), 4) for level in IDEA_TAKE_PROFITS)
+        stop_loss = round(base_price * (1 - side * IDEA_STOP_LOSS), 4)
+        
+        # Get risk settings
+        risk_settings = self.risk_levels[risk_level]
+        
+        # Generate reasoning
+        reasoning_options = [
+            "Техническая формация указывает на продолжение тренда",
+            "Пробитие ключевого уровня поддержки/сопротивления",
+            "Дивергенция на RSI сигнализирует о развороте",
+            "Формация треугольник завершается",
+            "Объемы подтверждают движение цены",
+            "Уровни Фибоначчи указывают на коррекцию"
+        ]
+        reasoning = random.choice(reasoning_options)
+        if indicator_values:
+            reasoning = "\n".join(self.describe_indicators(indicator_values)) or reasoning
+        
+        # Monotonic idea ID
+        idea_id = self.storage.next_idea_id()
+        
+        # Format the message
+        message = TRADING_IDEA_TEMPLATE.format(
+            idea_id=idea_id,
+            pair=pair,
+            timeframe=timeframe,
+            trade_type=trade_type,
+            entry_price=entry_price,
+            tp1=tp1,
+            tp2=tp2,
+            tp3=tp3,
+            stop_loss=stop_loss,
+            risk_level=risk_level.upper(),
+            leverage=risk_settings['leverage'],
+            reasoning=reasoning,
+            risk_percent=risk_settings['risk_percent'],
+            timestamp=datetime.now().strftime("%d.%m.%Y %H:%M")
+        )
+        
+        return {
+            'idea_id': idea_id,
+            'chat_id': None,
+            'pair': pair,
+            'timeframe': timeframe,
+            'trade_type': trade_type,
+            'side': side,
+            'entry': entry_price,
+            'levels': (tp1, tp2, tp3, stop_loss),
+            'risk_level': risk_level,
+            'text': message
+        }
+    
+    def issue_trading_idea(self, idea: dict, chat_id: int = None, user_id: int = None) -> dict:
+        """Store a rendered idea as open for the chat it is shown in"""
+        tp1, tp2, tp3, stop_loss = idea['levels']
+        self.storage.record_idea(
+            idea['idea_id'], idea['pair'], idea['timeframe'], idea['side'], idea['entry'],
+            (tp1, tp2, tp3), stop_loss, idea['risk_level'],
+            chat_id=chat_id, user_id=user_id, text=idea['text']
+        )
+        return dict(idea, chat_id=chat_id)
+        
+    
+    @metrics.timed('analyzer_seconds', method='analyze_market')
     def analyze_market(self) -> str:
-        """Generate market analysis"""
+        """Generate market analysis (shared snapshot, see build_market_analysis)"""
         try:
-            # Generate random market data (in real implementation, this would fetch real data)
-            trends = ['Бычий 📈', 'Медвежий 📉', 'Боковой ↔️']
-            sentiments = ['Жадность 😈', 'Страх 😱', 'Нейтральное 😐', 'Крайняя жадность 🤑']
-            recommendations = ['Покупать', 'Продавать', 'Держать', 'Ждать входа']
-            
-            trend = random.choice(trends)
-            sentiment = random.choice(sentiments)
-            recommendation = random.choice(recommendations)
-            
-            # Generate top cryptos
-            top_cryptos = "\n".join([
-                f"• {pair}: {random.choice(['📈', '📉'])} {random.uniform(-10, 15):.2f}%"
-                for pair in random.sample(self.trading_pairs, 5)
-            ])
-            
-            # Generate key levels
-            key_levels_options = [
-                "Bitcoin: 42,000$ поддержка, 45,000$ сопротивление",
-                "Ethereum: 2,500$ поддержка, 2,800$ сопротивление", 
-                "Общий рынок находится в консолидации",
-                "Ожидается пробитие треугольника на BTC"
-            ]
-            key_levels = random.choice(key_levels_options)
-            
-            # Generate comment
-            comments = [
-                "Рынок показывает признаки стабилизации после недавней волатильности.",
-                "Объемы торгов снижаются, что может указывать на консолидацию.",
-                "Макроэкономические факторы оказывают давление на рынок.",
-                "Техническая картина остается неопределенной."
-            ]
-            comment = random.choice(comments)
-            
-            message = ANALYSIS_RESULT_TEMPLATE.format(
-                trend=trend,
-                sentiment=sentiment,
-                recommendation=recommendation,
-                top_cryptos=top_cryptos,
-                key_levels=key_levels,
-                comment=comment,
-                timestamp=datetime.now().strftime("%d.%m.%Y %H:%M")
-            )
-            
-            return message
-            
+            return self.cache.get(MARKET_SNAPSHOT, self.build_market_analysis)
         except Exception as e:
             return f"❌ Ошибка при анализе рынка: {str(e)}"
     
-    def analyze_photo(self, photo_info: dict) -> str:
-        """Analyze uploaded chart photo"""
+    @metrics.timed('analyzer_seconds', method='build_market_analysis')
+    def build_market_analysis(self) -> str:
+        """Build a fresh market analysis snapshot"""
+        # Generate random market data (in real implementation, this would fetch real data)
+        trends = ['Бычий 📈', 'Медвежий 📉', 'Боковой ↔️']
+        sentiments = ['Жадность 😈', 'Страх 😱', 'Нейтральное 😐', 'Крайняя жадность 🤑']
+        recommendations = ['Покупать', 'Продавать', 'Держать', 'Ждать входа']
+        
+        trend = random.choice(trends)
+        sentiment = random.choice(sentiments)
+        recommendation = random.choice(recommendations)
+        
+        # Top cryptos: the best scanned setup of each pair
+        top_cryptos = "\n".join(
+            f"• {setup['pair']}: {'📈' if setup['side'] > 0 else '📉'} {setup['change'] * 100:+.2f}% "
+            f"({setup['timeframe']} {setup['trade_type']}, R/R {setup['rr']:.1f})"
+            for setup in self.scan().top(5, per_symbol=True)
+        ) or "\n".join([
+            # No market data yet (simplified simulation)
+            f"• {pair}: {random.choice(['📈', '📉'])} {random.uniform(-10, 15):.2f}%"
+            for pair in random.sample(self.trading_pairs, 5)
+        ])
+        
+        # Key levels of the top pairs from their volume profile and swing points
+        key_levels = self.describe_key_levels() or random.choice([
+            # No market data yet (simplified simulation)
+            "Bitcoin: 42,000$ поддержка, 45,000$ сопротивление",
+            "Ethereum: 2,500$ поддержка, 2,800$ сопротивление", 
+            "Общий рынок находится в консолидации",
+            "Ожидается пробитие треугольника на BTC"
+        ])
+        
+        # Generate comment
+        comments = [
+            "Рынок показывает признаки стабилизации после недавней волатильности.",
+            "Объемы торгов снижаются, что может указывать на консолидацию.",
+            "Макроэкономические факторы оказывают давление на рынок.",
+            "Техническая картина остается неопределенной."
+        ]
+        comment = random.choice(comments)
+        
+        message = ANALYSIS_RESULT_TEMPLATE.format(
+            trend=trend,
+            sentiment=sentiment,
+            recommendation=recommendation,
+            top_cryptos=top_cryptos,
+            key_levels=key_levels,
+            comment=comment,
+            timestamp=datetime.now().strftime("%d.%m.%Y %H:%M")
+        )
+        
+        return message
+    
+    def format_price(self, pair: str, price: float) -> str:
+        """Price rounded to the pair's tick size (6 significant digits without one)"""
+        symbol_id = self.store.registry.get(pair)
+        tick = self.store.registry.tick_size[symbol_id] if symbol_id is not None else 0.0
+        if tick <= 0:
+            return f"{price:,.6g}"
+        decimals = max(0, -int(math.floor(math.log10(tick) + 1e-9)))
+        return f"{round(price / tick) * tick:,.{decimals}f}"
+    
+    @metrics.timed('analyzer_seconds', method='describe_key_levels')
+    def describe_key_levels(self) -> str:
+        """Support and resistance lines for the pairs of the top setups"""
+        pairs = [setup['pair'] for setup in self.scan().top(LEVELS_PAIRS, per_symbol=True)]
+        lines = []
+        for pair in pairs or self.trading_pairs[:LEVELS_PAIRS]:
+            try:
+                levels = self.levels.levels(pair, LEVELS_TIMEFRAME)
+            except KeyError:
+                levels = None
+            if not levels:
+                continue
+            sides = {
+                side: ", ".join(KEY_LEVEL.format(price=self.format_price(pair, level['price']), touches=level['touches'])
+                                for level in levels[side]) or KEY_LEVELS_NONE
+                for side in ('support', 'resistance')
+            }
+            lines.append(KEY_LEVELS_ITEM.format(pair=pair, timeframe=LEVELS_TIMEFRAME, **sides))
+        return "\n".join(lines)
+    
+    @metrics.timed('analyzer_seconds', method='scan_market')
+    def scan_market(self, timeframe: str = None) -> str:
+        """Best setups over every pair (and timeframe, unless one is given)"""
         try:
-            # In a real implementation, this would use computer vision/AI
-            # For now, we'll generate a structured response
+            result = self.scan()
+            setups = result.top(SCAN_RESULTS, timeframe=timeframe)
+            if not setups:
+                return SCAN_EMPTY
+            items = "\n".join(
+                SCAN_RESULT_ITEM.format(rank=rank, emoji='📈' if setup['side'] > 0 else '📉', **setup)
+                for rank, setup in enumerate(setups, 1)
+            )
+            return SCAN_RESULT_TEMPLATE.format(
+                scope=f" ({timeframe})" if timeframe else "",
+                items=items,
+                series=len(result),
+                elapsed=result.seconds * 1000,
+                timestamp=datetime.fromtimestamp(result.created).strftime("%d.%m.%Y %H:%M")
+            )
+        except Exception as e:
+            return f"❌ Ошибка при сканировании рынка: {str(e)}"
+    
+    @metrics.timed('analyzer_seconds', method='describe_chart')
+    def describe_chart(self, chart: dict) -> dict:
+        """Template sections for features extracted from a chart screenshot
+        
+        Levels are fractions of the chart height, so distances are given
+        in percent of the visible range rather than in price.
+        """
+        trend = chart['trend']
+        patterns = []
+        score = 0
+        
+        if trend['r2'] > 0.5 and trend['change'] > 0.1:
+            patterns.append(f"• Восходящий тренд (+{trend['change'] * 100:.0f}% высоты графика, R² {trend['r2']:.2f})")
+            score += 1
+        elif trend['r2'] > 0.5 and trend['change'] < -0.1:
+            patterns.append(f"• Нисходящий тренд ({trend['change'] * 100:.0f}% высоты графика, R² {trend['r2']:.2f})")
+            score -= 1
+        else:
+            patterns.append("• Боковое движение, выраженного тренда нет")
+        
+        pattern_names = {
+            'doji': ("• Доджи на последней свече — неопределенность", 0),
+            'hammer': ("• Молот на последней свече", 1),
+            'shooting_star': ("• Падающая звезда на последней свече", -1),
+            'bullish_engulfing': ("• Бычье поглощение", 1),
+            'bearish_engulfing': ("• Медвежье поглощение", -1)
+        }
+        for name in chart['patterns']:
+            line, weight = pattern_names[name]
+            patterns.append(line)
+            score += weight
+        
+        if chart['rsi'] is not None:
+            if chart['rsi'] < 30:
+                patterns.append(f"• Перепроданность по RSI ({chart['rsi']:.0f})")
+                score += 1
+            elif chart['rsi'] > 70:
+                patterns.append(f"• Перекупленность по RSI ({chart['rsi']:.0f})")
+                score -= 1
+            if chart['macd_hist'] > 0:
+                patterns.append("• MACD выше сигнальной линии")
+                score += 1
+            elif chart['macd_hist'] < 0:
+                patterns.append("• MACD ниже сигнальной линии")
+                score -= 1
+        
+        patterns.append(f"• Бычьих свечей: {chart['bullish_share'] * 100:.0f}% из {chart['candles']}")
+        
+        if score >= 2:
+            recommendations = "• Рассмотреть LONG позицию\n• Дождаться подтверждения на закрытии свечи\n• Тейк-профиты у ближайшего сопротивления"
+        elif score <= -2:
+            recommendations = "• Возможность SHORT позиции\n• Ждать отскока к сопротивлению\n• Тейк-профиты у ближайшей поддержки"
+        else:
+            recommendations = "• Оставаться в стороне\n• Сигналы противоречивы\n• Ждать пробития ближайшего уровня"
+        
+        last = chart['last_close']
+        entry_points = []
+        if chart['support']:
+            distance = (last - chart['support'][1]) * 100
+            entry_points.append(f"• Поддержка: {distance:.0f}% высоты графика ниже цены (касаний: {chart['support'][2]})")
+        if chart['resistance']:
+            distance = (chart['resistance'][0] - last) * 100
+            entry_points.append(f"• Сопротивление: {distance:.0f}% высоты графика выше цены (касаний: {chart['resistance'][2]})")
+        if not entry_points:
+            entry_points.append("• Выраженных уровней не найдено — вход после пробития последнего экстремума")
+        
+        risk_management = "• Стоп-лосс за ближайшим уровнем\n• Размер позиции: 1-2% депозита\n• Соотношение прибыль/убыток: не хуже 1:2"
+        
+        return {
+            'patterns': "\n".join(patterns),
+            'recommendations': recommendations,
+            'entry_points': "\n".join(entry_points),
+            'risk_management': risk_management
+        }
+    
+    @metrics.timed('analyzer_seconds', method='analyze_photo')
+    def analyze_photo(self, photo_info: dict, chart: dict = None) -> str:
+        """Analyze uploaded chart photo
+        
+        `chart` holds the features extracted by vision.chart; without them
+        the reply is a generic checklist.
+        """
+        try:
+            if chart is not None:
+                timeframe = next(
+                    (tf for tf in self.timeframes if tf in (photo_info.get('caption') or '').lower().split()),
+                    'не указан'
+                )
+                return PHOTO_ANALYSIS_TEMPLATE.format(
+                    timeframe=timeframe,
+                    timestamp=datetime.now().strftime("%d.%m.%Y %H:%M"),
+                    **self.describe_chart(chart)
+                )
             
             patterns_options = [
                 "• Восходящий треугольник\n• Пробитие уровня поддержки\n• Дивергенция RSI",
@@ -187,23 +507,17 @@ class TradingAnalyzer:
         except Exception as e:
             return f"❌ Ошибка при анализе изображения: {str(e)}"
     
+    @metrics.timed('analyzer_seconds', method='analyze_text_idea')
     def analyze_text_idea(self, text: str) -> str:
         """Analyze user's trading idea from text"""
         try:
-            # Simple text analysis (in real implementation would use NLP)
-            text_lower = text.lower()
-            
-            # Determine sentiment
-            bullish_words = ['buy', 'long', 'bull', 'up', 'покупать', 'лонг', 'рост']
-            bearish_words = ['sell', 'short', 'bear', 'down', 'продавать', 'шорт', 'падение']
+            # Sentiment, tickers and price levels in one pass over the text
+            signals = self.matcher.analyze(text)
             
-            bullish_count = sum(1 for word in bullish_words if word in text_lower)
-            bearish_count = sum(1 for word in bearish_words if word in text_lower)
-            
-            if bullish_count > bearish_count:
+            if signals['direction'] == 'LONG':
                 sentiment = "Бычье 📈"
                 recommendation = "Рассмотрите LONG позицию"
-            elif bearish_count > bullish_count:
+            elif signals['direction'] == 'SHORT':
                 sentiment = "Медвежье 📉"  
                 recommendation = "Рассмотрите SHORT позицию"
             else:
@@ -213,8 +527,21 @@ class TradingAnalyzer:
             # Generate analysis points
             analysis_points = [
                 f"• Общее настроение: {sentiment}",
-                f"• Рекомендация: {recommendation}",
-                "• Обязательно используйте стоп-лосс",
+                f"• Рекомендация: {recommendation}"
+            ]
+            if signals['tickers']:
+                analysis_points.append(f"• Инструменты: {', '.join(signals['tickers'])}")
+            if signals['timeframes']:
+                analysis_points.append(f"• Таймфрейм: {', '.join(signals['timeframes'])}")
+            if signals['prices']:
+                levels = ", ".join(
+                    f"{PRICE_ROLE_NAMES.get(price['role'], 'уровень')} {price['value']:g}"
+                    for price in signals['prices'][:6]
+                )
+                analysis_points.append(f"• Уровни: {levels}")
+            if not any(price['role'] == 'stop' for price in signals['prices']):
+                analysis_points.append("• Обязательно используйте стоп-лосс")
+            analysis_points += [
                 "• Не рискуйте более 2% депозита",
                 "• Учитывайте общий тренд рынка"
             ]
@@ -239,3 +566,75 @@ class TradingAnalyzer:
             
         except Exception as e:
             return f"❌ Ошибка при анализе текста: {str(e)}"
+
+
+class AsyncTradingAnalyzer:
+    """Asyncio facade over TradingAnalyzer
+
+    Every analysis call is run in an executor so CPU-bound work never
+    blocks the event loop that dispatches Telegram updates.
+    """
+
+    def __init__(self, analyzer: TradingAnalyzer = None, executor: Executor = None, max_workers: int = 4):
+        self.analyzer = analyzer or TradingAnalyzer()
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='analysis'
+        )
+
+    async def _run(self, func, *args):
+        """Run an analyzer method in the executor"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            # Including the wait for a free worker
+            metrics.observe('analyzer_wait_seconds', time.perf_counter() - start, method=func.__name__)
+
+    async def generate_trading_idea(self, pair: str = None, timeframe: str = None,
+                                    chat_id: int = None, user_id: int = None) -> str:
+        """Generate a trading idea, for a random series unless one is given"""
+        return await self._run(self.analyzer.generate_trading_idea, pair, timeframe, chat_id, user_id)
+
+    async def create_trading_idea(self, pair: str = None, timeframe: str = None,
+                                  chat_id: int = None, user_id: int = None) -> dict:
+        """Create a trading idea with its levels (see TradingAnalyzer.create_trading_idea)"""
+        return await self._run(self.analyzer.create_trading_idea, pair, timeframe, chat_id, user_id)
+
+    async def analyze_market(self) -> str:
+        """Generate market analysis
+
+        Cache hits and callers waiting on an in-flight build never take an
+        executor worker; only the single builder does.
+        """
+        try:
+            future = self.analyzer.cache.get_future(
+                MARKET_SNAPSHOT,
+                self.analyzer.build_market_analysis,
+                executor=self.executor
+            )
+            return await asyncio.wrap_future(future)
+        except Exception as e:
+            return f"❌ Ошибка при анализе рынка: {str(e)}"
+
+    async def scan_market(self, timeframe: str = None) -> str:
+        """Best setups over every pair (see TradingAnalyzer.scan_market)"""
+        return await self._run(self.analyzer.scan_market, timeframe)
+
+    async def analyze_photo(self, photo_info: dict) -> str:
+        """Analyze uploaded chart photo"""
+        return await self._run(self.analyzer.analyze_photo, photo_info)
+
+    async def analyze_text_idea(self, text: str) -> str:
+        """Analyze user's trading idea from text"""
+        return await self._run(self.analyzer.analyze_text_idea, text)
+
+    def warm_cache(self):
+        """Keep the market snapshot refreshed in the background"""
+        self.analyzer.warm_cache()
+
+    def shutdown(self):
+        """Release executor workers"""
+        self.analyzer.cache.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+"""
+Built-in webhook HTTP server for receiving Telegram updates
+"""
+
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+def parse_payload(body: bytes) -> list:
+    """Raw updates (dicts) of a webhook body holding one update or a JSON array of updates"""
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not all(isinstance(item, dict) for item in payload):
+        raise ValueError("Expected an update object or a list of update objects")
+    return payload
+
+
+def parse_updates(body: bytes) -> list:
+    """Parse a webhook body holding one update or a JSON array of updates"""
+    return [types.Update.de_json(item) for item in parse_payload(body)]
+
+
+class WebhookServer:
+    """HTTP server that feeds webhook updates to the bot handlers
+
+    Telegram posts one update per request; recorded updates can also be
+    posted as a JSON array to deliver a whole batch at once. Every request
+    must carry the secret token configured with setWebhook. `parse` turns
+    a request body into what process_updates() gets (Update objects by
+    default).
+    """
+
+    def __init__(self, process_updates, host: str = '127.0.0.1', port: int = 8443,
+                 path: str = '/webhook', secret_token: str = '', parse=parse_updates):
+        self.process_updates = process_updates
+        self.parse = parse
+        self.path = path
+        self.secret_token = secret_token
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """Bound (host, port); useful when started on port 0"""
+        return self.httpd.server_address[:2]
+
+    def _make_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+
+                # Compared as bytes: compare_digest() rejects non-ASCII str
+                token = self.headers.get(SECRET_HEADER, '')
+                if server.secret_token and not hmac.compare_digest(token.encode(), server.secret_token.encode()):
+                    logger.warning(f"Rejected webhook request from {self.client_address[0]}: bad secret token")
+                    self._reply(403)
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                if length <= 0 or length > MAX_BODY_SIZE:
+                    self._reply(413 if length else 400)
+                    return
+
+                try:
+                    updates = server.parse(self.rfile.read(length))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Invalid webhook payload: {e}")
+                    self._reply(400)
+                    return
+
+                try:
+                    server.process_updates(updates)
+                except Exception as e:
+                    logger.error(f"Error processing webhook updates: {e}")
+                    self._reply(500)
+                    return
+
+                self._reply(200)
+
+            def _reply(self, status: int):
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # Request lines are too noisy for the bot log
+                pass
+
+        return RequestHandler
+
+    def serve_forever(self):
+        """Serve requests in the calling thread"""
+        logger.info(f"Webhook сервер слушает {self.address[0]}:{self.address[1]}{self.path}")
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Serve requests in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
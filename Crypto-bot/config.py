@@ -6,6 +6,104 @@ import os
 
 # Bot configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+# Bot API server base URL, e.g. a local Bot API server or the fake one in
+# benchmarks/fake_bot_api.py; empty means api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Logging: in 'queue' mode handlers only queue records and a background
+# thread formats and writes them ('sync' writes on the calling thread);
+# LOG_FORMAT 'json' emits one JSON object per line
+LOG_MODE = os.getenv("LOG_MODE", "queue")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Records waiting for the log thread at most; more are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Share of high-volume info logs kept per event, e.g. "request=0.1,reply=0.01"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+
+# Prometheus-style metrics endpoint (GET /metrics); 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Seconds between stack samples of requests in flight (0: profiler off)
+# and the number of slowest requests kept, served on /debug/slow
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0"))
+PROFILE_SLOWEST = int(os.getenv("PROFILE_SLOWEST", "20"))
+
+# Update dispatch mode: 'polling' (blocking telebot) or 'async' (asyncio)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Async dispatch settings
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "256"))
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+
+# Sharded mode: with WORKER_PROCESSES > 1 this process only receives
+# updates and hands each one to a worker process chosen by its chat_id
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+# Set by the receiving process for each worker: its shard, the number of
+# shards and the shared memory block holding the candle store
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+CANDLE_STORE_SHM = os.getenv("CANDLE_STORE_SHM", "")
+
+# Outbound delivery limits (Telegram allows ~30 msg/s overall,
+# ~1 msg/s per private chat and 20 msg/min per group)
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = float(os.getenv("OUTBOX_CHAT_BURST", "3"))
+OUTBOX_GROUP_RATE = float(os.getenv("OUTBOX_GROUP_RATE", str(20 / 60)))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))
+
+# Results ready within this many seconds are sent without a placeholder
+RESPONSE_LATENCY_BUDGET = float(os.getenv("RESPONSE_LATENCY_BUDGET", "0.5"))
+
+# Scheduled signals: one idea per pair and timeframe with subscribers is
+# published this many seconds after each candle close, and queued for
+# subscribers in batches of SIGNAL_BATCH chats
+SIGNALS_ENABLED = os.getenv("SIGNALS_ENABLED", "1") == "1"
+SIGNAL_DELAY = float(os.getenv("SIGNAL_DELAY", "5"))
+SIGNAL_BATCH = int(os.getenv("SIGNAL_BATCH", "1000"))
+SIGNAL_DEFAULT_TIMEFRAME = os.getenv("SIGNAL_DEFAULT_TIMEFRAME", "4h")
+# JSON file keeping subscriptions across restarts; empty keeps them in memory
+SUBSCRIPTIONS_FILE = os.getenv("SUBSCRIPTIONS_FILE", "")
+
+# SQLite database of users, subscriptions and issued ideas; empty stores
+# nothing. A background thread commits queued writes in batches of up to
+# STORAGE_BATCH statements, waiting at most STORAGE_FLUSH_INTERVAL seconds
+# for a batch to fill
+DATABASE_PATH = os.getenv("DATABASE_PATH", "")
+STORAGE_BATCH = int(os.getenv("STORAGE_BATCH", "1000"))
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "0.05"))
+# Idea IDs reserved in the database at a time
+IDEA_ID_BLOCK = int(os.getenv("IDEA_ID_BLOCK", "1000"))
+
+# Update source: 'polling' (getUpdates) or 'webhook' (built-in HTTP server)
+UPDATE_SOURCE = os.getenv("UPDATE_SOURCE", "polling")
+
+# Webhook settings; WEBHOOK_URL is the public URL registered with Telegram,
+# leave it empty to only serve locally (e.g. behind a proxy or for testing)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Chart screenshot pipeline: worker processes, max photos queued or in
+# progress (more are rejected right away), and the smallest photo side in
+# pixels worth downloading (Telegram offers several sizes per photo)
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+PHOTO_QUEUE_LIMIT = int(os.getenv("PHOTO_QUEUE_LIMIT", "16"))
+PHOTO_MIN_RESOLUTION = int(os.getenv("PHOTO_MIN_RESOLUTION", "800"))
+# Bot API downloads are limited to 20 MB
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Chart analysis results by file_unique_id / perceptual hash. Set
+# CHART_CACHE_DIR to keep results on disk across restarts
+CHART_CACHE_ENTRIES = int(os.getenv("CHART_CACHE_ENTRIES", "4096"))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "")
+CHART_CACHE_DISK_BYTES = int(os.getenv("CHART_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# Max differing bits (of 256) for two images to count as the same chart
+CHART_HASH_DISTANCE = int(os.getenv("CHART_HASH_DISTANCE", "12"))
 
 # Bot settings
 MAX_MESSAGE_LENGTH = 4096
@@ -23,9 +121,67 @@ DEFAULT_TRADING_PAIRS = [
     'MATIC/USDT'
 ]
 
+# Symbols tracked: 'config' keeps DEFAULT_TRADING_PAIRS, 'exchange' loads
+# every listed pair quoted in SYMBOL_QUOTE_ASSETS (comma-separated) from
+# the exchange and reloads the listing every SYMBOLS_REFRESH seconds
+# (lower CANDLE_BUFFER_SIZE accordingly: a pair holds one series per timeframe)
+SYMBOLS_SOURCE = os.getenv("SYMBOLS_SOURCE", "config")
+SYMBOL_QUOTE_ASSETS = [asset.strip() for asset in os.getenv("SYMBOL_QUOTE_ASSETS", "USDT").split(',') if asset.strip()]
+SYMBOLS_REFRESH = float(os.getenv("SYMBOLS_REFRESH", "3600"))
+
 # Time frames for analysis
 TIMEFRAMES = ['1h', '4h', '1d', '1w']
 
+# Candles kept in memory per pair and timeframe
+# (each series holds 2 x size x 6 float64 values, ~480 KB at 5000)
+CANDLE_BUFFER_SIZE = int(os.getenv("CANDLE_BUFFER_SIZE", "5000"))
+
+# Directory of the on-disk candle archive (one memory-mapped file per pair
+# and timeframe); empty disables archiving
+CANDLE_ARCHIVE_DIR = os.getenv("CANDLE_ARCHIVE_DIR", "")
+
+# Exchange market data (Binance-compatible REST API)
+EXCHANGE_URL = os.getenv("EXCHANGE_URL", "https://api.binance.com")
+EXCHANGE_MAX_CONCURRENCY = int(os.getenv("EXCHANGE_MAX_CONCURRENCY", "8"))
+EXCHANGE_TIMEOUT = float(os.getenv("EXCHANGE_TIMEOUT", "10"))
+# Seconds between market data refreshes, 0 disables the market data loop
+MARKET_DATA_REFRESH = float(os.getenv("MARKET_DATA_REFRESH", "0"))
+# Market data source after the initial backfill: 'rest' polls every
+# MARKET_DATA_REFRESH seconds, 'websocket' follows the trade and 1h kline
+# streams and rolls the longer timeframes up from closed 1h candles
+MARKET_FEED = os.getenv("MARKET_FEED", "rest")
+EXCHANGE_WS_URL = os.getenv("EXCHANGE_WS_URL", "wss://stream.binance.com:9443")
+
+# Shared /analyze snapshot: recomputed at most once per TTL and refreshed
+# in the background this many seconds before it expires
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "60"))
+ANALYSIS_CACHE_REFRESH_AHEAD = float(os.getenv("ANALYSIS_CACHE_REFRESH_AHEAD", "5"))
+
+# Trading idea levels as fractions of the entry price: take profits TP1-TP3
+# and the stop loss, in the direction of the trade
+IDEA_TAKE_PROFITS = (0.02, 0.05, 0.08)
+IDEA_STOP_LOSS = 0.03
+
+# Rendered ideas kept ready per pair and timeframe for /idea and the
+# "new idea" button, and the seconds after which an unused one is dropped
+IDEA_POOL_SIZE = int(os.getenv("IDEA_POOL_SIZE", "3"))
+IDEA_POOL_MAX_AGE = float(os.getenv("IDEA_POOL_MAX_AGE", "300"))
+
+# Opportunity scanner: closed candles scored per series, setups listed by
+# /scan, and the top setups /idea picks from (0 = any series at random)
+SCAN_LOOKBACK = int(os.getenv("SCAN_LOOKBACK", "200"))
+SCAN_RESULTS = int(os.getenv("SCAN_RESULTS", "10"))
+SCAN_IDEA_TOP = int(os.getenv("SCAN_IDEA_TOP", "5"))
+
+# Support/resistance in /analyze: closed candles of the volume profile and
+# swing points, their timeframe, and the pairs shown (the top setups)
+LEVELS_WINDOW = int(os.getenv("LEVELS_WINDOW", "1000"))
+LEVELS_TIMEFRAME = os.getenv("LEVELS_TIMEFRAME", "4h")
+LEVELS_PAIRS = int(os.getenv("LEVELS_PAIRS", "3"))
+
+# Backtest parameter sweeps: worker processes (0 = one per CPU)
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "0"))
+
 # Risk management levels
 RISK_LEVELS = {
     'low': {'risk_percent': 1, 'leverage': 1},
@@ -7,31 +7,316 @@ Main entry point for the bot application
 import os
 import sys
 import time
-from config import BOT_TOKEN
-from bot.handlers import setup_handlers
+import signal
+import asyncio
+from config import (
+    BOT_TOKEN,
+    TELEGRAM_API_URL,
+    BOT_MODE,
+    UPDATE_SOURCE,
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    MARKET_DATA_REFRESH,
+    MARKET_FEED,
+    SIGNALS_ENABLED,
+    METRICS_HOST,
+    METRICS_PORT,
+    PROFILE_INTERVAL,
+    WORKER_PROCESSES,
+    OUTBOX_GLOBAL_RATE,
+    PHOTO_WORKERS
+)
+# Bot modules are imported where they are used: spawned processes (shard
+# workers, the chart pool) re-run this module's imports, and the bot
+# modules build the candle store and the analyzer when imported
 from utils.logger import setup_logger
 import telebot
 
+def create_webhook_server(process_updates, **kwargs):
+    """Create the built-in webhook server from config"""
+    from bot.webhook import WebhookServer
+
+    return WebhookServer(
+        process_updates,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        **kwargs
+    )
+
+def use_api_server(url: str):
+    """Send Bot API calls and file downloads to another server"""
+    from telebot import apihelper, asyncio_helper
+
+    base = url.rstrip('/')
+    for helper in (apihelper, asyncio_helper):
+        helper.API_URL = base + '/bot{0}/{1}'
+        helper.FILE_URL = base + '/file/bot{0}/{1}'
+
+def create_market_data(on_price, store=None):
+    """Market data service for the configured feed, or None when disabled"""
+    from market.indicators import IndicatorEngine
+
+    engine = IndicatorEngine(store) if store is not None else None
+    if MARKET_FEED == 'websocket':
+        from market.stream import StreamingMarketDataService
+        return StreamingMarketDataService(store=store, engine=engine, on_price=on_price)
+    if MARKET_DATA_REFRESH > 0:
+        from market.exchange import MarketDataService
+        return MarketDataService(store=store, engine=engine, on_price=on_price)
+    return None
+
+def start_monitoring(logger, port: int = METRICS_PORT):
+    """Serve metrics and start the slow request profiler when configured"""
+    from utils.metrics import MetricsServer
+    from utils.profiler import profiler
+
+    if PROFILE_INTERVAL > 0:
+        profiler.start()
+    if port:
+        server = MetricsServer(host=METRICS_HOST, port=port,
+                               profiler=profiler if profiler.running else None).start()
+        logger.info(f"Метрики доступны на http://{server.address[0]}:{server.address[1]}/metrics")
+
+def run_polling(logger):
+    """Run the blocking telebot bot with polling or webhook ingestion"""
+    from bot.handlers import setup_handlers, analyzer
+    from bot.outbox import ThreadedOutbox
+    from bot.signals import SignalBroadcaster
+    from bot.subscriptions import SubscriptionRegistry
+    from bot.tracker import IdeaTracker
+
+    # Initialize bot
+    bot = telebot.TeleBot(BOT_TOKEN, parse_mode='HTML')
+
+    # Setup handlers
+    outbox = ThreadedOutbox(bot).start()
+    subscriptions = SubscriptionRegistry()
+    tracker = IdeaTracker(outbox)
+    setup_handlers(bot, outbox=outbox, subscriptions=subscriptions, tracker=tracker)
+    analyzer.warm_cache()
+
+    if SIGNALS_ENABLED:
+        SignalBroadcaster(outbox, subscriptions, analyzer).start()
+
+    market_data = create_market_data(tracker.on_price)
+    if market_data is not None:
+        market_data.start_thread()
+
+    if UPDATE_SOURCE == 'webhook':
+        server = create_webhook_server(bot.process_new_updates)
+        if WEBHOOK_URL:
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None)
+
+        logger.info("Бот запущен в режиме webhook...")
+        server.serve_forever()
+        return
+
+    logger.info("Бот запущен и готов к работе...")
+
+    # Start polling
+    bot.polling(none_stop=True, interval=1, timeout=60)
+
+async def run_async(logger):
+    """Run the asyncio bot with polling or webhook ingestion"""
+    from telebot.async_telebot import AsyncTeleBot
+    from bot.async_handlers import setup_async_handlers
+    from bot.outbox import AsyncOutbox
+    from bot.signals import SignalBroadcaster
+    from bot.storage import bot_storage
+    from bot.subscriptions import SubscriptionRegistry
+    from bot.tracker import IdeaTracker
+
+    bot = AsyncTeleBot(BOT_TOKEN, parse_mode='HTML')
+    outbox = AsyncOutbox(bot).start()
+    subscriptions = SubscriptionRegistry()
+    tracker = IdeaTracker(outbox)
+    analyzer = setup_async_handlers(bot, outbox=outbox, subscriptions=subscriptions, tracker=tracker)
+    analyzer.warm_cache()
+
+    signals = None
+    if SIGNALS_ENABLED:
+        signals = SignalBroadcaster(outbox, subscriptions, analyzer.analyzer).start()
+
+    market_data = create_market_data(tracker.on_price)
+    if market_data is not None:
+        market_data = asyncio.create_task(market_data.run())
+
+    try:
+        if UPDATE_SOURCE == 'webhook':
+            loop = asyncio.get_running_loop()
+            server = create_webhook_server(
+                lambda updates: asyncio.run_coroutine_threadsafe(bot.process_new_updates(updates), loop)
+            )
+            if WEBHOOK_URL:
+                await bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None)
+
+            logger.info("Бот запущен в асинхронном режиме webhook...")
+            server.start()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                server.stop()
+        else:
+            logger.info("Бот запущен в асинхронном режиме...")
+            await bot.infinity_polling(timeout=60)
+    finally:
+        if market_data is not None:
+            market_data.cancel()
+        if signals is not None:
+            signals.stop()
+        analyzer.shutdown()
+        bot_storage.close()
+
+def run_worker(index: int, count: int, updates, ready, reports):
+    """Shard worker: handle the updates of its chats, one at a time"""
+    from telebot import types
+    from bot.handlers import setup_handlers, analyzer
+    from bot.outbox import ThreadedOutbox
+    from bot.photo_pipeline import ChartPipeline
+    from bot.signals import SignalBroadcaster
+    from bot.storage import bot_storage
+    from bot.subscriptions import SubscriptionRegistry
+    from bot.tracker import IdeaTracker
+    from bot.sharding import StoreFollower
+    from utils.process import exit_with_parent
+    from market.indicators import indicator_engine
+
+    # The receiving process stops the workers; Ctrl+C is meant for it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    exit_with_parent()
+    logger = setup_logger()
+    if TELEGRAM_API_URL:
+        use_api_server(TELEGRAM_API_URL)
+    bot_storage.start()
+    start_monitoring(logger, METRICS_PORT + 1 + index if METRICS_PORT else 0)
+
+    # Not threaded: updates of a chat are handled in the order they came
+    bot = telebot.TeleBot(BOT_TOKEN, parse_mode='HTML', threaded=False)
+    # Telegram's overall limit is shared by all workers
+    outbox = ThreadedOutbox(bot, global_rate=OUTBOX_GLOBAL_RATE / count).start()
+    # The receiving process renders signals for the series this shard reports
+    subscriptions = SubscriptionRegistry(on_change=lambda series: reports.put((index, series)))
+    reports.put((index, subscriptions.series()))
+    tracker = IdeaTracker(outbox)
+    pipeline = ChartPipeline(workers=max(1, PHOTO_WORKERS // count))
+    setup_handlers(bot, outbox=outbox, pipeline=pipeline, subscriptions=subscriptions, tracker=tracker)
+    analyzer.warm_cache()
+
+    # Signals are rendered once by the receiving process and delivered here
+    signals = SignalBroadcaster(outbox, subscriptions, analyzer)
+    # Candles are filled by the receiving process
+    StoreFollower(indicator_engine, on_price=tracker.on_price).start()
+
+    logger.info(f"Обработчик {index + 1}/{count} запущен")
+    ready.set()
+    try:
+        for batch in iter(updates.get, None):
+            if isinstance(batch, tuple):
+                _, pair, timeframe, text = batch
+                signals.deliver(pair, timeframe, text)
+                continue
+            for update in batch:
+                try:
+                    bot.process_new_updates([types.Update.de_json(update)])
+                except Exception as e:
+                    logger.error(f"Error handling update {update.get('update_id')}: {e}")
+    finally:
+        pipeline.shutdown()
+        bot_storage.close()
+
+def run_sharded(logger):
+    """Receive updates here and handle them in WORKER_PROCESSES shard workers"""
+    from telebot import apihelper
+    from bot.sharding import ShardRouter
+    from bot.signals import ShardSignalBroadcaster
+    from bot.storage import bot_storage
+    from bot.subscriptions import ShardSubscriptions
+    from bot.trading_analyzer import TradingAnalyzer
+    from bot.webhook import parse_payload
+    from market.candles import SharedCandleStore
+    from market.indicators import IndicatorEngine
+    from market.symbols import symbol_registry
+
+    # Candles are kept once, in shared memory, and read by every worker
+    store = SharedCandleStore(registry=symbol_registry)
+    subscriptions = ShardSubscriptions(WORKER_PROCESSES)
+    router = ShardRouter(WORKER_PROCESSES, run_worker, env={'CANDLE_STORE_SHM': store.name},
+                         on_report=subscriptions.update).start()
+    market_data = create_market_data(None, store)
+    if market_data is not None:
+        market_data.start_thread()
+
+    signals = None
+    if SIGNALS_ENABLED:
+        # One signal per series and close for all shards, rendered here
+        engine = market_data.engine if market_data is not None else IndicatorEngine(store)
+        signals = ShardSignalBroadcaster(
+            lambda shards, pair, timeframe, text: router.send(shards, ('signal', pair, timeframe, text)),
+            subscriptions, TradingAnalyzer(store=store, indicators=engine)
+        ).start()
+
+    try:
+        if UPDATE_SOURCE == 'webhook':
+            server = create_webhook_server(router.dispatch, parse=parse_payload)
+            if WEBHOOK_URL:
+                telebot.TeleBot(BOT_TOKEN).set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None)
+
+            logger.info(f"Бот запущен в режиме webhook с {WORKER_PROCESSES} обработчиками...")
+            server.serve_forever()
+            return
+
+        logger.info(f"Бот запущен с {WORKER_PROCESSES} обработчиками...")
+        offset = None
+        while True:
+            try:
+                updates = apihelper.get_updates(BOT_TOKEN, offset=offset, timeout=60, long_polling_timeout=60)
+            except Exception as e:
+                logger.error(f"Error receiving updates: {e}")
+                time.sleep(1)
+                continue
+            if updates:
+                offset = updates[-1]['update_id'] + 1
+                router.dispatch(updates)
+    finally:
+        if signals is not None:
+            signals.stop()
+        router.stop()
+        store.close()
+        bot_storage.close()
+
 def main():
     """Main function to start the Telegram bot"""
+    from bot.storage import bot_storage
+
     logger = setup_logger()
-    
+
     if not BOT_TOKEN:
         logger.error("BOT_TOKEN не найден в переменных окружения")
         sys.exit(1)
-    
+
+    # Stop through the normal exit path (finally blocks, atexit) on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     try:
-        # Initialize bot
-        bot = telebot.TeleBot(BOT_TOKEN, parse_mode='HTML')
-        
-        # Setup handlers
-        setup_handlers(bot)
-        
-        logger.info("Бот запущен и готов к работе...")
-        
-        # Start polling
-        bot.polling(none_stop=True, interval=1, timeout=60)
-        
+        if TELEGRAM_API_URL:
+            use_api_server(TELEGRAM_API_URL)
+
+        # Users, subscriptions and ideas (no-op without DATABASE_PATH)
+        bot_storage.start()
+        start_monitoring(logger)
+
+        if WORKER_PROCESSES > 1:
+            run_sharded(logger)
+        elif BOT_MODE == 'async':
+            asyncio.run(run_async(logger))
+        else:
+            run_polling(logger)
+
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске бота: {e}")
         sys.exit(1)
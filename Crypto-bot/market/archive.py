@@ -0,0 +1,245 @@
+"""
+Append-only on-disk candle archive, memory-mapped per series
+
+One file per symbol x timeframe: a fixed header followed by fixed-size
+records of six float64 values (time, open, high, low, close, volume) in time
+order. Opening an archive maps the file without reading it, so startup cost
+does not depend on how much history is stored. Range reads binary-search a
+sparse index of every INDEX_STRIDE-th timestamp, then one block of records,
+and return zero-copy views of the mapping.
+"""
+
+import os
+import struct
+import threading
+import numpy as np
+from utils.logger import setup_logger
+from market.candles import CandleStore, FIELDS, TIME, TIMEFRAME_SECONDS
+from config import CANDLE_ARCHIVE_DIR
+
+logger = setup_logger()
+
+MAGIC = b'CANDLES1'
+HEADER = struct.Struct('<8sqq')
+HEADER_SIZE = 64
+RECORD_SIZE = len(FIELDS) * 8
+
+# One sparse index entry per this many records
+INDEX_STRIDE = 1024
+
+
+class ArchiveError(Exception):
+    """Archive file is not a candle archive or does not match its series"""
+
+
+def archive_name(symbol: str, timeframe: str) -> str:
+    """'BTC/USDT', '1h' -> 'BTCUSDT_1h.candles'"""
+    return f"{symbol.replace('/', '')}_{timeframe}.candles"
+
+
+def _rows(candles) -> np.ndarray:
+    """One candle, (n, 6) rows or a (6, n) window -> (n, 6) rows"""
+    candles = np.asarray(candles, dtype=np.float64)
+    if candles.ndim == 1:
+        return candles[None, :]
+    if candles.shape[1] != len(FIELDS):
+        return candles.T
+    return candles
+
+
+class SeriesArchive:
+    """Archive file of one series
+
+    Appends go through a regular file handle; readers see them the next
+    time they ask for data, when the mapping is extended. Candles that are
+    not newer than the last archived one are skipped, which keeps the file
+    sorted. A torn record at the end (crash during a write) is cut off on open.
+    """
+
+    def __init__(self, path: str, timeframe: str):
+        self.path = path
+        self.timeframe = timeframe
+        self.step = TIMEFRAME_SECONDS[timeframe]
+        self._lock = threading.Lock()
+        self._map = np.empty((0, len(FIELDS)))
+        self._mapped = 0
+        self._index = np.empty(0)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.step, len(FIELDS)).ljust(HEADER_SIZE, b'\0'))
+        with open(path, 'rb') as f:
+            magic, step, fields = HEADER.unpack(f.read(HEADER_SIZE)[:HEADER.size])
+        if magic != MAGIC or fields != len(FIELDS):
+            raise ArchiveError(f"{path} is not a candle archive")
+        if step != self.step:
+            raise ArchiveError(f"{path} holds {step}s candles, expected {timeframe}")
+        # Drop a torn record so appends stay aligned
+        size = os.path.getsize(path)
+        torn = (size - HEADER_SIZE) % RECORD_SIZE
+        if torn:
+            logger.warning(f"Dropping {torn} trailing bytes of {path}")
+            os.truncate(path, size - torn)
+        self._file = open(path, 'ab')
+
+    def __len__(self) -> int:
+        return (os.fstat(self._file.fileno()).st_size - HEADER_SIZE) // RECORD_SIZE
+
+    def _records(self) -> np.ndarray:
+        """(n, 6) read-only mapping of all complete records"""
+        count = len(self)
+        with self._lock:
+            if count != self._mapped:
+                if count:
+                    self._map = np.memmap(self.path, dtype=np.float64, mode='r', offset=HEADER_SIZE,
+                                          shape=(count, len(FIELDS)))
+                else:
+                    self._map = np.empty((0, len(FIELDS)))
+                self._mapped = count
+            return self._map
+
+    def _sparse_index(self, records: np.ndarray) -> np.ndarray:
+        """Every INDEX_STRIDE-th timestamp, built on first lookup and then extended"""
+        with self._lock:
+            known = len(self._index)
+            if (len(records) + INDEX_STRIDE - 1) // INDEX_STRIDE > known:
+                fresh = records[known * INDEX_STRIDE::INDEX_STRIDE, TIME]
+                self._index = np.concatenate([self._index, fresh])
+            return self._index
+
+    @property
+    def last_time(self):
+        """Open time of the newest archived candle, or None"""
+        records = self._records()
+        return float(records[-1, TIME]) if len(records) else None
+
+    def append(self, candles) -> int:
+        """Append candles newer than the archive; returns the count written"""
+        candles = _rows(candles)
+        last = self.last_time
+        if last is not None:
+            candles = candles[candles[:, TIME] > last]
+        # Strictly increasing times only
+        keep = np.concatenate(([True], np.diff(candles[:, TIME]) > 0)) if len(candles) else []
+        candles = np.ascontiguousarray(candles[keep])
+        if not len(candles):
+            return 0
+        with self._lock:
+            self._file.write(candles.tobytes())
+            self._file.flush()
+        return len(candles)
+
+    def _position(self, records: np.ndarray, time: float, side: str) -> int:
+        """Record position of a timestamp via the sparse index"""
+        index = self._sparse_index(records)
+        block = max(int(np.searchsorted(index, time, side='right')) - 1, 0)
+        lo = block * INDEX_STRIDE
+        times = records[lo:lo + INDEX_STRIDE + 1, TIME]
+        return lo + int(np.searchsorted(times, time, side=side))
+
+    def range(self, start: float = None, end: float = None) -> np.ndarray:
+        """Zero-copy (6, n) view of candles with start <= open time < end"""
+        records = self._records()
+        lo = self._position(records, start, 'left') if start is not None else 0
+        hi = self._position(records, end, 'left') if end is not None else len(records)
+        return records[lo:max(lo, hi)].T
+
+    def tail(self, n: int) -> np.ndarray:
+        """Zero-copy (6, n) view of the newest n candles"""
+        records = self._records()
+        return records[max(len(records) - n, 0):].T
+
+    def gaps(self, start: float = None, end: float = None) -> list:
+        """(first missing, last missing, candles missing) for every hole in the range"""
+        times = self.range(start, end)[TIME]
+        breaks = np.flatnonzero(np.diff(times) > self.step)
+        return [
+            (float(times[i] + self.step), float(times[i + 1] - self.step),
+             int(round((times[i + 1] - times[i]) / self.step)) - 1)
+            for i in breaks
+        ]
+
+    def compact(self, merge=None, before: float = None) -> int:
+        """Rewrite the file sorted and deduplicated
+
+        `merge` adds candles from anywhere in time (e.g. older history or
+        filled gaps); on equal timestamps they replace archived ones.
+        Candles opened before `before` are dropped. The new file replaces
+        the old one atomically. Returns the number of records now stored.
+        """
+        records = np.array(self._records())
+        if merge is not None:
+            records = np.concatenate([records, _rows(merge)])
+        # Last occurrence of a timestamp wins: unique over the reversed rows
+        _, last = np.unique(records[::-1, TIME], return_index=True)
+        records = records[::-1][last]
+        if before is not None:
+            records = records[records[:, TIME] >= before]
+        temp = f"{self.path}.compact"
+        with open(temp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.step, len(FIELDS)).ljust(HEADER_SIZE, b'\0'))
+            f.write(np.ascontiguousarray(records).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._file.close()
+            os.replace(temp, self.path)
+            self._file = open(self.path, 'ab')
+            self._mapped = -1
+            self._index = np.empty(0)
+        return len(records)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CandleArchive:
+    """Archives of every series in one directory, opened on first use"""
+
+    def __init__(self, directory: str = CANDLE_ARCHIVE_DIR):
+        self.directory = directory
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def series(self, symbol: str, timeframe: str) -> SeriesArchive:
+        """Archive of one series, created if missing"""
+        key = (symbol, timeframe)
+        with self._lock:
+            archive = self._series.get(key)
+            if archive is None:
+                path = os.path.join(self.directory, archive_name(symbol, timeframe))
+                archive = self._series[key] = SeriesArchive(path, timeframe)
+            return archive
+
+    def open_all(self, symbols, timeframes) -> dict:
+        """Open (map) the archives of every symbol x timeframe"""
+        return {(symbol, timeframe): self.series(symbol, timeframe)
+                for symbol in symbols for timeframe in timeframes}
+
+    def append(self, symbol: str, timeframe: str, candles) -> int:
+        return self.series(symbol, timeframe).append(candles)
+
+    def on_candle_closed(self, symbol: str, timeframe: str, candle):
+        """CandleStore.ingest() callback: archive every closed candle"""
+        try:
+            self.append(symbol, timeframe, candle)
+        except Exception as e:
+            logger.error(f"Error archiving candle for {symbol} {timeframe}: {e}")
+
+    def load_into(self, store: CandleStore) -> int:
+        """Fill empty store buffers with the newest archived candles"""
+        loaded = 0
+        for (symbol, timeframe), buffer in store.items():
+            if len(buffer):
+                continue
+            candles = self.series(symbol, timeframe).tail(store.capacity)
+            buffer.extend(candles)
+            loaded += candles.shape[1]
+        return loaded
+
+    def close(self):
+        with self._lock:
+            for archive in self._series.values():
+                archive.close()
+            self._series.clear()
@@ -0,0 +1,268 @@
+"""
+Vectorized backtest of trading idea levels on historical candles
+
+An idea opens at the close of a candle and has three take profits and a
+stop loss at fixed fractions of the entry price (IDEA_TAKE_PROFITS and
+IDEA_STOP_LOSS for the ideas the bot publishes). A third of the position
+closes at each take profit; whatever is left closes at the stop, or at the
+close of the last candle when the horizon runs out.
+
+For every entry the running high and low of the following candles are
+precomputed once. They only grow away from the entry, so the first candle
+touching a level is a binary search, and all entries x parameter sets are
+answered by a single np.searchsorted call per level. When a take profit and
+the stop fall within the same candle the stop is assumed to come first.
+"""
+
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from market.candles import CandleStore, candle_store, HIGH, LOW, CLOSE
+from market.indicators import macd
+from config import IDEA_TAKE_PROFITS, IDEA_STOP_LOSS, BACKTEST_WORKERS
+
+# One parameter set: take profit fractions, stop fraction, horizon in
+# candles and direction (1 LONG, -1 SHORT, 0 follow the MACD histogram
+# like generate_trading_idea)
+PARAM_DTYPE = np.dtype([('tp', 'f8', 3), ('stop', 'f8'), ('horizon', 'i4'), ('direction', 'i1')])
+
+# Per parameter set: ideas evaluated, share of ideas reaching each take
+# profit, stopped before TP1, expired before TP1 or the stop, average
+# candles to each take profit, mean return per idea and share of winners
+RESULT_DTYPE = np.dtype([
+    ('ideas', 'i8'), ('tp_fill', 'f8', 3), ('stopped', 'f8'), ('expired', 'f8'),
+    ('bars_to_tp', 'f8', 3), ('pnl', 'f8'), ('win_rate', 'f8')
+])
+
+DIRECTIONS = {'LONG': 1, 'SHORT': -1, 'MACD': 0}
+
+# Candles before the first entry, so the MACD histogram has settled
+WARMUP = 35
+
+# Moves are clipped to [-1, MOVE_CAP] so rows can be stacked into one sorted array
+MOVE_CAP = 10.0
+
+# Parameter sets evaluated per vectorized step (bounds temporary arrays)
+CHUNK = 256
+
+
+def idea_params(horizon: int = 48, direction: int = 0) -> np.ndarray:
+    """Parameter set of the ideas the bot publishes"""
+    params = np.zeros(1, dtype=PARAM_DTYPE)
+    params[0] = (IDEA_TAKE_PROFITS, IDEA_STOP_LOSS, horizon, direction)
+    return params
+
+
+def parameter_grid(take_profits, stops, horizons, directions=(0,)) -> np.ndarray:
+    """Every combination of increasing TP1 < TP2 < TP3, stop, horizon and direction"""
+    levels = list(itertools.combinations(sorted(set(take_profits)), 3))
+    grid = list(itertools.product(levels, stops, horizons, directions))
+    params = np.zeros(len(grid), dtype=PARAM_DTYPE)
+    for i, row in enumerate(grid):
+        params[i] = row
+    return params
+
+
+def load_history(store: CandleStore = None, timeframe: str = '1h') -> dict:
+    """(6, n) candle arrays of every pair with data in the store"""
+    store = store if store is not None else candle_store
+    history = {}
+    for symbol in store.symbols:
+        window = store.series(symbol, timeframe).window()
+        if window.shape[1]:
+            history[symbol] = window.copy()
+    return history
+
+
+class _Series:
+    """Forward running highs/lows of every entry of one pair"""
+
+    def __init__(self, candles: np.ndarray, max_horizon: int, warmup: int):
+        close = candles[CLOSE]
+        last_entry = len(close) - 1 - max_horizon
+        self.entries = np.arange(warmup, last_entry + 1)
+        self.horizon = max_horizon
+        self.close = close
+        if not len(self.entries):
+            return
+        entry = close[self.entries][:, None]
+        start = self.entries + 1
+        highs = sliding_window_view(candles[HIGH], max_horizon)[start]
+        lows = sliding_window_view(candles[LOW], max_horizon)[start]
+        # Best move up and down so far, as fractions of the entry price
+        rise = np.maximum.accumulate(highs, axis=1) / entry - 1
+        fall = 1 - np.minimum.accumulate(lows, axis=1) / entry
+        # Row r is shifted by r * (MOVE_CAP + 2): the whole matrix becomes
+        # one sorted array and searchsorted finds the first touch per row
+        self.offsets = np.arange(len(self.entries)) * (MOVE_CAP + 2.0)
+        self.rise = (np.clip(rise, -1, MOVE_CAP) + self.offsets[:, None]).ravel()
+        self.fall = (np.clip(fall, -1, MOVE_CAP) + self.offsets[:, None]).ravel()
+        self.row_starts = np.arange(len(self.entries)) * max_horizon
+        self.macd_side = np.where(np.nan_to_num(macd(close)[2])[self.entries] >= 0, 1, -1)
+
+    def first_touch(self, moves: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """(levels, entries) index of the first candle reaching each level
+
+        max_horizon where the level is never reached.
+        """
+        queries = np.minimum(levels, MOVE_CAP)[:, None] + self.offsets[None, :]
+        return (np.searchsorted(moves, queries) - self.row_starts[None, :]).astype(np.int32)
+
+    def evaluate(self, params: np.ndarray) -> dict:
+        """Summed outcomes of one chunk of parameter sets"""
+        count = len(params)
+        sums = {
+            'ideas': np.full(count, len(self.entries)),
+            'fills': np.zeros((count, 3)),
+            'stopped': np.zeros(count),
+            'expired': np.zeros(count),
+            'bars': np.zeros((count, 3)),
+            'pnl': np.zeros(count),
+            'wins': np.zeros(count)
+        }
+        if not len(self.entries):
+            return sums
+        # A grid repeats a handful of distinct levels: search each one once
+        levels, index = np.unique(np.column_stack([params['tp'], params['stop']]), return_inverse=True)
+        index = index.reshape(count, 4)
+        up, down = self.first_touch(self.rise, levels), self.first_touch(self.fall, levels)
+
+        side = np.where(params['direction'][:, None] == 0, self.macd_side[None, :], params['direction'][:, None])
+        is_long = side > 0
+
+        def touch(column, adverse=False):
+            """First touch of one level per parameter set, in the trade's direction"""
+            favourable, against = (down, up) if adverse else (up, down)
+            return np.where(is_long, favourable[index[:, column]], against[index[:, column]])
+
+        horizon = params['horizon'][:, None]
+        stop = params['stop'][:, None]
+        stop_at = touch(3, adverse=True)
+        stop_hit = stop_at < horizon
+        exit_price = self.close[self.entries[None, :] + horizon]
+        expiry = side * (exit_price / self.close[self.entries][None, :] - 1)
+
+        pnl = np.zeros(side.shape)
+        for k in range(3):
+            level = params['tp'][:, k]
+            tp_at = touch(k)
+            # Same candle as the stop counts as stopped
+            filled = (tp_at < horizon) & (tp_at < stop_at)
+            pnl += np.where(filled, level[:, None], np.where(stop_hit, -stop, expiry)) / 3
+            sums['fills'][:, k] = filled.sum(axis=1)
+            sums['bars'][:, k] = np.where(filled, tp_at + 1, 0).sum(axis=1)
+            if k == 0:
+                sums['stopped'] = (stop_hit & ~filled).sum(axis=1)
+                sums['expired'] = (~stop_hit & ~filled).sum(axis=1)
+        sums['pnl'] = pnl.sum(axis=1)
+        sums['wins'] = (pnl > 0).sum(axis=1)
+        return sums
+
+
+def _results(sums: dict) -> np.ndarray:
+    """Summed outcomes -> RESULT_DTYPE rows"""
+    results = np.zeros(len(sums['ideas']), dtype=RESULT_DTYPE)
+    ideas = np.maximum(sums['ideas'], 1)[:, None]
+    fills = sums['fills']
+    results['ideas'] = sums['ideas']
+    results['tp_fill'] = fills / ideas
+    results['stopped'] = sums['stopped'] / ideas[:, 0]
+    results['expired'] = sums['expired'] / ideas[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['bars_to_tp'] = np.where(fills > 0, sums['bars'] / fills, np.nan)
+    results['pnl'] = sums['pnl'] / ideas[:, 0]
+    results['win_rate'] = sums['wins'] / ideas[:, 0]
+    return results
+
+
+class Backtester:
+    """Evaluates idea parameter sets over the history of several pairs"""
+
+    def __init__(self, history: dict, max_horizon: int, warmup: int = WARMUP):
+        self.max_horizon = max_horizon
+        self.series = {
+            symbol: _Series(np.asarray(candles, dtype=np.float64), max_horizon, warmup)
+            for symbol, candles in history.items()
+        }
+
+    @property
+    def entries(self) -> int:
+        """Entries per parameter set, over all pairs"""
+        return sum(len(series.entries) for series in self.series.values())
+
+    def evaluate(self, params: np.ndarray, symbols=None) -> np.ndarray:
+        """RESULT_DTYPE row per parameter set, pooled over the pairs"""
+        params = np.asarray(params, dtype=PARAM_DTYPE)
+        if len(params) and params['horizon'].max() > self.max_horizon:
+            raise ValueError(f"horizon above max_horizon={self.max_horizon}")
+        series = [self.series[symbol] for symbol in symbols] if symbols else list(self.series.values())
+        results = []
+        for start in range(0, len(params), CHUNK):
+            chunk = params[start:start + CHUNK]
+            total = None
+            for one in series:
+                sums = one.evaluate(chunk)
+                total = sums if total is None else {key: total[key] + sums[key] for key in total}
+            results.append(_results(total))
+        return np.concatenate(results) if results else np.zeros(0, dtype=RESULT_DTYPE)
+
+    def per_symbol(self, params: np.ndarray) -> dict:
+        """Results of each pair separately"""
+        return {symbol: self.evaluate(params, [symbol]) for symbol in self.series}
+
+
+# Backtester of the current worker process, built once by the initializer
+_worker = None
+
+
+def _init_worker(history: dict, max_horizon: int):
+    global _worker
+    _worker = Backtester(history, max_horizon)
+
+
+def _evaluate_chunk(params: np.ndarray) -> np.ndarray:
+    return _worker.evaluate(params)
+
+
+def sweep(history: dict, params: np.ndarray, workers: int = BACKTEST_WORKERS) -> np.ndarray:
+    """Evaluate a parameter grid across CPU cores
+
+    Every worker process prepares the history once and then takes chunks of
+    the grid; results come back in grid order.
+    """
+    params = np.asarray(params, dtype=PARAM_DTYPE)
+    max_horizon = int(params['horizon'].max())
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(params) <= CHUNK:
+        return Backtester(history, max_horizon).evaluate(params)
+    chunks = np.array_split(params, max(workers * 4, len(params) // (CHUNK * 4)))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(history, max_horizon)
+    ) as pool:
+        return np.concatenate(list(pool.map(_evaluate_chunk, chunks)))
+
+
+def top(params: np.ndarray, results: np.ndarray, n: int = 10, by: str = 'pnl') -> list:
+    """Best n parameter sets as plain dicts"""
+    order = np.argsort(-results[by], kind='stable')[:n]
+    rows = []
+    for i in order:
+        rows.append({
+            'take_profits': [round(float(level), 4) for level in params['tp'][i]],
+            'stop': round(float(params['stop'][i]), 4),
+            'horizon': int(params['horizon'][i]),
+            'direction': int(params['direction'][i]),
+            'ideas': int(results['ideas'][i]),
+            'tp_fill': [round(float(rate), 4) for rate in results['tp_fill'][i]],
+            'stopped': round(float(results['stopped'][i]), 4),
+            'expired': round(float(results['expired'][i]), 4),
+            'pnl': round(float(results['pnl'][i]), 6),
+            'win_rate': round(float(results['win_rate'][i]), 4)
+        })
+    return rows
@@ -0,0 +1,363 @@
+"""
+In-memory OHLCV candle storage backed by NumPy ring buffers
+"""
+
+import multiprocessing
+import sys
+import threading
+import time as _time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from market.symbols import SymbolRegistry, symbol_registry
+from config import DEFAULT_TRADING_PAIRS, TIMEFRAMES, CANDLE_BUFFER_SIZE, CANDLE_STORE_SHM
+
+# Column order of every candle array
+FIELDS = ('time', 'open', 'high', 'low', 'close', 'volume')
+TIME, OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(FIELDS))
+
+# Timeframe durations in seconds
+TIMEFRAME_SECONDS = {
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '1h': 3600,
+    '4h': 4 * 3600,
+    '1d': 86400,
+    '1w': 7 * 86400
+}
+
+# Exchange weeks start on Monday; the Unix epoch was a Thursday
+WEEK_OFFSET = 4 * 86400
+
+
+def candle_open(time: float, timeframe: str) -> float:
+    """Open time of the candle of a timeframe that contains `time`"""
+    step = TIMEFRAME_SECONDS[timeframe]
+    offset = WEEK_OFFSET if timeframe == '1w' else 0
+    return (time - offset) // step * step + offset
+
+
+class CandleBuffer:
+    """Fixed-capacity columnar ring buffer of candles for one series
+
+    Every candle is written twice, at slot i and i + capacity, so the most
+    recent n candles always form one contiguous slice of the backing array.
+    That makes appends O(1) and window() a zero-copy view; the price is
+    2x memory, which stays fixed at 2 * capacity * 6 float64 values.
+
+    Timestamps are candle open times in seconds. The last candle may still
+    be forming: upsert() with its timestamp overwrites it in place.
+    """
+
+    def __init__(self, capacity: int = CANDLE_BUFFER_SIZE):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._data = np.zeros((len(FIELDS), 2 * capacity), dtype=np.float64)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the backing array"""
+        return self._data.nbytes
+
+    @property
+    def last_time(self) -> float:
+        """Open time of the newest candle, or 0 when empty"""
+        if not self._count:
+            return 0.0
+        return self._data[TIME, self._head - 1 + self.capacity]
+
+    def _write(self, slot: int, candle):
+        self._data[:, slot] = candle
+        self._data[:, slot + self.capacity] = candle
+
+    def append(self, time, open, high, low, close, volume):
+        """Add a new candle, evicting the oldest when full"""
+        with self._lock:
+            self._write(self._head, (time, open, high, low, close, volume))
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def upsert(self, time, open, high, low, close, volume) -> bool:
+        """Append a newer candle or overwrite the still-forming last one
+
+        Returns False for candles older than the newest one.
+        """
+        with self._lock:
+            if self._count:
+                last = self._data[TIME, self._head - 1 + self.capacity]
+                if time == last:
+                    slot = (self._head - 1) % self.capacity
+                    self._write(slot, (time, open, high, low, close, volume))
+                    return True
+                if time < last:
+                    return False
+            self._write(self._head, (time, open, high, low, close, volume))
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            return True
+
+    def extend(self, candles: np.ndarray):
+        """Append a (n, 6) or (6, n) batch of candles in time order"""
+        candles = np.asarray(candles, dtype=np.float64)
+        if candles.shape[0] != len(FIELDS):
+            candles = candles.T
+        if candles.shape[0] != len(FIELDS):
+            raise ValueError(f"expected candles with {len(FIELDS)} fields")
+        # Only the newest `capacity` candles can survive
+        candles = candles[:, -self.capacity:]
+        n = candles.shape[1]
+        if not n:
+            return
+        with self._lock:
+            slots = (self._head + np.arange(n)) % self.capacity
+            self._data[:, slots] = candles
+            self._data[:, slots + self.capacity] = candles
+            self._head = (self._head + n) % self.capacity
+            self._count = min(self._count + n, self.capacity)
+
+    def window(self, n: int = None) -> np.ndarray:
+        """Zero-copy (6, n) view of the newest n candles, oldest first
+
+        The view is read-only and reflects later writes to those slots, so
+        copy it if it must outlive further appends.
+        """
+        n = self._count if n is None else min(n, self._count)
+        end = self._head + self.capacity
+        view = self._data[:, end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def column(self, field: str, n: int = None) -> np.ndarray:
+        """Zero-copy view of one field over the newest n candles"""
+        return self.window(n)[FIELDS.index(field)]
+
+    def last(self):
+        """Newest candle as a 1-D array, or None when empty"""
+        if not self._count:
+            return None
+        return self.window(1)[:, 0]
+
+
+class CandleStore:
+    """Candle buffers for every symbol and timeframe
+
+    Symbols are interned in a SymbolRegistry, and the buffers of each
+    timeframe sit in a list indexed by symbol ID, so the *_by_id methods
+    find a series without hashing a name. Several stores may share one
+    registry, in which case a store holds the IDs it added (`ids`) and
+    None elsewhere. By default every store gets a registry of its own.
+    """
+
+    def __init__(self, symbols=DEFAULT_TRADING_PAIRS, timeframes=TIMEFRAMES,
+                 capacity: int = CANDLE_BUFFER_SIZE, registry: SymbolRegistry = None):
+        self.capacity = capacity
+        self.timeframes = list(timeframes)
+        self.registry = registry if registry is not None else SymbolRegistry(symbols)
+        self._series = {timeframe: [] for timeframe in self.timeframes}
+        self._ids = []
+        for symbol in symbols:
+            self.add_symbol(symbol)
+
+    def _new_buffer(self, symbol_id: int, timeframe: str) -> CandleBuffer:
+        return CandleBuffer(self.capacity)
+
+    def add_symbol(self, symbol: str) -> int:
+        """Create buffers for a new symbol; returns its ID"""
+        symbol_id = self.registry.intern(symbol)
+        for timeframe, buffers in self._series.items():
+            if symbol_id >= len(buffers):
+                buffers.extend([None] * (symbol_id + 1 - len(buffers)))
+            if buffers[symbol_id] is None:
+                buffers[symbol_id] = self._new_buffer(symbol_id, timeframe)
+        if symbol_id not in self._ids:
+            self._ids.append(symbol_id)
+        return symbol_id
+
+    def series(self, symbol: str, timeframe: str) -> CandleBuffer:
+        """Buffer for one series; KeyError for unknown symbols"""
+        buffer = self.get(symbol, timeframe)
+        if buffer is None:
+            raise KeyError((symbol, timeframe))
+        return buffer
+
+    def get(self, symbol: str, timeframe: str):
+        """Buffer for one series, or None"""
+        symbol_id = self.registry.get(symbol)
+        buffers = self._series.get(timeframe)
+        if symbol_id is None or buffers is None or symbol_id >= len(buffers):
+            return None
+        return buffers[symbol_id]
+
+    def get_by_id(self, symbol_id: int, timeframe: str):
+        """Buffer for one series by symbol ID, or None"""
+        buffers = self._series.get(timeframe)
+        if buffers is None or symbol_id >= len(buffers):
+            return None
+        return buffers[symbol_id]
+
+    def ingest(self, symbol: str, timeframe: str, candles, on_close=None) -> int:
+        """Upsert candles (rows of time, open, high, low, close, volume)
+
+        When a candle newer than the last stored one arrives, the previous
+        last candle is final: on_close(symbol, timeframe, candle) is called
+        for it. Returns the number of candles that closed.
+        """
+        buffer = self.series(symbol, timeframe)
+        closed = 0
+        for candle in candles:
+            previous = buffer.last()
+            is_new = previous is None or candle[TIME] > previous[TIME]
+            if previous is not None and is_new:
+                previous = previous.copy()
+            if not buffer.upsert(*candle):
+                continue
+            if previous is not None and is_new:
+                closed += 1
+                if on_close is not None:
+                    on_close(symbol, timeframe, previous)
+        return closed
+
+    def closed_window(self, symbol: str, timeframe: str, now: float = None) -> np.ndarray:
+        """Window of finished candles, without a still-forming last candle"""
+        buffer = self.series(symbol, timeframe)
+        window = buffer.window()
+        now = _time.time() if now is None else now
+        if len(buffer) and window[TIME, -1] + TIMEFRAME_SECONDS[timeframe] > now:
+            return window[:, :-1]
+        return window
+
+    @property
+    def ids(self) -> list:
+        """IDs of the symbols held, in the order they were added"""
+        return self._ids
+
+    @property
+    def symbols(self) -> list:
+        names = self.registry.names
+        return [names[symbol_id] for symbol_id in self._ids]
+
+    def items(self):
+        """Iterate over ((symbol, timeframe), buffer) pairs"""
+        names = self.registry.names
+        for symbol_id in list(self._ids):
+            for timeframe in self.timeframes:
+                yield (names[symbol_id], timeframe), self._series[timeframe][symbol_id]
+
+    def last_price(self, symbol: str):
+        """Latest close over the shortest timeframe that has data"""
+        for timeframe in self.timeframes:
+            buffer = self.get(symbol, timeframe)
+            if buffer is not None and len(buffer):
+                return float(buffer.last()[CLOSE])
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for _, buffer in self.items())
+
+
+class SharedCandleBuffer(CandleBuffer):
+    """CandleBuffer over arrays it does not own, e.g. in shared memory
+
+    The ring position lives in `state` next to the candles, so every
+    process mapping the same memory sees the same window. Candles are
+    written before the position moves; only one process may write.
+    """
+
+    def __init__(self, data: np.ndarray, state: np.ndarray):
+        self.capacity = data.shape[1] // 2
+        self._data = data
+        self._state = state
+        self._lock = threading.Lock()
+
+    @property
+    def _head(self) -> int:
+        return int(self._state[0])
+
+    @_head.setter
+    def _head(self, value: int):
+        self._state[0] = value
+
+    @property
+    def _count(self) -> int:
+        return int(self._state[1])
+
+    @_count.setter
+    def _count(self, value: int):
+        self._state[1] = value
+
+
+class SharedCandleStore(CandleStore):
+    """CandleStore held in one shared memory block
+
+    Without a name a new block is created; its owner fills it and unlinks
+    it when done. Other processes attach by name and read the same candles
+    without copies. Every process must use the same symbols, timeframes
+    and capacity; the set of series is fixed when the block is created.
+    """
+
+    def __init__(self, symbols=DEFAULT_TRADING_PAIRS, timeframes=TIMEFRAMES,
+                 capacity: int = CANDLE_BUFFER_SIZE, name: str = None, registry: SymbolRegistry = None):
+        symbols = list(symbols)
+        keys = [(symbol, timeframe) for symbol in symbols for timeframe in timeframes]
+        state_bytes = len(keys) * 2 * 8
+        size = state_bytes + len(keys) * len(FIELDS) * 2 * capacity * 8
+        self.owner = name is None
+        if sys.version_info >= (3, 13):
+            # Only the owner's resource tracker may unlink the block
+            self._shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0,
+                                                   track=self.owner)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+            # Children started by multiprocessing share the owner's resource
+            # tracker; other processes registered the block with a tracker of
+            # their own, which would unlink it when they exit
+            if not self.owner and multiprocessing.parent_process() is None:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        if not self.owner:
+            if self._shm.size < size:
+                self._shm.close()
+                raise ValueError(f"shared candle store {name} has a different layout")
+        state = np.ndarray((len(keys), 2), dtype=np.int64, buffer=self._shm.buf)
+        data = np.ndarray((len(keys), len(FIELDS), 2 * capacity), dtype=np.float64,
+                          buffer=self._shm.buf, offset=state_bytes)
+        # Slots of the block, by (symbol, timeframe)
+        self._slots = {key: (data[i], state[i]) for i, key in enumerate(keys)}
+        super().__init__(symbols, timeframes, capacity, registry)
+
+    def _new_buffer(self, symbol_id: int, timeframe: str) -> CandleBuffer:
+        slot = self._slots.get((self.registry.name(symbol_id), timeframe))
+        if slot is None:
+            raise ValueError(f"{self.registry.name(symbol_id)} is not in the shared candle store")
+        return SharedCandleBuffer(*slot)
+
+    @property
+    def name(self) -> str:
+        """Name other processes attach with"""
+        return self._shm.name
+
+    def close(self):
+        """Unmap the block, and remove it when this process created it"""
+        self._series = {timeframe: [] for timeframe in self.timeframes}
+        self._slots = {}
+        self._ids = []
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views of the candles are still referenced; the mapping goes with the process
+            pass
+        if self.owner:
+            self._shm.unlink()
+
+
+# Store for the bot process; sharded workers attach to the one filled by
+# the receiving process
+candle_store = (SharedCandleStore(name=CANDLE_STORE_SHM, registry=symbol_registry) if CANDLE_STORE_SHM
+                else CandleStore(registry=symbol_registry))
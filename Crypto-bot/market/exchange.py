@@ -0,0 +1,361 @@
+"""
+Async exchange market data client (Binance-compatible REST API)
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+import aiohttp
+import numpy as np
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from market.candles import CandleStore, candle_store, TIMEFRAME_SECONDS, CLOSE
+from market.indicators import IndicatorEngine, indicator_engine
+from market.archive import CandleArchive
+from market.symbols import exchange_symbol
+from config import (
+    DEFAULT_TRADING_PAIRS,
+    TIMEFRAMES,
+    EXCHANGE_URL,
+    EXCHANGE_MAX_CONCURRENCY,
+    EXCHANGE_TIMEOUT,
+    MARKET_DATA_REFRESH,
+    CANDLE_ARCHIVE_DIR,
+    SYMBOLS_SOURCE,
+    SYMBOL_QUOTE_ASSETS,
+    SYMBOLS_REFRESH
+)
+
+logger = setup_logger()
+
+# Largest page the klines endpoint returns
+KLINES_PAGE = 1000
+
+
+class ExchangeError(Exception):
+    """Exchange request failed after all retries"""
+
+
+def parse_klines(rows: list) -> np.ndarray:
+    """Kline rows -> (n, 6) array with open time in seconds"""
+    if not rows:
+        return np.empty((0, 6))
+    data = np.array([row[:6] for row in rows], dtype=np.float64)
+    data[:, 0] /= 1000.0
+    return data
+
+
+def parse_exchange_info(payload: dict, quotes=SYMBOL_QUOTE_ASSETS) -> list:
+    """exchangeInfo -> listings for SymbolRegistry.load(), for the given quote assets"""
+    listings = []
+    for row in payload.get('symbols', []):
+        if row['quoteAsset'] not in quotes:
+            continue
+        price_filter = next((f for f in row.get('filters', []) if f['filterType'] == 'PRICE_FILTER'), {})
+        listings.append({
+            'pair': f"{row['baseAsset']}/{row['quoteAsset']}",
+            'status': row['status'],
+            'tick_size': float(price_filter.get('tickSize', 0.0))
+        })
+    return listings
+
+
+class ExchangeClient:
+    """Market data client over one pooled keep-alive session
+
+    A semaphore bounds the number of requests in flight, which is also the
+    size of the connection pool, so connections are reused rather than
+    opened per request. Tickers for all pairs come from one batched request.
+    429, 418 and 5xx responses and network errors are retried with
+    exponential backoff and jitter, honouring Retry-After.
+    """
+
+    def __init__(self, base_url: str = EXCHANGE_URL, max_concurrency: int = EXCHANGE_MAX_CONCURRENCY,
+                 timeout: float = EXCHANGE_TIMEOUT, max_retries: int = 5, backoff: float = 0.5):
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = None
+        self._limiter = None
+        self.stats = {'requests': 0, 'retries': 0, 'errors': 0}
+        self.latencies = deque(maxlen=10000)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """Create the pooled session"""
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self._limiter = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get(self, path: str, params: dict):
+        """GET a JSON endpoint with bounded concurrency and retries"""
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self._limiter:
+                started = time.perf_counter()
+                self.stats['requests'] += 1
+                try:
+                    async with self.session.get(url, params=params) as response:
+                        if response.status == 200:
+                            payload = await response.json()
+                            self.latencies.append(time.perf_counter() - started)
+                            return payload
+                        body = await response.text()
+                        if response.status not in (418, 429) and response.status < 500:
+                            self.stats['errors'] += 1
+                            raise ExchangeError(f"{path} returned {response.status}: {body[:200]}")
+                        retry_after = response.headers.get('Retry-After')
+                        error = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = repr(e)
+
+            if attempt == self.max_retries:
+                break
+            self.stats['retries'] += 1
+            delay = float(retry_after) if retry_after else self.backoff * 2 ** attempt
+            delay *= 1 + random.random() * 0.25
+            logger.warning(f"Exchange request {path} failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+        self.stats['errors'] += 1
+        raise ExchangeError(f"{path} failed after {self.max_retries + 1} attempts: {error}")
+
+    async def fetch_klines(self, pair: str, timeframe: str, limit: int = KLINES_PAGE,
+                           start_time: float = None) -> np.ndarray:
+        """Up to `limit` (<= 1000) candles as an (n, 6) array"""
+        params = {'symbol': exchange_symbol(pair), 'interval': timeframe, 'limit': min(limit, KLINES_PAGE)}
+        if start_time is not None:
+            params['startTime'] = int(start_time * 1000)
+        return parse_klines(await self._get('/api/v3/klines', params))
+
+    async def fetch_history(self, pair: str, timeframe: str, count: int) -> np.ndarray:
+        """The newest `count` candles, fetched page by page concurrently"""
+        step = TIMEFRAME_SECONDS[timeframe]
+        now = time.time()
+        first = (now // step - count + 1) * step
+        starts = [first + i * step * KLINES_PAGE for i in range((count + KLINES_PAGE - 1) // KLINES_PAGE)]
+        pages = await asyncio.gather(*(
+            self.fetch_klines(pair, timeframe, min(KLINES_PAGE, count - i * KLINES_PAGE), start)
+            for i, start in enumerate(starts)
+        ))
+        data = np.concatenate(pages) if pages else np.empty((0, 6))
+        # Pages may overlap at the edges; keep unique, ordered open times
+        _, unique = np.unique(data[:, 0], return_index=True)
+        return data[unique][-count:]
+
+    async def fetch_tickers(self, pairs=DEFAULT_TRADING_PAIRS) -> dict:
+        """24h tickers for all pairs in one batched request"""
+        symbols = {exchange_symbol(pair): pair for pair in pairs}
+        rows = await self._get('/api/v3/ticker/24hr', {
+            'symbols': json.dumps(list(symbols), separators=(',', ':'))
+        })
+        return {
+            symbols[row['symbol']]: {
+                'price': float(row['lastPrice']),
+                'change_percent': float(row['priceChangePercent']),
+                'volume': float(row['quoteVolume'])
+            }
+            for row in rows if row['symbol'] in symbols
+        }
+
+    async def fetch_listings(self, quotes=SYMBOL_QUOTE_ASSETS) -> list:
+        """Every pair listed for the given quote assets, with its status and tick size"""
+        return parse_exchange_info(await self._get('/api/v3/exchangeInfo', {}), quotes)
+
+    async def fetch_all_klines(self, pairs=DEFAULT_TRADING_PAIRS, timeframes=TIMEFRAMES,
+                               limit: int = 2) -> dict:
+        """Latest candles for every pair x timeframe, fetched concurrently"""
+        keys = [(pair, timeframe) for pair in pairs for timeframe in timeframes]
+        results = await asyncio.gather(
+            *(self.fetch_klines(pair, timeframe, limit) for pair, timeframe in keys),
+            return_exceptions=True
+        )
+        klines = {}
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to fetch klines for {key[0]} {key[1]}: {result}")
+            else:
+                klines[key] = result
+        return klines
+
+    def latency_percentiles(self) -> dict:
+        """p50/p90/p99 request latency in milliseconds"""
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.fromiter(self.latencies, dtype=np.float64), [50, 90, 99]) * 1000
+        return {name: round(float(value), 2) for name, value in zip(('p50', 'p90', 'p99'), values)}
+
+
+class MarketDataService:
+    """Keeps the candle store and indicators in sync with the exchange
+
+    With an archive, the store is filled from disk on start, only candles
+    newer than the archive are fetched, and every closed candle is appended
+    to it. After every refresh, on_price(symbol, price) gets the latest
+    price of each symbol. With symbols from the exchange, the listing is
+    loaded before the backfill and reloaded every `symbols_refresh`
+    seconds: new pairs are added to the store and backfilled while the
+    service runs, and pairs no longer trading are skipped.
+    """
+
+    def __init__(self, client: ExchangeClient = None, store: CandleStore = None,
+                 engine: IndicatorEngine = None, refresh: float = MARKET_DATA_REFRESH,
+                 archive: CandleArchive = None, on_price=None,
+                 symbols_source: str = SYMBOLS_SOURCE, symbols_refresh: float = SYMBOLS_REFRESH):
+        self.client = client or ExchangeClient()
+        self.store = store or candle_store
+        self.engine = engine or indicator_engine
+        self.refresh = refresh
+        self.on_price = on_price
+        self.symbols_source = symbols_source
+        self.symbols_refresh = symbols_refresh
+        if archive is None and CANDLE_ARCHIVE_DIR:
+            archive = CandleArchive(CANDLE_ARCHIVE_DIR)
+        self.archive = archive
+
+    @property
+    def trading_symbols(self) -> list:
+        """Symbols of the store whose listing is trading"""
+        registry = self.store.registry
+        return [registry.name(symbol_id) for symbol_id in registry.trading(self.store.ids)]
+
+    def _missing(self, symbol: str, timeframe: str, count: int) -> int:
+        """Candles to fetch for a series: everything after the archived ones"""
+        buffer = self.store.series(symbol, timeframe)
+        if not len(buffer):
+            return count
+        step = TIMEFRAME_SECONDS[timeframe]
+        return max(1, min(count, int((time.time() - buffer.last_time) // step) + 1))
+
+    async def backfill(self, count: int = None, symbols: list = None):
+        """Load history for every trading series (or those of `symbols`) and rebuild indicators"""
+        count = count or self.store.capacity
+        if self.archive is not None:
+            loaded = self.archive.load_into(self.store)
+            logger.info(f"Loaded {loaded} candles from the archive")
+        keys = [(symbol, timeframe) for symbol in (self.trading_symbols if symbols is None else symbols)
+                for timeframe in self.store.timeframes]
+        histories = await asyncio.gather(
+            *(self.client.fetch_history(symbol, timeframe, self._missing(symbol, timeframe, count))
+              for symbol, timeframe in keys),
+            return_exceptions=True
+        )
+        now = time.time()
+        for (symbol, timeframe), history in zip(keys, histories):
+            if isinstance(history, Exception):
+                logger.error(f"Backfill failed for {symbol} {timeframe}: {history}")
+                continue
+            buffer = self.store.series(symbol, timeframe)
+            new = history[history[:, 0] > buffer.last_time] if len(buffer) else history
+            buffer.extend(new)
+            if self.archive is not None:
+                closed = new[new[:, 0] + TIMEFRAME_SECONDS[timeframe] <= now]
+                self.archive.append(symbol, timeframe, closed)
+        if symbols is None:
+            self.engine.backfill()
+        else:
+            for symbol in symbols:
+                self.engine.backfill(symbol)
+
+    async def reload_symbols(self, backfill: bool = True) -> list:
+        """Apply the exchange listing; returns the symbols added to the store
+
+        With `backfill`, the history of the added symbols is fetched too.
+        """
+        new = self.store.registry.load(await self.client.fetch_listings())
+        added = []
+        for symbol_id in new:
+            symbol = self.store.registry.name(symbol_id)
+            try:
+                self.store.add_symbol(symbol)
+            except ValueError as e:
+                logger.warning(f"Not tracking {symbol}: {e}")
+                continue
+            added.append(symbol)
+        metrics.set('market_symbols', len(self.trading_symbols))
+        if added:
+            logger.info(f"Listing reloaded: {len(added)} new pairs")
+            if backfill:
+                await self.backfill(symbols=added)
+        return added
+
+    async def _follow_listing(self):
+        """Reload the listing every `symbols_refresh` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(self.symbols_refresh)
+            try:
+                await self.reload_symbols()
+            except Exception as e:
+                logger.error(f"Symbol listing reload failed: {e}")
+
+    async def load_listing(self):
+        """With symbols from the exchange, load the listing and start reloading it
+
+        Returns the reload task, or None.
+        """
+        if self.symbols_source != 'exchange':
+            return None
+        try:
+            await self.reload_symbols(backfill=False)
+        except Exception as e:
+            logger.error(f"Symbol listing load failed, keeping {len(self.store.ids)} pairs: {e}")
+        return asyncio.create_task(self._follow_listing()) if self.symbols_refresh > 0 else None
+
+    def _on_close(self, symbol: str, timeframe: str, candle):
+        self.engine.on_candle_closed(symbol, timeframe, candle)
+        if self.archive is not None:
+            self.archive.on_candle_closed(symbol, timeframe, candle)
+
+    async def poll_once(self):
+        """Fetch the latest candles; closed candles advance the indicators"""
+        klines = await self.client.fetch_all_klines(self.trading_symbols, self.store.timeframes)
+        for (symbol, timeframe), rows in klines.items():
+            self.store.ingest(symbol, timeframe, rows, on_close=self._on_close)
+            if self.on_price is not None and timeframe == self.store.timeframes[0] and len(rows):
+                try:
+                    self.on_price(symbol, float(rows[-1][CLOSE]))
+                except Exception as e:
+                    logger.error(f"Error handling price update for {symbol}: {e}")
+
+    async def run(self):
+        """Backfill, then refresh every `refresh` seconds until cancelled"""
+        async with self.client:
+            listing = await self.load_listing()
+            try:
+                await self.backfill()
+                logger.info(f"Рыночные данные загружены: {len(self.store.symbols)} пар")
+                while True:
+                    await asyncio.sleep(self.refresh)
+                    try:
+                        await self.poll_once()
+                    except Exception as e:
+                        logger.error(f"Market data refresh failed: {e}")
+            finally:
+                if listing is not None:
+                    listing.cancel()
+
+    def start_thread(self):
+        """Run the service on its own event loop (for the blocking bot)"""
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),), name='market-data', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,162 @@
+"""
+Indicator formulas over NumPy arrays
+
+Pure functions without any store or engine state, so worker processes
+(e.g. the chart screenshot pool) can import them without side effects.
+"""
+
+import numpy as np
+
+# Indicator parameters
+RSI_PERIOD = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+STOCH_K = 14
+STOCH_D = 3
+FIB_LOOKBACK = 100
+FIB_RATIOS = (0.236, 0.382, 0.5, 0.618, 0.786)
+VOLUME_PERIOD = 20
+
+# Block length for the vectorized EMA; keeps decay^-block well inside
+# float64 precision for the periods used here
+EMA_BLOCK = 128
+
+
+# Batch computation over NumPy arrays. Every function works along the last
+# axis, so a (series, time) matrix is processed in one call.
+
+def ema(values: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponential moving average seeded with the first value
+
+    The recursion y[t] = alpha * x[t] + (1 - alpha) * y[t-1] is solved in
+    closed form block by block with cumulative sums, so there is no Python
+    loop per element.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(x)
+    n = x.shape[-1]
+    if not n:
+        return out
+    decay = 1.0 - alpha
+    steps = np.arange(EMA_BLOCK)
+    grow = decay ** -steps
+    shrink = decay ** steps
+    carry = decay ** (steps + 1)
+    prev = x[..., :1]
+    for start in range(0, n, EMA_BLOCK):
+        block = x[..., start:start + EMA_BLOCK]
+        m = block.shape[-1]
+        acc = np.cumsum(block * grow[:m], axis=-1)
+        y = carry[:m] * prev + alpha * shrink[:m] * acc
+        out[..., start:start + m] = y
+        prev = y[..., -1:]
+    return out
+
+
+def ema_last(values: np.ndarray, alpha: float) -> np.ndarray:
+    """Last value of ema(), as one dot product over the time axis
+
+    y[n-1] = (1 - alpha)^(n-1) * x[0] + alpha * sum (1 - alpha)^(n-1-i) * x[i]
+    for i >= 1, so when only the latest value is needed, one weight vector
+    replaces the pass over every element.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    n = x.shape[-1]
+    weights = alpha * (1.0 - alpha) ** np.arange(n - 1, -1, -1)
+    weights[0] = (1.0 - alpha) ** (n - 1)
+    return x @ weights
+
+
+def _rolling(values: np.ndarray, window: int, reducer) -> np.ndarray:
+    """Rolling reduction over the trailing window (shorter at the start)"""
+    x = np.asarray(values, dtype=np.float64)
+    pad_shape = x.shape[:-1] + (window - 1,)
+    padded = np.concatenate([np.full(pad_shape, np.nan), x], axis=-1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=-1)
+    return reducer(windows, axis=-1)
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """Simple moving average over the available history (up to period)"""
+    x = np.asarray(values, dtype=np.float64)
+    csum = np.cumsum(x, axis=-1)
+    out = csum.copy()
+    out[..., period:] = csum[..., period:] - csum[..., :-period]
+    counts = np.minimum(np.arange(1, x.shape[-1] + 1), period)
+    return out / counts
+
+
+def rsi(close: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """Wilder's RSI"""
+    close = np.asarray(close, dtype=np.float64)
+    change = np.diff(close, axis=-1, prepend=close[..., :1])
+    avg_gain = ema(np.clip(change, 0, None), 1.0 / period)
+    avg_loss = ema(np.clip(-change, 0, None), 1.0 / period)
+    return _rsi_value(avg_gain, avg_loss)
+
+
+def rsi_last(close: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """Latest value of rsi()"""
+    close = np.asarray(close, dtype=np.float64)
+    change = np.diff(close, axis=-1, prepend=close[..., :1])
+    return _rsi_value(ema_last(np.clip(change, 0, None), 1.0 / period),
+                      ema_last(np.clip(-change, 0, None), 1.0 / period))
+
+
+def _rsi_value(avg_gain, avg_loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    value = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), value)
+    return value
+
+
+def macd(close: np.ndarray, fast: int = MACD_FAST, slow: int = MACD_SLOW, signal: int = MACD_SIGNAL):
+    """MACD line, signal line and histogram"""
+    line = ema(close, 2.0 / (fast + 1)) - ema(close, 2.0 / (slow + 1))
+    signal_line = ema(line, 2.0 / (signal + 1))
+    return line, signal_line, line - signal_line
+
+
+def stochastic(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+               k_period: int = STOCH_K, d_period: int = STOCH_D):
+    """Stochastic oscillator %K and %D"""
+    highest = _rolling(high, k_period, np.nanmax)
+    lowest = _rolling(low, k_period, np.nanmin)
+    k = _stoch_value(np.asarray(close, dtype=np.float64), highest, lowest)
+    return k, sma(k, d_period)
+
+
+def _stoch_value(close, highest, lowest):
+    span = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = (close - lowest) / span * 100.0
+    return np.where(span == 0, 50.0, value)
+
+
+def fibonacci(high: np.ndarray, low: np.ndarray, lookback: int = FIB_LOOKBACK) -> dict:
+    """Retracement levels of the latest swing range within the lookback"""
+    swing_high = np.max(np.asarray(high)[..., -lookback:], axis=-1)
+    swing_low = np.min(np.asarray(low)[..., -lookback:], axis=-1)
+    return fib_levels(swing_high, swing_low)
+
+
+def fib_levels(swing_high, swing_low) -> dict:
+    """Retracement levels between a swing high and low"""
+    span = swing_high - swing_low
+    levels = {ratio: swing_high - span * ratio for ratio in FIB_RATIOS}
+    levels[0.0] = swing_high
+    levels[1.0] = swing_low
+    return levels
+
+
+def volume_profile(close: np.ndarray, volume: np.ndarray, period: int = VOLUME_PERIOD):
+    """Volume moving average, volume ratio to it and on-balance volume"""
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    average = sma(volume, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(average > 0, volume / average, 0.0)
+    direction = np.sign(np.diff(close, axis=-1, prepend=close[..., :1]))
+    obv = np.cumsum(direction * volume, axis=-1)
+    return average, ratio, obv
@@ -0,0 +1,263 @@
+"""
+Technical indicators: latest values of candle windows and O(1) live updates
+"""
+
+from collections import deque
+import numpy as np
+from market.candles import CandleStore, candle_store, TIME, HIGH, LOW, CLOSE, VOLUME
+# The batch formulas live in market.formulas; re-exported for existing callers
+from market.formulas import (
+    RSI_PERIOD, MACD_FAST, MACD_SLOW, MACD_SIGNAL, STOCH_K, STOCH_D, FIB_LOOKBACK, FIB_RATIOS,
+    VOLUME_PERIOD, ema, ema_last, sma, rsi, rsi_last, macd, stochastic, fibonacci, fib_levels,
+    volume_profile
+)
+
+
+def compute_all(candles: np.ndarray) -> dict:
+    """Latest value of every indicator from a (6, n) candle window"""
+    high, low, close, volume = candles[HIGH], candles[LOW], candles[CLOSE], candles[VOLUME]
+    line, signal_line, hist = macd(close)
+    k, d = stochastic(high, low, close)
+    average, ratio, obv = volume_profile(close, volume)
+    return {
+        'close': float(close[-1]),
+        'rsi': float(rsi(close)[-1]),
+        'macd': float(line[-1]),
+        'macd_signal': float(signal_line[-1]),
+        'macd_hist': float(hist[-1]),
+        'stoch_k': float(k[-1]),
+        'stoch_d': float(d[-1]),
+        'fibonacci': {ratio_: float(level) for ratio_, level in fibonacci(high, low).items()},
+        'volume_avg': float(average[-1]),
+        'volume_ratio': float(ratio[-1]),
+        'obv': float(obv[-1])
+    }
+
+
+# Incremental computation
+
+class _RollingExtreme:
+    """Max (or min) over a sliding window with a monotonic deque"""
+
+    __slots__ = ('window', 'sign', 'items', 'index')
+
+    def __init__(self, window: int, maximum: bool):
+        self.window = window
+        self.sign = 1.0 if maximum else -1.0
+        self.items = deque()
+        self.index = 0
+
+    def push(self, value: float) -> float:
+        key = value * self.sign
+        items = self.items
+        while items and items[-1][1] <= key:
+            items.pop()
+        items.append((self.index, key))
+        if items[0][0] <= self.index - self.window:
+            items.popleft()
+        self.index += 1
+        return items[0][1] * self.sign
+
+
+class _RollingMean:
+    """Mean over the trailing window"""
+
+    __slots__ = ('window', 'items', 'total')
+
+    def __init__(self, window: int):
+        self.window = window
+        self.items = deque()
+        self.total = 0.0
+
+    def push(self, value: float) -> float:
+        self.items.append(value)
+        self.total += value
+        if len(self.items) > self.window:
+            self.total -= self.items.popleft()
+        return self.total / len(self.items)
+
+
+class IndicatorState:
+    """Running indicator values for one live series
+
+    update() consumes one closed candle in O(1) and yields the same values
+    as compute_all() over the full history.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last_time = None
+        self.close = None
+        self.ema_fast = self.ema_slow = self.macd_signal = None
+        self.avg_gain = self.avg_loss = 0.0
+        self.obv = 0.0
+        self.highest = _RollingExtreme(STOCH_K, True)
+        self.lowest = _RollingExtreme(STOCH_K, False)
+        self.stoch_d = _RollingMean(STOCH_D)
+        self.swing_high = _RollingExtreme(FIB_LOOKBACK, True)
+        self.swing_low = _RollingExtreme(FIB_LOOKBACK, False)
+        self.volume_avg = _RollingMean(VOLUME_PERIOD)
+        self.values = {}
+
+    @classmethod
+    def from_history(cls, candles: np.ndarray):
+        """Seed the state from a (6, n) candle window with the batch functions"""
+        state = cls()
+        n = candles.shape[1]
+        if not n:
+            return state
+        high, low, close, volume = candles[HIGH], candles[LOW], candles[CLOSE], candles[VOLUME]
+
+        fast = ema(close, 2.0 / (MACD_FAST + 1))
+        slow = ema(close, 2.0 / (MACD_SLOW + 1))
+        signal_line = ema(fast - slow, 2.0 / (MACD_SIGNAL + 1))
+        change = np.diff(close, prepend=close[:1])
+        state.ema_fast, state.ema_slow = float(fast[-1]), float(slow[-1])
+        state.macd_signal = float(signal_line[-1])
+        state.avg_gain = float(ema(np.clip(change, 0, None), 1.0 / RSI_PERIOD)[-1])
+        state.avg_loss = float(ema(np.clip(-change, 0, None), 1.0 / RSI_PERIOD)[-1])
+        state.obv = float(np.sum(np.sign(change) * volume))
+
+        # Rolling windows only need their trailing values
+        for value in high[-STOCH_K:]:
+            state.highest.push(float(value))
+        for value in low[-STOCH_K:]:
+            state.lowest.push(float(value))
+        k, _ = stochastic(high[-(STOCH_K + STOCH_D):], low[-(STOCH_K + STOCH_D):], close[-(STOCH_K + STOCH_D):])
+        for value in k[-STOCH_D:]:
+            state.stoch_d.push(float(value))
+        for value in high[-FIB_LOOKBACK:]:
+            state.swing_high.push(float(value))
+        for value in low[-FIB_LOOKBACK:]:
+            state.swing_low.push(float(value))
+        for value in volume[-VOLUME_PERIOD:]:
+            state.volume_avg.push(float(value))
+
+        state.count = n
+        state.last_time = float(candles[TIME, -1])
+        state.close = float(close[-1])
+        state.values = compute_all(candles)
+        return state
+
+    def _rsi(self) -> float:
+        if not self.avg_loss:
+            return 100.0 if self.avg_gain else 50.0
+        return 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+
+    def update(self, candle) -> dict:
+        """Advance all indicators by one closed candle"""
+        high, low, close, volume = float(candle[HIGH]), float(candle[LOW]), float(candle[CLOSE]), float(candle[VOLUME])
+        fast_alpha = 2.0 / (MACD_FAST + 1)
+        slow_alpha = 2.0 / (MACD_SLOW + 1)
+        signal_alpha = 2.0 / (MACD_SIGNAL + 1)
+        rsi_alpha = 1.0 / RSI_PERIOD
+
+        if self.count == 0:
+            change = 0.0
+            self.ema_fast = self.ema_slow = close
+            self.macd_signal = 0.0
+        else:
+            change = close - self.close
+            self.ema_fast += fast_alpha * (close - self.ema_fast)
+            self.ema_slow += slow_alpha * (close - self.ema_slow)
+        line = self.ema_fast - self.ema_slow
+        if self.count:
+            self.macd_signal += signal_alpha * (line - self.macd_signal)
+
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if self.count == 0:
+            self.avg_gain, self.avg_loss = gain, loss
+        else:
+            self.avg_gain += rsi_alpha * (gain - self.avg_gain)
+            self.avg_loss += rsi_alpha * (loss - self.avg_loss)
+
+        if change > 0:
+            self.obv += volume
+        elif change < 0:
+            self.obv -= volume
+
+        highest = self.highest.push(high)
+        lowest = self.lowest.push(low)
+        span = highest - lowest
+        k = (close - lowest) / span * 100.0 if span else 50.0
+        average = self.volume_avg.push(volume)
+
+        self.count += 1
+        self.last_time = float(candle[TIME])
+        self.close = close
+        self.values = {
+            'close': close,
+            'rsi': self._rsi(),
+            'macd': line,
+            'macd_signal': self.macd_signal,
+            'macd_hist': line - self.macd_signal,
+            'stoch_k': k,
+            'stoch_d': self.stoch_d.push(k),
+            'fibonacci': {
+                ratio: float(level) for ratio, level in
+                fib_levels(self.swing_high.push(high), self.swing_low.push(low)).items()
+            },
+            'volume_avg': average,
+            'volume_ratio': volume / average if average > 0 else 0.0,
+            'obv': self.obv
+        }
+        return self.values
+
+
+class IndicatorEngine:
+    """Indicator states for every series of a candle store
+
+    backfill() seeds the states from stored history; on_candle_closed()
+    keeps them current in O(1) per candle. States of a timeframe are kept
+    in a list indexed by the store's symbol IDs.
+    """
+
+    def __init__(self, store: CandleStore = None):
+        self.store = store or candle_store
+        self._states = {timeframe: [] for timeframe in self.store.timeframes}
+
+    def _slot(self, symbol_id: int, timeframe: str) -> list:
+        """State list of a timeframe, long enough to hold `symbol_id`"""
+        states = self._states.setdefault(timeframe, [])
+        if symbol_id >= len(states):
+            states.extend([None] * (symbol_id + 1 - len(states)))
+        return states
+
+    def backfill(self, symbol: str = None, timeframe: str = None):
+        """Rebuild states from the stored closed candles"""
+        registry = self.store.registry
+        for series_symbol in [symbol] if symbol else self.store.symbols:
+            symbol_id = registry.id(series_symbol)
+            for series_timeframe in [timeframe] if timeframe else self.store.timeframes:
+                window = self.store.closed_window(series_symbol, series_timeframe)
+                if window.shape[1]:
+                    self._slot(symbol_id, series_timeframe)[symbol_id] = IndicatorState.from_history(window)
+
+    def on_candle_closed(self, symbol: str, timeframe: str, candle) -> dict:
+        """Feed one closed candle of a live series
+
+        Candles the state has already seen (e.g. from backfill) are ignored.
+        """
+        symbol_id = self.store.registry.intern(symbol)
+        states = self._slot(symbol_id, timeframe)
+        state = states[symbol_id]
+        if state is None:
+            state = states[symbol_id] = IndicatorState()
+        if state.last_time is not None and candle[TIME] <= state.last_time:
+            return state.values
+        return state.update(candle)
+
+    def snapshot(self, symbol: str, timeframe: str):
+        """Latest indicator values of a series, or None without data"""
+        symbol_id = self.store.registry.get(symbol)
+        states = self._states.get(timeframe)
+        if symbol_id is None or states is None or symbol_id >= len(states):
+            return None
+        state = states[symbol_id]
+        if state is None or not state.count:
+            return None
+        return state.values
+
+
+# Shared engine for the bot process
+indicator_engine = IndicatorEngine()
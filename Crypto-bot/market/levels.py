@@ -0,0 +1,274 @@
+"""
+Support and resistance levels from the volume profile and swing points
+"""
+
+import threading
+from collections import deque
+import numpy as np
+from utils.metrics import metrics
+from market.candles import CandleStore, candle_store, TIME, HIGH, LOW, CLOSE, VOLUME
+from config import LEVELS_WINDOW
+
+# Price bin width as a fraction of the typical close when a profile is built
+BIN_WIDTH = 0.005
+# A swing high (low) is the highest high (lowest low) of SWING candles on each side
+SWING = 5
+# Profile and touch counts are smoothed over neighbouring bins with this kernel
+SMOOTHING = np.array([1.0, 2.0, 3.0, 2.0, 1.0]) / 9.0
+# Levels scoring below this fraction of the best one are ignored
+MIN_SCORE = 0.25
+# Levels listed on each side of the price
+LEVELS_PER_SIDE = 2
+# Up to this many candles x bins, spread_volume() computes overlaps directly
+DENSE_LIMIT = 4096
+
+
+def spread_volume(low: np.ndarray, high: np.ndarray, volume: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Volume per price bin, each candle's volume spread evenly over its range
+
+    `edges` are the sorted bin boundaries; the result has len(edges) - 1
+    bins. The volume below a price is piecewise linear with kinks at every
+    low and high, so it is evaluated at all edges at once from prefix sums
+    over the sorted lows and highs instead of per candle and bin. Candles
+    without a range count fully in the bin of their price.
+    """
+    low = np.asarray(low, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    ranged = high > low
+    bins = np.zeros(len(edges) - 1)
+    if np.any(~ranged):
+        index = np.searchsorted(edges, low[~ranged], side='right') - 1
+        inside = (index >= 0) & (index < len(bins))
+        bins += np.bincount(index[inside], weights=volume[~ranged][inside], minlength=len(bins))
+    low, high, volume = low[ranged], high[ranged], volume[ranged]
+    if not len(low):
+        return bins
+    if len(low) * len(edges) <= DENSE_LIMIT:
+        # A few candles (a live update): overlap of every candle with every bin
+        overlap = np.minimum(high[:, None], edges[None, 1:]) - np.maximum(low[:, None], edges[None, :-1])
+        return bins + (np.maximum(overlap, 0.0) * (volume / (high - low))[:, None]).sum(axis=0)
+    # Volume below price p: sum of density * (min(p, high) - low) over candles with low < p
+    density = volume / (high - low)
+    below = np.zeros(len(edges))
+    for prices, sign in ((low, 1.0), (high, -1.0)):
+        order = np.argsort(prices, kind='stable')
+        weight = np.concatenate([[0.0], np.cumsum(density[order])])
+        moment = np.concatenate([[0.0], np.cumsum(density[order] * prices[order])])
+        count = np.searchsorted(prices[order], edges)
+        below += sign * (edges * weight[count] - moment[count])
+    return np.diff(below)
+
+
+def swing_points(high: np.ndarray, low: np.ndarray, swing: int = SWING) -> tuple:
+    """Boolean masks of swing highs and swing lows
+
+    Only candles with `swing` candles on both sides can be swing points.
+    """
+    n = len(high)
+    highs = np.zeros(n, dtype=bool)
+    lows = np.zeros(n, dtype=bool)
+    if n < 2 * swing + 1:
+        return highs, lows
+    windows = 2 * swing + 1
+    highest = np.lib.stride_tricks.sliding_window_view(high, windows).max(axis=-1)
+    lowest = np.lib.stride_tricks.sliding_window_view(low, windows).min(axis=-1)
+    highs[swing:n - swing] = high[swing:n - swing] >= highest
+    lows[swing:n - swing] = low[swing:n - swing] <= lowest
+    return highs, lows
+
+
+class LevelState:
+    """Volume profile and swing touches of one series over a sliding window
+
+    Bins have a fixed width set when the state is built, so candles can be
+    added and removed as the window slides without rebinning. update()
+    applies the candles that closed since the last call: it adds their
+    volume, removes that of the candles leaving the window, and counts the
+    swing points they confirm, so a close costs O(bins it spans) rather
+    than a rebuild over the window.
+    """
+
+    def __init__(self, step: float, window: int = LEVELS_WINDOW):
+        self.step = step
+        self.window = window
+        # Bin index of volume[0] and touches[0]
+        self.origin = 0
+        self.volume = np.zeros(0)
+        self.touches = np.zeros(0)
+        # (time, bin) of the swing points in the window, oldest first
+        self.swings = deque()
+        # Open times of the oldest and newest candle in the window
+        self.first_time = None
+        self.last_time = None
+        self.levels = None
+
+    @classmethod
+    def build(cls, candles: np.ndarray, window: int = LEVELS_WINDOW):
+        """State over the last `window` of a (6, n) array of closed candles"""
+        part = candles[:, -window:]
+        state = cls(float(np.median(part[CLOSE])) * BIN_WIDTH, window)
+        if not part.shape[1]:
+            return state
+        state._add(part)
+        n = len(candles[TIME])
+        state._swings(candles, n - part.shape[1], n)
+        state.first_time = part[TIME, 0]
+        state.last_time = part[TIME, -1]
+        return state
+
+    def _fit(self, low: float, high: float):
+        """Grow the bin arrays to cover low..high"""
+        first = int(low // self.step)
+        last = int(high // self.step) + 1
+        if not len(self.volume):
+            self.origin = first
+            self.volume = np.zeros(last - first)
+            self.touches = np.zeros(last - first)
+            return
+        before = max(0, self.origin - first)
+        after = max(0, last - self.origin - len(self.volume))
+        if before or after:
+            self.volume = np.pad(self.volume, (before, after))
+            self.touches = np.pad(self.touches, (before, after))
+            self.origin -= before
+
+    def _add(self, candles: np.ndarray, sign: float = 1.0):
+        """Add (or with sign -1 remove) the volume of a (6, n) candle array"""
+        low, high = candles[LOW], candles[HIGH]
+        self._fit(low.min(), high.max())
+        first = int(low.min() // self.step)
+        last = int(high.max() // self.step) + 1
+        edges = np.arange(first, last + 1) * self.step
+        start = first - self.origin
+        self.volume[start:start + last - first] += spread_volume(low, high, candles[VOLUME] * sign, edges)
+
+    def _bin(self, price: float) -> int:
+        return int(price // self.step)
+
+    def _swings(self, candles: np.ndarray, start: int, stop: int):
+        """Count the swing points among candles[start:stop]"""
+        highs, lows = swing_points(candles[HIGH], candles[LOW])
+        points = (
+            (candles[TIME, i], candles[field, i])
+            for mask, field in ((highs, HIGH), (lows, LOW))
+            for i in np.flatnonzero(mask[start:stop]) + start
+        )
+        self._touch(sorted(points))
+
+    def _touch(self, points: list):
+        """Count swing points given as (time, price), in time order"""
+        # Appended in time order, so they leave the window from the front
+        for time, price in points:
+            self._fit(price, price)
+            index = self._bin(price)
+            self.touches[index - self.origin] += 1
+            self.swings.append((time, index))
+
+    def update(self, candles: np.ndarray) -> bool:
+        """Catch up with a (6, n) array of closed candles ending at the newest
+
+        Returns False when the array no longer overlaps the window (a gap
+        longer than it), in which case the state must be rebuilt.
+        """
+        times = candles[TIME]
+        end = len(times)
+        new = int(end - np.searchsorted(times, self.last_time, side='right'))
+        if not new:
+            return True
+        if new >= self.window:
+            return False
+        # The candles leaving the window must still be in the array
+        leaving = np.searchsorted(times, self.first_time)
+        if leaving >= len(times) or times[leaving] != self.first_time:
+            return False
+        count = int(np.searchsorted(times, self.last_time, side='right') - leaving)
+        drop = max(0, count + new - self.window)
+        if drop:
+            self._add(candles[:, leaving:leaving + drop], -1.0)
+        self._add(candles[:, end - new:])
+        self.first_time = times[leaving + drop]
+        self.last_time = times[-1]
+        # A swing point needs SWING candles after it: the new candles confirm
+        # those from SWING before the first new one on. Only a few candles
+        # are checked, which is cheaper one by one than with swing_points()
+        points = []
+        for i in range(max(SWING, end - new - SWING), end - SWING):
+            around = candles[:, i - SWING:i + SWING + 1]
+            if candles[HIGH, i] >= around[HIGH].max():
+                points.append((times[i], candles[HIGH, i]))
+            if candles[LOW, i] <= around[LOW].min():
+                points.append((times[i], candles[LOW, i]))
+        self._touch(sorted(points))
+        while self.swings and self.swings[0][0] < self.first_time:
+            _, index = self.swings.popleft()
+            self.touches[index - self.origin] -= 1
+        self.levels = None
+        return True
+
+    def compute(self, price: float) -> dict:
+        """Supports below and resistances above `price`, nearest first
+
+        A bin scores its share of the largest volume node plus its share of
+        the most touched price (both smoothed over neighbouring bins); local
+        maxima scoring at least MIN_SCORE of the best bin are levels. Each
+        level is a dict of price, score, volume share and touches.
+        """
+        volume = np.convolve(np.maximum(self.volume, 0.0), SMOOTHING, mode='same')
+        touches = np.convolve(self.touches, SMOOTHING, mode='same')
+        if not len(volume) or volume.max() <= 0:
+            return {'support': [], 'resistance': [], 'poc': None}
+        score = volume / volume.max() + (touches / touches.max() if touches.max() > 0 else 0.0)
+        padded = np.concatenate([[-np.inf], score, [-np.inf]])
+        peaks = np.flatnonzero((score >= padded[:-2]) & (score > padded[2:]) & (score >= MIN_SCORE * score.max()))
+        below = np.searchsorted((self.origin + peaks + 0.5) * self.step, price)
+        total = self.volume.sum()
+
+        def level(peak: int) -> dict:
+            return {
+                'price': float((self.origin + peak + 0.5) * self.step),
+                'score': float(score[peak] / score.max()),
+                'volume_share': float(self.volume[max(0, peak - 2):peak + 3].sum() / total) if total > 0 else 0.0,
+                'touches': int(round(self.touches[max(0, peak - 1):peak + 2].sum()))
+            }
+
+        return {
+            'support': [level(peak) for peak in peaks[:below][::-1][:LEVELS_PER_SIDE]],
+            'resistance': [level(peak) for peak in peaks[below:][:LEVELS_PER_SIDE]],
+            'poc': float((self.origin + int(np.argmax(volume)) + 0.5) * self.step)
+        }
+
+
+class LevelEngine:
+    """Support and resistance levels for series of a candle store
+
+    States are built on first use and kept in a list per timeframe indexed
+    by symbol ID. levels() catches a state up with the candles that closed
+    since it was last asked and recomputes the levels once per close; in
+    between, it returns the cached result.
+    """
+
+    def __init__(self, store: CandleStore = None, window: int = LEVELS_WINDOW):
+        self.store = store or candle_store
+        self.window = window
+        self._states = {timeframe: [] for timeframe in self.store.timeframes}
+        self._lock = threading.Lock()
+
+    def levels(self, symbol: str, timeframe: str, now: float = None):
+        """Levels of one series around its latest close, or None without data"""
+        closed = self.store.closed_window(symbol, timeframe, now)
+        if closed.shape[1] < 2 * SWING + 1:
+            return None
+        symbol_id = self.store.registry.id(symbol)
+        with self._lock:
+            states = self._states.setdefault(timeframe, [])
+            if symbol_id >= len(states):
+                states.extend([None] * (symbol_id + 1 - len(states)))
+            state = states[symbol_id]
+            if state is None or not state.update(closed):
+                state = states[symbol_id] = LevelState.build(closed, self.window)
+                metrics.inc('market_levels_builds_total')
+            if state.levels is None:
+                state.levels = state.compute(float(closed[CLOSE, -1]))
+            return state.levels
+
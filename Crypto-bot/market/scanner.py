@@ -0,0 +1,188 @@
+"""
+Opportunity scanner: every pair and timeframe scored in one vectorized pass
+"""
+
+import time
+import numpy as np
+from utils.metrics import metrics
+from market.candles import CandleStore, candle_store, TIMEFRAME_SECONDS, FIELDS, TIME, HIGH, LOW, CLOSE, VOLUME
+from market.indicators import (
+    ema, ema_last, rsi_last, stochastic, fibonacci,
+    MACD_FAST, MACD_SLOW, MACD_SIGNAL, STOCH_K, VOLUME_PERIOD
+)
+from config import SCAN_LOOKBACK
+
+# Wilder's average true range: period and the stop distance in ATRs
+ATR_PERIOD = 14
+STOP_ATR = 1.5
+# Risk/reward above this no longer raises the score
+RR_CAP = 3.0
+# Series with fewer closed candles are not scored
+MIN_CANDLES = MACD_SLOW + MACD_SIGNAL
+
+
+class ScanResult:
+    """Scores of every scanned series, as parallel arrays ranked best first"""
+
+    def __init__(self, columns: dict, created: float, seconds: float):
+        order = np.argsort(-columns['score'], kind='stable')
+        for name, values in columns.items():
+            setattr(self, name, values[order])
+        self.created = created
+        self.seconds = seconds
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def top(self, n: int = None, timeframe: str = None, symbol: str = None, per_symbol: bool = False) -> list:
+        """Best setups as dicts, optionally for one timeframe or symbol
+
+        With per_symbol only the best timeframe of each symbol is listed.
+        """
+        rows = np.flatnonzero(self.score > 0)
+        if timeframe is not None:
+            rows = rows[self.timeframe[rows] == timeframe]
+        if symbol is not None:
+            rows = rows[self.symbol[rows] == symbol]
+        if per_symbol:
+            # Rows are ranked, so the first row of a symbol is its best
+            _, first = np.unique(self.symbol[rows], return_index=True)
+            rows = rows[np.sort(first)]
+        return [{
+            'pair': self.symbol[row],
+            'timeframe': self.timeframe[row],
+            'side': int(self.side[row]),
+            'trade_type': 'LONG' if self.side[row] > 0 else 'SHORT',
+            'score': float(self.score[row]),
+            'strength': float(self.strength[row]),
+            'rr': float(self.rr[row]),
+            'rsi': float(self.rsi[row]),
+            'change': float(self.change[row]),
+            'close': float(self.close[row])
+        } for row in rows[:n]]
+
+
+class MarketScanner:
+    """Ranks setups over every series of a candle store
+
+    The trailing `lookback` closed candles of all symbols of a timeframe are
+    stacked into one (symbols, 6, lookback) array, so each indicator is
+    computed once per timeframe for the whole universe instead of once per
+    series. A series trades in the direction of its MACD histogram (as
+    ideas do); its strength is the mean of three scores in 0..1: momentum
+    (histogram in ATRs), RSI room left before overbought/oversold, and
+    volume against its average. Risk/reward is the distance to the swing
+    extreme of the Fibonacci lookback over a 1.5 ATR stop; the score is
+    strength x risk/reward (capped at 3). Symbols whose listing is not
+    trading are skipped.
+    """
+
+    def __init__(self, store: CandleStore = None, lookback: int = SCAN_LOOKBACK):
+        self.store = store or candle_store
+        self.lookback = max(lookback, MIN_CANDLES)
+
+    def universe(self) -> list:
+        """IDs of the symbols scanned: those of the store whose listing is trading"""
+        return self.store.registry.trading(self.store.ids).tolist()
+
+    def stack(self, timeframe: str, now: float = None, symbols: list = None) -> tuple:
+        """Symbols with enough closed candles and their (symbols, 6, lookback) candles
+
+        `symbols` defaults to the whole universe; shorter series are padded
+        at the start with their first candle.
+        """
+        registry = self.store.registry
+        ids = None if symbols is None else [registry.id(symbol) for symbol in symbols]
+        ids, candles = self._stack(timeframe, now, ids)
+        return [registry.name(symbol_id) for symbol_id in ids], candles
+
+    def _stack(self, timeframe: str, now: float = None, ids: list = None) -> tuple:
+        """stack() by symbol ID"""
+        now = time.time() if now is None else now
+        step = TIMEFRAME_SECONDS[timeframe]
+        n = self.lookback
+        stacked, windows = [], []
+        for symbol_id in self.universe() if ids is None else ids:
+            buffer = self.store.get_by_id(symbol_id, timeframe)
+            if buffer is None or len(buffer) < MIN_CANDLES:
+                continue
+            window = buffer.window(n + 1)
+            # Without the still-forming candle
+            window = window[:, :-1] if window[TIME, -1] + step > now else window[:, -n:]
+            if window.shape[1] < MIN_CANDLES:
+                continue
+            stacked.append(symbol_id)
+            windows.append(window)
+        candles = np.empty((len(windows), len(FIELDS), n))
+        for row, window in enumerate(windows):
+            m = window.shape[1]
+            candles[row, :, n - m:] = window
+            if m < n:
+                candles[row, :, :n - m] = window[:, :1]
+        return stacked, candles
+
+    @staticmethod
+    def score(candles: np.ndarray) -> dict:
+        """Scores of a (series, 6, n) candle array, one value per series
+
+        Only the latest value of each indicator is used, so apart from the
+        MACD line (which the signal line averages) they are computed with
+        ema_last() instead of over the whole window.
+        """
+        high, low, close, volume = candles[:, HIGH], candles[:, LOW], candles[:, CLOSE], candles[:, VOLUME]
+        last = close[:, -1]
+        line = ema(close, 2.0 / (MACD_FAST + 1)) - ema(close, 2.0 / (MACD_SLOW + 1))
+        hist = line[:, -1] - ema_last(line, 2.0 / (MACD_SIGNAL + 1))
+        side = np.where(hist >= 0, 1, -1)
+
+        previous = close[:, :-1]
+        true_range = np.maximum(high[:, 1:], previous) - np.minimum(low[:, 1:], previous)
+        atr = ema_last(true_range, 1.0 / ATR_PERIOD)
+        rsi_value = rsi_last(close)
+        k, _ = stochastic(high[:, -STOCH_K:], low[:, -STOCH_K:], close[:, -STOCH_K:])
+        levels = fibonacci(high, low)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            momentum = np.clip(np.abs(hist) / atr, 0.0, 1.0)
+            room = np.clip(np.where(side > 0, 70.0 - rsi_value, rsi_value - 30.0) / 40.0, 0.0, 1.0)
+            volume_ratio = volume[:, -1] / volume[:, -VOLUME_PERIOD:].mean(axis=-1)
+            volume_score = np.clip(np.nan_to_num(volume_ratio) / 1.5, 0.0, 1.0)
+            strength = np.nan_to_num((momentum + room + volume_score) / 3.0)
+            reward = np.where(side > 0, levels[0.0] - last, last - levels[1.0])
+            rr = np.nan_to_num(np.clip(reward / (STOP_ATR * atr), 0.0, None), posinf=0.0)
+            change = np.nan_to_num(last / close[:, -2] - 1.0)
+        return {
+            'side': side,
+            'score': strength * np.minimum(rr, RR_CAP),
+            'strength': strength,
+            'rr': rr,
+            'rsi': rsi_value,
+            'stoch_k': k[:, -1],
+            'change': change,
+            'close': last
+        }
+
+    def scan(self, now: float = None) -> ScanResult:
+        """Score every series of the store"""
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        universe = self.universe()
+        names = np.array(self.store.registry.names, dtype=object)
+        parts = []
+        for timeframe in self.store.timeframes:
+            ids, candles = self._stack(timeframe, now, universe)
+            if not ids:
+                continue
+            columns = self.score(candles)
+            columns['symbol'] = names[ids]
+            columns['timeframe'] = np.full(len(ids), timeframe, dtype=object)
+            parts.append(columns)
+        fields = ('symbol', 'timeframe', 'side', 'score', 'strength', 'rr', 'rsi', 'stoch_k', 'change', 'close')
+        columns = {
+            field: np.concatenate([part[field] for part in parts]) if parts else np.empty(0, dtype=object)
+            for field in fields
+        }
+        seconds = time.perf_counter() - started
+        metrics.observe('market_scan_seconds', seconds)
+        metrics.set('market_scan_series', len(columns['score']))
+        return ScanResult(columns, now, seconds)
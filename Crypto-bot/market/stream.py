@@ -0,0 +1,294 @@
+"""
+Streaming market data from the exchange websocket feed
+"""
+
+import asyncio
+import json
+import random
+import aiohttp
+import numpy as np
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from market.candles import TIMEFRAME_SECONDS, TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, candle_open
+from market.symbols import exchange_symbol
+from market.exchange import MarketDataService, ExchangeError, KLINES_PAGE
+from config import EXCHANGE_WS_URL, SYMBOLS_SOURCE, SYMBOLS_REFRESH
+
+logger = setup_logger()
+
+# Timeframe built from the feed; the longer ones are rolled up from it
+BASE_TIMEFRAME = '1h'
+
+
+class CandleBuilder:
+    """The forming candle of one series, built from trades and kline updates
+
+    Trades extend the forming candle; kline updates replace it, since they
+    carry the exchange's own totals. A candle is final once a kline says so
+    or a trade or kline of a later candle arrives. Both update methods
+    return the candles that became final, usually none.
+    """
+
+    __slots__ = ('step', 'candle', 'closed_time')
+
+    def __init__(self, timeframe: str = BASE_TIMEFRAME):
+        self.step = TIMEFRAME_SECONDS[timeframe]
+        # [time, open, high, low, close, volume] of the forming candle
+        self.candle = None
+        # Open time of the newest final candle
+        self.closed_time = None
+
+    def _stale(self, open_time: float) -> bool:
+        return (self.closed_time is not None and open_time <= self.closed_time
+                or self.candle is not None and open_time < self.candle[TIME])
+
+    def _roll(self, open_time: float) -> tuple:
+        """Finish the forming candle when `open_time` starts a later one"""
+        candle = self.candle
+        if candle is None or open_time == candle[TIME]:
+            return ()
+        self.candle = None
+        self.closed_time = candle[TIME]
+        return (candle,)
+
+    def trade(self, time: float, price: float, quantity: float) -> tuple:
+        open_time = time // self.step * self.step
+        if self._stale(open_time):
+            return ()
+        closed = self._roll(open_time)
+        candle = self.candle
+        if candle is None:
+            self.candle = [open_time, price, price, price, price, quantity]
+            return closed
+        if price > candle[HIGH]:
+            candle[HIGH] = price
+        elif price < candle[LOW]:
+            candle[LOW] = price
+        candle[CLOSE] = price
+        candle[VOLUME] += quantity
+        return closed
+
+    def kline(self, open_time: float, open: float, high: float, low: float, close: float,
+              volume: float, final: bool) -> tuple:
+        if self._stale(open_time):
+            return ()
+        closed = self._roll(open_time)
+        candle = [open_time, open, high, low, close, volume]
+        if not final:
+            self.candle = candle
+            return closed
+        self.candle = None
+        self.closed_time = open_time
+        return closed + (candle,)
+
+
+class StreamingMarketDataService(MarketDataService):
+    """Keeps the candle store current from the exchange websocket feed
+
+    After the REST backfill, one connection subscribes to the trade and 1h
+    kline streams of every pair. 1h candles are built incrementally from
+    them and written to the store as they form; every final 1h candle is
+    rolled up into the 4h/1d/1w candles of the store, which close with their
+    last hour, so longer timeframes are never fetched again. Forming longer
+    candles cover the closed hours only. A lost connection is reopened with
+    exponential backoff, and the 1h candles missed meanwhile are fetched
+    over REST before the stream resumes. on_price gets every trade.
+
+    Builders are kept in a list indexed by symbol ID, for the trading
+    symbols of the store; stream messages are matched to them through the
+    registry's exchange names. When a listing reload changes the trading
+    symbols, the connection is reopened with the new subscriptions.
+    """
+
+    def __init__(self, client=None, store=None, engine=None, archive=None, on_price=None,
+                 url: str = EXCHANGE_WS_URL, backoff: float = 0.5, max_backoff: float = 60.0,
+                 heartbeat: float = 30.0, symbols_source: str = SYMBOLS_SOURCE,
+                 symbols_refresh: float = SYMBOLS_REFRESH):
+        super().__init__(client, store, engine, archive=archive, on_price=on_price,
+                         symbols_source=symbols_source, symbols_refresh=symbols_refresh)
+        self.url = url.rstrip('/')
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.heartbeat = heartbeat
+        self.step = TIMEFRAME_SECONDS[BASE_TIMEFRAME]
+        self.rollups = [timeframe for timeframe in self.store.timeframes
+                        if TIMEFRAME_SECONDS[timeframe] > self.step]
+        self.registry = self.store.registry
+        self.builders = []
+        self._ws = None
+        self._resubscribe = False
+        self.stats = {'messages': 0, 'trades': 0, 'klines': 0, 'closed': 0, 'connects': 0, 'gap_candles': 0}
+
+    @property
+    def streamed(self) -> list:
+        """IDs of the symbols followed: the trading symbols of the store"""
+        return self.registry.trading(self.store.ids).tolist()
+
+    def sync_builders(self) -> list:
+        """Builders for the streamed symbols, keeping existing ones; returns their IDs"""
+        streamed = self.streamed
+        builders = [None] * len(self.registry)
+        for symbol_id in streamed:
+            existing = self.builders[symbol_id] if symbol_id < len(self.builders) else None
+            builders[symbol_id] = existing or CandleBuilder()
+        self.builders = builders
+        return streamed
+
+    @property
+    def stream_url(self) -> str:
+        """Combined stream URL for the trades and base klines of every streamed pair"""
+        names = (exchange_symbol(self.registry.name(symbol_id)).lower()
+                 for symbol_id, builder in enumerate(self.builders) if builder is not None)
+        streams = '/'.join(f"{name}@trade/{name}@kline_{BASE_TIMEFRAME}" for name in names)
+        return f"{self.url}/stream?streams={streams}"
+
+    def handle(self, message: dict):
+        """Apply one stream message (combined or raw payload)"""
+        data = message.get('data', message)
+        symbol_id = self.registry.exchange_id(data.get('s'))
+        builders = self.builders
+        if symbol_id is None or symbol_id >= len(builders) or builders[symbol_id] is None:
+            return
+        builder = builders[symbol_id]
+        self.stats['messages'] += 1
+        event = data.get('e')
+        if event == 'trade':
+            self.stats['trades'] += 1
+            price = float(data['p'])
+            self._publish(symbol_id, builder.trade(data['T'] / 1000, price, float(data['q'])))
+            if self.on_price is not None:
+                symbol = self.registry.name(symbol_id)
+                try:
+                    self.on_price(symbol, price)
+                except Exception as e:
+                    logger.error(f"Error handling price update for {symbol}: {e}")
+        elif event == 'kline' and data['k']['i'] == BASE_TIMEFRAME:
+            self.stats['klines'] += 1
+            kline = data['k']
+            self._publish(symbol_id, builder.kline(
+                kline['t'] / 1000, float(kline['o']), float(kline['h']), float(kline['l']),
+                float(kline['c']), float(kline['v']), kline['x']
+            ))
+
+    def _publish(self, symbol_id: int, closed: tuple):
+        """Write final candles, then the forming one, to the store"""
+        buffer = self.store.get_by_id(symbol_id, BASE_TIMEFRAME)
+        for candle in closed:
+            if buffer.upsert(*candle):
+                self._close(self.registry.name(symbol_id), np.array(candle))
+        forming = self.builders[symbol_id].candle
+        if forming is not None:
+            buffer.upsert(*forming)
+
+    def _close(self, symbol: str, candle: np.ndarray):
+        self.stats['closed'] += 1
+        metrics.inc('market_stream_candles_closed_total', timeframe=BASE_TIMEFRAME)
+        self._on_close(symbol, BASE_TIMEFRAME, candle)
+        self._roll_up(symbol, candle[TIME])
+
+    def _roll_up(self, symbol: str, hour: float):
+        """Fold the base candles up to `hour` into each longer timeframe"""
+        window = self.store.series(symbol, BASE_TIMEFRAME).window()
+        times = window[TIME]
+        end = int(np.searchsorted(times, hour, side='right'))
+        for timeframe in self.rollups:
+            open_time = candle_open(hour, timeframe)
+            part = window[:, int(np.searchsorted(times, open_time)):end]
+            if not part.shape[1]:
+                continue
+            candle = np.array([open_time, part[OPEN, 0], part[HIGH].max(), part[LOW].min(),
+                               part[CLOSE, -1], part[VOLUME].sum()])
+            if not self.store.series(symbol, timeframe).upsert(*candle):
+                continue
+            if hour + self.step == open_time + TIMEFRAME_SECONDS[timeframe]:
+                metrics.inc('market_stream_candles_closed_total', timeframe=timeframe)
+                self._on_close(symbol, timeframe, candle)
+
+    async def fill_gap(self, symbol_id: int) -> int:
+        """Fetch the base candles since the newest stored one; returns the count"""
+        symbol = self.registry.name(symbol_id)
+        buffer = self.store.get_by_id(symbol_id, BASE_TIMEFRAME)
+        start = buffer.last_time if len(buffer) else None
+        fetched = 0
+        while True:
+            rows = await self.client.fetch_klines(symbol, BASE_TIMEFRAME, start_time=start)
+            # The last candle of a page may be the exchange's current one;
+            # a following page starts with it again
+            for i, row in enumerate(rows):
+                self._publish(symbol_id, self.builders[symbol_id].kline(*row, i < len(rows) - 1))
+            fetched += len(rows)
+            if len(rows) < KLINES_PAGE:
+                return fetched
+            start = rows[-1, TIME]
+
+    async def _fill_gaps(self, streamed: list):
+        results = await asyncio.gather(*(self.fill_gap(symbol_id) for symbol_id in streamed),
+                                       return_exceptions=True)
+        for symbol_id, result in zip(streamed, results):
+            if isinstance(result, Exception):
+                logger.error(f"Gap backfill failed for {self.registry.name(symbol_id)}: {result}")
+            else:
+                self.stats['gap_candles'] += result
+
+    async def reload_symbols(self, backfill: bool = True) -> list:
+        """Apply the exchange listing and resubscribe when the streamed pairs changed"""
+        streamed = [symbol_id for symbol_id, builder in enumerate(self.builders) if builder is not None]
+        added = await super().reload_symbols(backfill)
+        if self._ws is not None and self.streamed != streamed:
+            self._resubscribe = True
+            await self._ws.close()
+        return added
+
+    async def _consume(self, ws) -> int:
+        """Apply messages until the connection closes; returns their count"""
+        received = 0
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            received += 1
+            try:
+                self.handle(json.loads(message.data))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Error handling market stream message: {e}")
+        metrics.inc('market_stream_messages_total', received)
+        return received
+
+    async def stream(self):
+        """Follow the feed until cancelled, reconnecting with backoff"""
+        attempt = 0
+        while True:
+            streamed = self.sync_builders()
+            try:
+                async with self.client.session.ws_connect(self.stream_url, heartbeat=self.heartbeat) as ws:
+                    self._ws = ws
+                    self.stats['connects'] += 1
+                    # Subscribed first, so nothing between the REST fetch and the stream is lost
+                    await self._fill_gaps(streamed)
+                    if await self._consume(ws):
+                        attempt = 0
+                error = f"closed with code {ws.close_code}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ExchangeError) as e:
+                error = str(e) or type(e).__name__
+            finally:
+                self._ws = None
+            if self._resubscribe:
+                self._resubscribe = False
+                logger.info(f"Market stream resubscribing to {len(self.streamed)} pairs")
+                continue
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * (1 + random.random() * 0.25)
+            attempt += 1
+            metrics.inc('market_stream_reconnects_total')
+            logger.warning(f"Market stream disconnected ({error}), reconnecting in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def run(self):
+        """Backfill over REST, then follow the stream until cancelled"""
+        async with self.client:
+            listing = await self.load_listing()
+            try:
+                await self.backfill()
+                logger.info(f"Рыночные данные загружены: {len(self.store.symbols)} пар")
+                await self.stream()
+            finally:
+                if listing is not None:
+                    listing.cancel()
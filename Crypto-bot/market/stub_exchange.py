@@ -0,0 +1,304 @@
+"""
+Local stub exchange serving deterministic synthetic market data
+
+Implements the subset of the Binance REST API used by ExchangeClient
+(/api/v3/klines, /api/v3/ticker/24hr and /api/v3/exchangeInfo) and the
+combined trade and 1h
+kline websocket streams (/stream?streams=...) used by the streaming
+service, so market data code can be run and load-tested offline. Prices
+are a pure function of symbol and candle time: every request for the same
+range returns the same candles, and streamed trades walk each 1h candle
+from open through its low and high to close. With --speed the stub's
+clock runs faster than real time (3600: one hour per second); --listed
+adds that many synthetic pairs to the listing.
+
+Usage: python -m market.stub_exchange [--port 8900] [--latency-ms 0] [--error-rate 0] [--speed 1] [--listed 0]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import zlib
+import numpy as np
+from aiohttp import web
+from market.candles import TIMEFRAME_SECONDS, candle_open
+from market.symbols import exchange_symbol
+from config import DEFAULT_TRADING_PAIRS
+
+MAX_LIMIT = 1000
+KLINE_ROW = '[%d,"%.8f","%.8f","%.8f","%.8f","%.8f",%d]'
+# Streamed candle interval
+STREAM_INTERVAL = '1h'
+
+
+def _seed(symbol: str) -> int:
+    return zlib.crc32(symbol.encode())
+
+
+def _noise(seed: int, index: np.ndarray) -> np.ndarray:
+    """Deterministic pseudo-random values in [-1, 1) per integer index"""
+    x = (index.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(seed)) & np.uint64(0xFFFFFFFFFFFF)
+    x ^= x >> np.uint64(17)
+    x = (x * np.uint64(0xBF58476D1CE4E5B9)) & np.uint64(0xFFFFFFFFFFFF)
+    return x.astype(np.float64) / float(0xFFFFFFFFFFFF) * 2 - 1
+
+
+def accelerated_clock(speed: float, start: float = None):
+    """Clock running `speed` times faster than real time from `start` (now)"""
+    origin = time.time()
+    start = origin if start is None else start
+    return lambda: start + (time.time() - origin) * speed
+
+
+def _path(candle) -> tuple:
+    """Prices a candle trades through: open, the nearer extreme, the other, close"""
+    _, open_, high, low, close, _ = candle
+    return (open_, low, high, close) if close >= open_ else (open_, high, low, close)
+
+
+def _walk(candle, fraction: float) -> float:
+    """Price `fraction` of the way along the candle's path"""
+    points = _path(candle)
+    position = min(max(fraction, 0.0), 1.0) * 3
+    segment = min(int(position), 2)
+    return points[segment] + (points[segment + 1] - points[segment]) * (position - segment)
+
+
+def _partial(candle, fraction: float) -> tuple:
+    """The candle as it stands `fraction` of the way through"""
+    points = _path(candle)
+    price = _walk(candle, fraction)
+    seen = points[:min(int(fraction * 3), 2) + 1] + (price,)
+    return candle[0], candle[1], max(seen), min(seen), price, candle[5] * fraction
+
+
+def synthetic_klines(symbol: str, interval: str, start: int, count: int) -> np.ndarray:
+    """(count, 6) candles starting at open time `start` (seconds)"""
+    step = TIMEFRAME_SECONDS[interval]
+    seed = _seed(symbol)
+    base = 1 + seed % 50000
+    hours = (start + np.arange(count + 1) * step) / 3600.0
+    # Smooth cycles plus noise, evaluated at every candle boundary
+    price = base * (1 + 0.15 * np.sin(hours / 500 + seed % 7)
+                    + 0.05 * np.sin(hours / 37 + seed % 3)
+                    + 0.01 * _noise(seed, hours.astype(np.int64)))
+    opens, closes = price[:-1], price[1:]
+    wick = np.abs(_noise(seed ^ 0x5555, hours[:-1].astype(np.int64))) * 0.005 * base
+    highs = np.maximum(opens, closes) + wick
+    lows = np.minimum(opens, closes) - wick
+    volume = 1000 * (1.5 + _noise(seed ^ 0xAAAA, hours[:-1].astype(np.int64)))
+    times = start + np.arange(count) * step
+    return np.column_stack([times, opens, highs, lows, closes, volume])
+
+
+def tick_size(symbol: str) -> float:
+    """Price step of a symbol: about 1/10000 of its synthetic price"""
+    return 10.0 ** (int(np.log10(1 + _seed(symbol) % 50000)) - 4)
+
+
+class StubExchange:
+    """aiohttp application serving synthetic klines, tickers and the listing
+
+    `listing` maps each listed pair to its status; change it while running
+    to list, halt or delist pairs.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, now=time.time,
+                 tick: float = 0.01, kline_every: int = 10, pairs=DEFAULT_TRADING_PAIRS):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.now = now
+        self.tick = tick
+        self.kline_every = kline_every
+        self.requests = 0
+        self.messages = 0
+        self.sockets = set()
+        self.refuse_until = 0.0
+        self.listing = dict.fromkeys(pairs, 'TRADING')
+        self.app = web.Application()
+        self.app.router.add_get('/api/v3/klines', self.klines)
+        self.app.router.add_get('/api/v3/ticker/24hr', self.tickers)
+        self.app.router.add_get('/api/v3/exchangeInfo', self.exchange_info)
+        self.app.router.add_get('/stream', self.stream)
+        self.runner = None
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise web.HTTPTooManyRequests(headers={'Retry-After': '0.05'})
+
+    async def klines(self, request: web.Request):
+        await self._delay()
+        symbol = request.query['symbol']
+        interval = request.query['interval']
+        if interval not in TIMEFRAME_SECONDS:
+            raise web.HTTPBadRequest(text='Invalid interval')
+        step = TIMEFRAME_SECONDS[interval]
+        limit = min(int(request.query.get('limit', 500)), MAX_LIMIT)
+        current = int(candle_open(self.now(), interval))
+        if 'startTime' in request.query:
+            start = int(request.query['startTime']) // 1000
+            start = int(candle_open(start + step - 1, interval))
+        else:
+            start = current - (limit - 1) * step
+        count = max(0, min(limit, (current - start) // step + 1))
+        rows = synthetic_klines(symbol, interval, start, count)
+        # Format rows straight into JSON text; building lists for json.dumps
+        # would make the stub, not the client, the bottleneck under load
+        open_ms = (rows[:, 0] * 1000).astype(np.int64)
+        columns = [open_ms.tolist(), *rows[:, 1:].T.tolist(), (open_ms + step * 1000 - 1).tolist()]
+        body = '[' + ','.join(KLINE_ROW % row for row in zip(*columns)) + ']'
+        return web.Response(text=body, content_type='application/json')
+
+    async def tickers(self, request: web.Request):
+        await self._delay()
+        symbols = json.loads(request.query.get('symbols', '[]'))
+        step = TIMEFRAME_SECONDS['1h']
+        current = int(self.now() // step * step)
+        body = []
+        for symbol in symbols:
+            day = synthetic_klines(symbol, '1h', current - 23 * step, 24)
+            last, first = day[-1, 4], day[0, 1]
+            body.append({
+                'symbol': symbol,
+                'lastPrice': f"{last:.8f}",
+                'priceChangePercent': f"{(last - first) / first * 100:.3f}",
+                'quoteVolume': f"{float(np.sum(day[:, 5] * day[:, 4])):.2f}"
+            })
+        return web.json_response(body)
+
+    async def exchange_info(self, request: web.Request):
+        await self._delay()
+        symbols = []
+        for pair, status in list(self.listing.items()):
+            base, _, quote = pair.partition('/')
+            symbol = exchange_symbol(pair)
+            symbols.append({
+                'symbol': symbol,
+                'status': status,
+                'baseAsset': base,
+                'quoteAsset': quote,
+                'filters': [{'filterType': 'PRICE_FILTER', 'minPrice': f"{tick_size(symbol):.8f}",
+                             'maxPrice': '1000000.00000000', 'tickSize': f"{tick_size(symbol):.8f}"}]
+            })
+        return web.json_response({'timezone': 'UTC', 'serverTime': int(self.now() * 1000), 'symbols': symbols})
+
+    async def stream(self, request: web.Request):
+        """Combined trade and kline streams, one trade per symbol every tick
+
+        A kline update follows every `kline_every` ticks, and a final one
+        (x=true) when a candle ends. Times come from the stub's clock, so
+        an accelerated clock replays hours of trading in seconds.
+        """
+        if time.monotonic() < self.refuse_until:
+            raise web.HTTPServiceUnavailable()
+        subscribed = {}
+        for name in request.query.get('streams', '').split('/'):
+            symbol, _, kind = name.partition('@')
+            if kind in ('trade', f"kline_{STREAM_INTERVAL}"):
+                subscribed.setdefault(symbol.upper(), set()).add(kind.split('_')[0])
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        # Reading answers the client's pings and notices its close
+        reader = asyncio.ensure_future(self._drain(ws))
+        step = TIMEFRAME_SECONDS[STREAM_INTERVAL]
+        # Per symbol: open time, candle and the fraction of it already traded
+        forming = {}
+        try:
+            for count in itertools.count():
+                if ws.closed:
+                    break
+                now = self.now()
+                open_time = candle_open(now, STREAM_INTERVAL)
+                fraction = (now - open_time) / step
+                for symbol, kinds in subscribed.items():
+                    state = forming.get(symbol)
+                    if state is None or state[0] != open_time:
+                        if state is not None and 'kline' in kinds:
+                            await self._send_kline(ws, symbol, state[1], now, True)
+                        state = forming[symbol] = [open_time, synthetic_klines(symbol, STREAM_INTERVAL, open_time, 1)[0], 0.0]
+                    candle = state[1]
+                    if 'trade' in kinds:
+                        quantity = candle[5] * (fraction - state[2])
+                        state[2] = fraction
+                        await self._send(ws, f"{symbol.lower()}@trade", {
+                            'e': 'trade', 'E': int(now * 1000), 's': symbol, 't': self.messages,
+                            'p': f"{_walk(candle, fraction):.8f}", 'q': f"{quantity:.8f}",
+                            'T': int(now * 1000), 'm': False
+                        })
+                    if 'kline' in kinds and count % self.kline_every == 0:
+                        await self._send_kline(ws, symbol, _partial(candle, fraction), now, False)
+                await asyncio.sleep(self.tick)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.sockets.discard(ws)
+            reader.cancel()
+        return ws
+
+    @staticmethod
+    async def _drain(ws: web.WebSocketResponse):
+        async for _ in ws:
+            pass
+
+    async def _send(self, ws: web.WebSocketResponse, stream: str, data: dict):
+        self.messages += 1
+        await ws.send_str(json.dumps({'stream': stream, 'data': data}))
+
+    async def _send_kline(self, ws: web.WebSocketResponse, symbol: str, candle, now: float, final: bool):
+        open_ms = int(candle[0] * 1000)
+        await self._send(ws, f"{symbol.lower()}@kline_{STREAM_INTERVAL}", {
+            'e': 'kline', 'E': int(now * 1000), 's': symbol, 'k': {
+                't': open_ms, 'T': open_ms + TIMEFRAME_SECONDS[STREAM_INTERVAL] * 1000 - 1,
+                's': symbol, 'i': STREAM_INTERVAL,
+                'o': f"{candle[1]:.8f}", 'h': f"{candle[2]:.8f}", 'l': f"{candle[3]:.8f}",
+                'c': f"{candle[4]:.8f}", 'v': f"{candle[5]:.8f}", 'x': final
+            }
+        })
+
+    async def drop_streams(self, refuse: float = 0.0):
+        """Close every open stream connection, as an exchange restart would
+
+        New connections are refused for `refuse` seconds (real time).
+        """
+        self.refuse_until = time.monotonic() + refuse
+        for ws in list(self.sockets):
+            await ws.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving; returns the base URL"""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--listed', type=int, default=0)
+    args = parser.parse_args()
+    stub = StubExchange(latency=args.latency_ms / 1000, error_rate=args.error_rate,
+                        now=accelerated_clock(args.speed),
+                        pairs=DEFAULT_TRADING_PAIRS + [f"SYM{i}/USDT" for i in range(args.listed)])
+    web.run_app(stub.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Symbol registry: pairs interned to dense integer IDs with columnar metadata
+"""
+
+import threading
+import numpy as np
+from config import DEFAULT_TRADING_PAIRS
+
+# Listing status codes, stored as int8; DELISTED marks symbols that left
+# the exchange listing
+STATUSES = ('TRADING', 'BREAK', 'HALT', 'DELISTED')
+TRADING, BREAK, HALT, DELISTED = range(len(STATUSES))
+
+
+def exchange_symbol(pair: str) -> str:
+    """'BTC/USDT' -> 'BTCUSDT'"""
+    return pair.replace('/', '')
+
+
+class SymbolRegistry:
+    """Pairs interned to IDs 0..n-1 with per-symbol metadata in NumPy columns
+
+    A pair keeps its ID for the life of the registry: IDs are never reused
+    and symbols are never removed, only marked DELISTED, so lists and
+    arrays indexed by ID stay valid across reloads and only ever grow.
+    Lookups by name, exchange name (BTCUSDT) or ID are O(1). Columns
+    (tick_size, status, quote) are indexed by ID; quote holds an index into
+    `quotes`. Writers take the lock; readers do not, since a column is
+    replaced whole when it grows.
+    """
+
+    def __init__(self, pairs=DEFAULT_TRADING_PAIRS, capacity: int = 64):
+        self._ids = {}
+        self._exchange_ids = {}
+        self._names = []
+        self.quotes = []
+        self._quote_ids = {}
+        self.tick_size = np.zeros(capacity, dtype=np.float64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.quote = np.zeros(capacity, dtype=np.int16)
+        # Bumped by every load(); callers compare it to notice reloads
+        self.version = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        for pair in pairs:
+            self.intern(pair)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, pair: str) -> bool:
+        return pair in self._ids
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    @property
+    def names(self) -> list:
+        """Pair names, indexed by ID"""
+        return self._names
+
+    def _grow(self, size: int):
+        """Reallocate the columns for at least `size` symbols (lock held)"""
+        capacity = len(self.status)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for column in ('tick_size', 'status', 'quote'):
+            values = getattr(self, column)
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:len(values)] = values
+            setattr(self, column, grown)
+
+    def _intern_quote(self, asset: str) -> int:
+        quote_id = self._quote_ids.get(asset)
+        if quote_id is None:
+            quote_id = self._quote_ids[asset] = len(self.quotes)
+            self.quotes.append(asset)
+        return quote_id
+
+    def intern(self, pair: str, tick_size: float = 0.0, status: int = TRADING) -> int:
+        """ID of a pair, registering it first if it is new"""
+        symbol_id = self._ids.get(pair)
+        if symbol_id is not None:
+            return symbol_id
+        with self._lock:
+            symbol_id = self._ids.get(pair)
+            if symbol_id is not None:
+                return symbol_id
+            symbol_id = len(self._names)
+            self._grow(symbol_id + 1)
+            self.tick_size[symbol_id] = tick_size
+            self.status[symbol_id] = status
+            self.quote[symbol_id] = self._intern_quote(pair.partition('/')[2])
+            self._names.append(pair)
+            self._exchange_ids[exchange_symbol(pair)] = symbol_id
+            # Published last: readers find the pair only once it is complete
+            self._ids[pair] = symbol_id
+        return symbol_id
+
+    def id(self, pair: str) -> int:
+        """ID of a registered pair; KeyError for unknown pairs"""
+        return self._ids[pair]
+
+    def get(self, pair: str, default=None):
+        """ID of a pair, or `default`"""
+        return self._ids.get(pair, default)
+
+    def exchange_id(self, symbol: str, default=None):
+        """ID of a pair by its exchange name (BTCUSDT), or `default`"""
+        return self._exchange_ids.get(symbol, default)
+
+    def name(self, symbol_id: int) -> str:
+        return self._names[symbol_id]
+
+    def quote_asset(self, symbol_id: int) -> str:
+        return self.quotes[self.quote[symbol_id]]
+
+    def is_trading(self, pair: str) -> bool:
+        symbol_id = self._ids.get(pair)
+        return symbol_id is not None and self.status[symbol_id] == TRADING
+
+    def trading(self, ids=None) -> np.ndarray:
+        """IDs (of all symbols, or of `ids`) whose listing is TRADING"""
+        ids = np.arange(len(self._names)) if ids is None else np.asarray(ids, dtype=np.int64)
+        return ids[self.status[ids] == TRADING]
+
+    def subscribe(self, callback):
+        """Call callback(new_ids) after every load() that added symbols"""
+        self._listeners.append(callback)
+
+    def load(self, listings) -> list:
+        """Apply a full exchange listing; returns the IDs of new symbols
+
+        `listings` holds dicts with 'pair', 'status' (a STATUSES name) and
+        'tick_size'. Known symbols get their metadata updated, new ones are
+        interned, and registered symbols missing from the listing are
+        marked DELISTED.
+        """
+        new, seen = [], set()
+        for listing in listings:
+            pair = listing['pair']
+            status = listing.get('status', 'TRADING')
+            # Other exchange states (pre-trading, auctions, ...) do not trade either
+            status = STATUSES.index(status) if status in STATUSES else HALT
+            if pair not in self._ids:
+                new.append(self.intern(pair))
+            symbol_id = self._ids[pair]
+            seen.add(symbol_id)
+            with self._lock:
+                self.status[symbol_id] = status
+                self.tick_size[symbol_id] = listing.get('tick_size', 0.0)
+        with self._lock:
+            gone = np.setdiff1d(np.arange(len(self._names)), np.fromiter(seen, dtype=np.int64))
+            self.status[gone] = DELISTED
+            self.version += 1
+        if new:
+            for callback in self._listeners:
+                callback(new)
+        return new
+
+
+# Registry of the bot process, seeded with the configured pairs
+symbol_registry = SymbolRegistry()
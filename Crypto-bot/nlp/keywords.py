@@ -0,0 +1,302 @@
+"""
+Compiled keyword matcher for trading ideas written in Russian or English
+"""
+
+import re
+from config import DEFAULT_TRADING_PAIRS
+
+# Sentiment lexicon: word -> weight, positive is bullish. Entries are
+# stemmed when the matcher is built, so one entry covers its inflections
+# ("покупать" also matches "покупаю", "покупаем", "покупки").
+LEXICON = {
+    # English, bullish
+    'buy': 1.0, 'long': 1.5, 'bull': 1.5, 'bullish': 1.5, 'pump': 1.0, 'moon': 1.0,
+    'rally': 1.0, 'breakout': 1.0, 'uptrend': 1.5, 'accumulate': 1.0, 'accumulation': 1.0,
+    'rebound': 1.0, 'bounce': 0.5, 'reversal': 0.5, 'oversold': 1.0, 'undervalued': 1.0,
+    'support': 0.5, 'higher': 0.5, 'rise': 1.0, 'rising': 1.0, 'grow': 1.0, 'growth': 1.0,
+    'gain': 0.5, 'green': 0.5, 'ath': 1.0, 'up': 0.5, 'upside': 1.0, 'hodl': 0.5,
+    'golden': 1.0, 'bid': 0.5,
+    # English, bearish
+    'sell': -1.0, 'short': -1.5, 'bear': -1.5, 'bearish': -1.5, 'dump': -1.0, 'crash': -1.5,
+    'drop': -1.0, 'fall': -1.0, 'breakdown': -1.0, 'downtrend': -1.5, 'distribution': -1.0,
+    'overbought': -1.0, 'overvalued': -1.0, 'resistance': -0.5, 'lower': -0.5,
+    'decline': -1.0, 'loss': -0.5, 'red': -0.5, 'down': -0.5, 'downside': -1.0,
+    'correction': -1.0, 'rekt': -1.0, 'capitulation': -1.5, 'bubble': -1.0, 'death': -1.0,
+    'liquidation': -0.5, 'fud': -0.5,
+    # Russian, bullish
+    'покупать': 1.0, 'покупка': 1.0, 'купить': 1.0, 'закупаться': 1.0, 'лонг': 1.5,
+    'лонговать': 1.5, 'бычий': 1.5, 'бык': 1.0, 'рост': 1.0, 'расти': 1.0, 'растет': 1.0,
+    'вырасти': 1.0, 'памп': 1.0, 'пробой': 0.5, 'пробитие': 0.5, 'отскок': 1.0,
+    'разворот': 0.5, 'перепроданность': 1.0, 'перепродан': 1.0, 'поддержка': 0.5,
+    'накопление': 1.0, 'ракета': 1.0, 'луна': 0.5, 'вверх': 1.0, 'восходящий': 1.0,
+    'подъем': 1.0, 'прибыль': 0.5, 'зеленый': 0.5, 'укрепление': 0.5, 'позитив': 0.5,
+    # Russian, bearish
+    'продавать': -1.0, 'продажа': -1.0, 'продать': -1.0, 'шорт': -1.5, 'шортить': -1.5,
+    'медвежий': -1.5, 'медведь': -1.0, 'падение': -1.0, 'падать': -1.0, 'упасть': -1.0,
+    'обвал': -1.5, 'дамп': -1.0, 'слив': -1.0, 'сливать': -1.0, 'коррекция': -1.0,
+    'перекупленность': -1.0, 'перекуплен': -1.0, 'сопротивление': -0.5, 'вниз': -1.0,
+    'нисходящий': -1.0, 'снижение': -1.0, 'снижаться': -1.0, 'убыток': -0.5,
+    'красный': -0.5, 'крах': -1.5, 'паника': -1.0, 'пузырь': -1.0, 'ликвидация': -0.5,
+    'негатив': -0.5
+}
+
+# Two-word phrases, matched on stems before single words
+PHRASES = {
+    ('take', 'profit'): 0.0, ('stop', 'loss'): 0.0, ('тейк', 'профит'): 0.0,
+    ('стоп', 'лосс'): 0.0, ('golden', 'cross'): 1.5, ('death', 'cross'): -1.5,
+    ('higher', 'low'): 1.0, ('lower', 'high'): -1.0, ('двойное', 'дно'): 1.5,
+    ('двойная', 'вершина'): -1.5, ('all', 'time'): 0.0
+}
+
+# Words that flip the sentiment of the next match ("не покупать", "don't buy")
+NEGATIONS = {'не', 'нет', 'ни', 'not', 'no', 'never', "don't", 'dont', "isn't", "won't", 'без'}
+NEGATION_REACH = 2
+
+# Price roles set by the word in front of a number
+PRICE_ROLES = {
+    'вход': 'entry', 'входить': 'entry', 'entry': 'entry', 'enter': 'entry', 'цена': 'entry',
+    'тейк': 'take', 'тп': 'take', 'tp': 'take', 'take': 'take', 'цель': 'take', 'target': 'take',
+    'profit': 'take', 'профит': 'take',
+    'стоп': 'stop', 'sl': 'stop', 'stop': 'stop', 'лосс': 'stop', 'loss': 'stop',
+    'поддержка': 'support', 'support': 'support',
+    'сопротивление': 'resistance', 'resistance': 'resistance'
+}
+ROLE_REACH = 3
+
+# Coin names people write instead of tickers
+ASSET_ALIASES = {
+    'bitcoin': 'BTC', 'биткоин': 'BTC', 'биткойн': 'BTC', 'биток': 'BTC', 'битк': 'BTC',
+    'ethereum': 'ETH', 'эфир': 'ETH', 'эфириум': 'ETH', 'солана': 'SOL', 'solana': 'SOL',
+    'рипл': 'XRP', 'ripple': 'XRP', 'доге': 'DOGE', 'dogecoin': 'DOGE', 'кардано': 'ADA',
+    'cardano': 'ADA', 'полкадот': 'DOT', 'polkadot': 'DOT'
+}
+KNOWN_ASSETS = {pair.split('/')[0] for pair in DEFAULT_TRADING_PAIRS} | {
+    'BTC', 'ETH', 'XRP', 'DOGE', 'TON', 'TRX', 'LTC', 'LINK', 'ATOM', 'NEAR', 'APT',
+    'ARB', 'OP', 'SUI', 'PEPE', 'SHIB', 'UNI', 'FIL', 'ETC', 'BCH', 'XLM', 'INJ'
+}
+QUOTE_ASSETS = ('USDT', 'USDC', 'BUSD', 'FDUSD', 'USD')
+DEFAULT_QUOTE = 'USDT'
+
+# Suffixes stripped by the stemmer, longest first within each language
+RUSSIAN_ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'ией', 'ием', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ьего', 'ьему', 'ьим', 'ьих', 'ение', 'ание', 'ения', 'ания', 'ению', 'анию', 'ений',
+    'аний', 'ться', 'тся', 'ись', 'ась', 'ось', 'лся', 'лась',
+    'ешь', 'ишь', 'ете', 'ите', 'ает', 'яет', 'еет', 'ует', 'ают', 'яют', 'еют', 'уют',
+    'аем', 'яем', 'уем', 'ать', 'ять', 'еть', 'ить', 'уть', 'ыть', 'ала', 'яла', 'ило',
+    'ыла', 'аю', 'яю', 'ую', 'юю', 'ьи', 'ья', 'ье',
+    'ый', 'ий', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ом', 'ем', 'ам', 'ям', 'ах',
+    'ях', 'ов', 'ев', 'ей', 'ию', 'ия', 'им', 'ым', 'ет', 'ут', 'ют', 'ат', 'ят', 'ил',
+    'ыл', 'ал', 'ял', 'ел', 'ла', 'ло', 'ли', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+}, key=len, reverse=True)
+ENGLISH_ENDINGS = ('ations', 'ation', 'ings', 'ing', 'ish', 'ed', 'es', 's')
+MIN_STEM = 3
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<sep>\x1e)
+  | (?P<pair>\b[A-Za-z]{2,10}\s?/\s?(?:USDT|USDC|BUSD|FDUSD|USD|usdt|usdc|usd)\b)
+  | (?P<timeframe>\b\d{1,2}\s?(?:m|h|d|w|M|H|D|W|мин|ч|д|н)\b)
+  | (?P<percent>[-+]?\d+(?:[.,]\d+)?\s?%)
+  | (?P<price>(?<![^\W\d_])\$?(?:\d{1,3}(?:[ ,]\d{3})+|\d+)(?:[.,]\d+)?(?:[kKкК]\b)?)
+  | (?P<asset>[$#][A-Za-z]{2,10}\b)
+  | (?P<word>[^\W\d_]+(?:'[^\W\d_]+)?)
+""", re.VERBOSE)
+
+# Record separator between texts in a batch
+SEPARATOR = '\x1e'
+
+
+def stem(word: str) -> str:
+    """Crude suffix-stripping stemmer for Russian and English words"""
+    word = word.lower().replace('ё', 'е')
+    endings = RUSSIAN_ENDINGS if 'а' <= word[0] <= 'я' else ENGLISH_ENDINGS
+    if endings is ENGLISH_ENDINGS and word.endswith('ies') and len(word) > MIN_STEM + 2:
+        # rallies -> rally
+        return word[:-3] + 'y'
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def parse_price(token: str) -> float:
+    """'$42,000' / '42 000' / '42k' / '0,35' -> float"""
+    token = token.lstrip('$').strip()
+    multiplier = 1.0
+    if token[-1] in 'kKкК':
+        multiplier = 1000.0
+        token = token[:-1].strip()
+    if re.fullmatch(r"\d{1,3}(?:[ ,]\d{3})+(?:\.\d+)?", token):
+        token = token.replace(' ', '').replace(',', '')
+    else:
+        token = token.replace(',', '.')
+    return float(token) * multiplier
+
+
+class KeywordMatcher:
+    """Single-pass scanner for sentiment words, tickers, prices and timeframes
+
+    One compiled regular expression tokenizes the text in a single left to
+    right pass; every word is stemmed once and looked up in dicts built from
+    the lexicon, so the cost is linear in the text length regardless of the
+    lexicon size. Whole tokens are matched, so "up" no longer fires inside
+    "support".
+    """
+
+    def __init__(self, lexicon: dict = LEXICON, phrases: dict = PHRASES):
+        self.weights = {}
+        for word, weight in lexicon.items():
+            self.weights[stem(word)] = weight
+        self.phrases = {(stem(first), stem(second)): weight for (first, second), weight in phrases.items()}
+        self.negations = {stem(word) for word in NEGATIONS} | NEGATIONS
+        self.roles = {stem(word): role for word, role in PRICE_ROLES.items()}
+        self.aliases = {stem(word): asset for word, asset in ASSET_ALIASES.items()}
+        self._stem_cache = {}
+
+    def _stem(self, word: str) -> str:
+        cached = self._stem_cache.get(word)
+        if cached is None:
+            if len(self._stem_cache) > 50000:
+                self._stem_cache.clear()
+            cached = self._stem_cache[word] = stem(word)
+        return cached
+
+    @staticmethod
+    def _empty() -> dict:
+        return {
+            'bullish': 0.0,
+            'bearish': 0.0,
+            'score': 0.0,
+            'direction': None,
+            'tickers': [],
+            'prices': [],
+            'timeframes': [],
+            'matches': []
+        }
+
+    @staticmethod
+    def _finish(result: dict) -> dict:
+        result['score'] = result['bullish'] - result['bearish']
+        if result['score'] > 0:
+            result['direction'] = 'LONG'
+        elif result['score'] < 0:
+            result['direction'] = 'SHORT'
+        result['tickers'] = list(dict.fromkeys(result['tickers']))
+        result['timeframes'] = list(dict.fromkeys(result['timeframes']))
+        return result
+
+    def _scan(self, text: str):
+        """Yield one result dict per SEPARATOR-delimited record of text"""
+        result = self._empty()
+        previous = None
+        negate_until = -1
+        role, role_until = None, -1
+        position = 0
+
+        for match in TOKEN_PATTERN.finditer(text):
+            kind = match.lastgroup
+            token = match.group()
+            position += 1
+
+            if kind == 'sep':
+                yield self._finish(result)
+                result = self._empty()
+                previous, negate_until, role, role_until = None, -1, None, -1
+                continue
+
+            if kind == 'pair':
+                base, quote = (part.strip().upper() for part in token.split('/'))
+                result['tickers'].append(f"{base}/{quote}")
+                previous = None
+                continue
+
+            if kind == 'asset':
+                result['tickers'].append(f"{token[1:].upper()}/{DEFAULT_QUOTE}")
+                previous = None
+                continue
+
+            if kind == 'timeframe':
+                result['timeframes'].append(re.sub(r"\s", '', token).lower())
+                previous = None
+                continue
+
+            if kind == 'percent':
+                previous = None
+                continue
+
+            if kind == 'price':
+                try:
+                    value = parse_price(token)
+                except ValueError:
+                    continue
+                result['prices'].append({'value': value, 'role': role if position <= role_until else None})
+                previous = None
+                continue
+
+            # Plain word: ticker, price role, negation or sentiment
+            upper = token.upper()
+            if token.isupper() and upper in KNOWN_ASSETS:
+                result['tickers'].append(f"{upper}/{DEFAULT_QUOTE}")
+                previous = None
+                continue
+            if token.isupper() and upper.endswith(QUOTE_ASSETS):
+                quote = next(q for q in QUOTE_ASSETS if upper.endswith(q))
+                base = upper[:-len(quote)]
+                if base in KNOWN_ASSETS:
+                    result['tickers'].append(f"{base}/{quote}")
+                    previous = None
+                    continue
+
+            word = self._stem(token)
+            if word in self.aliases:
+                result['tickers'].append(f"{self.aliases[word]}/{DEFAULT_QUOTE}")
+            if word in self.roles:
+                role, role_until = self.roles[word], position + ROLE_REACH
+            if token.lower() in self.negations or word in self.negations:
+                negate_until = position + NEGATION_REACH
+                previous = None
+                continue
+
+            weight = None
+            phrase = (previous, word) if previous is not None else None
+            if phrase in self.phrases:
+                weight = self.phrases[phrase]
+                # The first word of the phrase was counted on its own; undo it
+                if result['matches'] and result['matches'][-1][0] == previous:
+                    _, counted = result['matches'].pop()
+                    result['bullish' if counted > 0 else 'bearish'] -= abs(counted)
+                word_key = f"{previous} {word}"
+            else:
+                weight = self.weights.get(word)
+                word_key = word
+            previous = word
+
+            if not weight:
+                continue
+            if position <= negate_until:
+                weight = -weight * 0.5
+            result['bullish' if weight > 0 else 'bearish'] += abs(weight)
+            result['matches'].append((word_key, weight))
+
+        yield self._finish(result)
+
+    def analyze(self, text: str) -> dict:
+        """Sentiment score, direction, tickers, prices and timeframes of a text
+
+        score > 0 is bullish; direction is 'LONG', 'SHORT' or None.
+        Prices carry the role announced just before them (entry, take,
+        stop, support, resistance) when there was one.
+        """
+        return next(self._scan(text.replace(SEPARATOR, ' ')))
+
+    def analyze_many(self, texts) -> list:
+        """analyze() for many texts in one scan over their concatenation"""
+        texts = [text.replace(SEPARATOR, ' ') for text in texts]
+        if not texts:
+            return []
+        return list(self._scan(SEPARATOR.join(texts)))
+
+
+# Shared matcher; building it stems the whole lexicon
+keyword_matcher = KeywordMatcher()
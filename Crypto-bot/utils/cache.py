@@ -0,0 +1,328 @@
+"""
+In-process caches: TTL with single-flight loading, and size-bounded LRU
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+from concurrent.futures import Executor, Future
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+logger = setup_logger()
+
+
+class TTLCache:
+    """Thread-safe cache of computed values that expire after `ttl` seconds
+
+    Concurrent misses for the same key share one in-flight load: the first
+    caller computes the value and everyone else waits on the same Future.
+    Failed loads are not cached. Keys registered with warm() are reloaded by
+    a background thread `refresh_ahead` seconds before they expire, so
+    callers keep hitting a fresh value instead of queueing behind a reload.
+    """
+
+    def __init__(self, ttl: float, refresh_ahead: float = 0.0, name: str = 'cache', clock=time.monotonic):
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self.name = name
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._warm = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'refreshes': 0, 'evictions': 0, 'errors': 0}
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _count(self, result: str):
+        self._stats[result] += 1
+        metrics.inc('cache_requests_total', cache=self.name, result=result)
+
+    def _evict(self, now: float):
+        """Drop expired entries (lock held)"""
+        expired = [key for key, (_, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        self._stats['evictions'] += len(expired)
+
+    def _load(self, key, loader, future: Future):
+        """Compute a value and publish it to the cache and waiters"""
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._stats['errors'] += 1
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def get_future(self, key, loader, executor: Executor = None) -> Future:
+        """Future for the cached value, starting a load on a miss
+
+        The load runs inline, or in `executor` when one is given (async
+        callers use this to await the value without blocking the loop).
+        """
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._count('hits')
+                future = Future()
+                future.set_result(entry[0])
+                return future
+            future = self._inflight.get(key)
+            if future is not None:
+                self._count('coalesced')
+                return future
+            self._count('misses')
+            self._evict(now)
+            future = self._inflight[key] = Future()
+        if executor is None:
+            self._load(key, loader, future)
+        else:
+            try:
+                executor.submit(self._load, key, loader, future)
+            except Exception as e:
+                # E.g. the executor was shut down: fail the waiters instead of
+                # leaving an in-flight load that never completes
+                with self._lock:
+                    self._inflight.pop(key, None)
+                future.set_exception(e)
+                raise
+        return future
+
+    def get(self, key, loader):
+        """Cached value, computed once per TTL by loader()"""
+        return self.get_future(key, loader).result()
+
+    def invalidate(self, key=None):
+        """Forget one key, or everything"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters, current size and hit rate"""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / lookups if lookups else 0.0
+        return stats
+
+    def warm(self, key, loader):
+        """Keep a key loaded: refresh it in the background before expiry"""
+        with self._lock:
+            self._warm[key] = loader
+        self.start()
+        self._wakeup.set()
+
+    def _refresh_due(self) -> float:
+        """Reload warm keys close to expiry; seconds until the next one is due"""
+        with self._lock:
+            now = self.clock()
+            due = []
+            wait = self.ttl
+            for key, loader in self._warm.items():
+                entry = self._entries.get(key)
+                remaining = entry[1] - now - self.refresh_ahead if entry is not None else 0
+                if remaining > 0:
+                    wait = min(wait, remaining)
+                elif key not in self._inflight:
+                    future = self._inflight[key] = Future()
+                    due.append((key, loader, future))
+                    self._stats['refreshes'] += 1
+        for key, loader, future in due:
+            self._load(key, loader, future)
+            if future.exception() is not None:
+                logger.error(f"Background refresh of {self.name} cache failed for {key}: {future.exception()}")
+                wait = min(wait, 1.0)
+            else:
+                wait = min(wait, self.ttl - self.refresh_ahead)
+        return wait
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._refresh_due()
+            self._wakeup.wait(max(wait, 0.01))
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the background refresh thread (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop background refreshes"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and pickled size
+
+    With a directory, entries are also written to disk (one pickle file per
+    key) and read back on a memory miss, so the cache survives restarts.
+    The disk tier has its own size limit and drops least recently used
+    files first. Keys are strings.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 directory: str = None, max_disk_bytes: int = 256 * 1024 * 1024, name: str = 'lru'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _count(self, result: str):
+        self._stats[result] += 1
+        metrics.inc('cache_requests_total', cache=self.name, result=result)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, quote(key, safe='') + '.pkl')
+
+    def _disk_files(self):
+        """(path, size, mtime) of every entry file"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _store(self, key: str, value, size: int):
+        """Insert into the memory tier and evict down to the limits (lock held)"""
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self._stats['evictions'] += 1
+
+    def get(self, key: str, default=None):
+        """Cached value (memory, then disk), or default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._count('hits')
+                return entry[0]
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    blob = f.read()
+                value = pickle.loads(blob)
+                # mtime is the disk tier's recency
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Failed to read {self.name} cache entry {key}: {e}")
+            else:
+                with self._lock:
+                    self._store(key, value, len(blob))
+                    self._count('disk_hits')
+                return value
+        with self._lock:
+            self._count('misses')
+        return default
+
+    def put(self, key: str, value):
+        """Store a value in memory and, when configured, on disk"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, value, len(blob))
+        if self.directory:
+            self._write(key, blob)
+
+    def _write(self, key: str, blob: bytes):
+        path = self._path(key)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(temp, 'wb') as f:
+                f.write(blob)
+            os.replace(temp, path)
+        except OSError as e:
+            logger.error(f"Failed to write {self.name} cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(blob) - previous
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete least recently used files down to 90% of the disk limit"""
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        removed = 0
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._stats['disk_evictions'] += removed
+
+    def keys(self) -> list:
+        """Keys held in memory or on disk"""
+        with self._lock:
+            keys = list(self._entries)
+        if self.directory:
+            keys += [
+                unquote(os.path.basename(path)[:-len('.pkl')])
+                for path, _, _ in self._disk_files()
+            ]
+        return list(dict.fromkeys(keys))
+
+    def stats(self) -> dict:
+        """Hit/miss counters and memory/disk usage"""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), bytes=self._bytes, disk_bytes=self._disk_bytes)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
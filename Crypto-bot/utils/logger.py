@@ -2,31 +2,171 @@
 Logging configuration for the Telegram bot
 """
 
+import atexit
+import functools
+import itertools
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 from datetime import datetime
+from utils.metrics import metrics
+from config import LOG_MODE, LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLING
+
+# `extra` of the high-volume handler logs, the keys LOG_SAMPLING refers to
+REQUEST = {'event': 'request'}
+REPLY = {'event': 'reply'}
+
+# LogRecord attributes that are not user-supplied extras
+RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_sampling(spec: str) -> dict:
+    """'reply=0.1,request=0.5' -> {'reply': 0.1, 'request': 0.5}"""
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            event, rate = item.split('=', 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of INFO and lower records per `event`
+
+    Records of an event with rate r are kept one in round(1 / r), counting
+    per event, so the kept ones are spread evenly. Warnings, errors and
+    records without an event always pass.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in rates.items()}
+        self.counters = {event: itertools.count() for event in rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        every = self.every.get(getattr(record, 'event', None))
+        if every is None:
+            return True
+        if every and next(self.counters[record.event]) % every == 0:
+            return True
+        metrics.inc('log_sampled_out_total', event=record.event)
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the extras as fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are, formatting happens on the log thread
+
+    The stock QueueHandler renders the message before queueing it; here the
+    calling thread only appends the record. A full queue drops the record
+    (counted in log_dropped_total) instead of blocking the caller.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('log_dropped_total')
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """Queue listener whose stop waits for room in a full queue
+
+    The stock stop() puts its end marker with put_nowait(), which raises
+    queue.Full when the queue is full (records are dropped rather than
+    blocking the callers); here it waits for the log thread to make room.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def stop_listener(listener: logging.handlers.QueueListener):
+    """Write out the queued records and stop the log thread, once"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def make_formatter(fmt: str = LOG_FORMAT) -> logging.Formatter:
+    if fmt == 'json':
+        return JsonFormatter()
+    return logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+
+def configure(logger: logging.Logger, stream=None, mode: str = LOG_MODE, fmt: str = LOG_FORMAT,
+              queue_size: int = LOG_QUEUE_SIZE, sampling: str = LOG_SAMPLING):
+    """Attach the output handler to a logger, replacing earlier ones
+
+    Returns the queue listener in 'queue' mode (stopped at exit), else None.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        listener = getattr(handler, 'listener', None)
+        if listener is not None:
+            stop_listener(listener)
+            atexit.unregister(listener.stop_at_exit)
+    for log_filter in list(logger.filters):
+        logger.removeFilter(log_filter)
+
+    console_handler = logging.StreamHandler(stream or sys.stdout)
+    console_handler.setFormatter(make_formatter(fmt))
+    rates = parse_sampling(sampling)
+    if rates:
+        logger.addFilter(SamplingFilter(rates))
+
+    if mode != 'queue':
+        logger.addHandler(console_handler)
+        return None
+
+    # The handler thread only appends to the queue; stdout is written by
+    # the listener thread
+    queue_handler = LazyQueueHandler(queue.Queue(queue_size))
+    listener = DrainingQueueListener(queue_handler.queue, console_handler)
+    queue_handler.listener = listener
+    logger.addHandler(queue_handler)
+    listener.start()
+    # Its own callable, so replacing this listener leaves others registered
+    listener.stop_at_exit = functools.partial(stop_listener, listener)
+    atexit.register(listener.stop_at_exit)
+    return listener
+
 
 def setup_logger():
     """Setup and configure logger for the bot"""
-    
+
     # Create logger
     logger = logging.getLogger('crypto_bot')
-    logger.setLevel(logging.INFO)
-    
-    # Create console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    console_handler.setFormatter(formatter)
-    
+
     # Add handler to logger
     if not logger.handlers:
-        logger.addHandler(console_handler)
-    
+        logger.setLevel(LOG_LEVEL)
+        configure(logger)
+
     return logger
@@ -0,0 +1,230 @@
+"""
+In-process counters, gauges and latency histograms for bot monitoring
+"""
+
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def metric_key(name: str, labels: dict) -> str:
+    """Series key in Prometheus notation, e.g. calls_total{method="send"}"""
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+
+class Histogram:
+    """Bucketed observations of one series"""
+
+    __slots__ = ('name', 'labels', 'bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, name: str, labels: dict, bounds: tuple):
+        self.name = name
+        self.labels = labels
+        self.bounds = bounds
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation within the bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.bounds[i - 1] if i > 0 else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class Metrics:
+    """Thread-safe registry of named counters, gauges and histograms
+
+    Labels are passed as keyword arguments and become part of the series key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        key = metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge to the current value"""
+        key = metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        """Add an observation (seconds, unless other buckets are given) to a histogram"""
+        self._observe(metric_key(name, labels), name, labels, buckets, value)
+
+    def _observe(self, key: str, name: str, labels: dict, buckets: tuple, value: float):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(name, labels, buckets)
+            histogram.observe(value)
+
+    def timed(self, name: str, **labels):
+        """Decorator recording the duration of every call in a histogram"""
+        key = metric_key(name, labels)
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._observe(key, name, labels, LATENCY_BUCKETS, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def histogram(self, name: str, **labels) -> dict:
+        """Count, sum and p50/p90/p99 estimates of a histogram"""
+        key = metric_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                return {'count': 0, 'sum': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+            return {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'p50': histogram.quantile(0.5),
+                'p90': histogram.quantile(0.9),
+                'p99': histogram.quantile(0.99)
+            }
+
+    def get(self, name: str, default: float = 0, **labels):
+        """Read a counter or gauge"""
+        key = metric_key(name, labels)
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            return self._gauges.get(key, default)
+
+    def snapshot(self) -> dict:
+        """Copy of all counters and gauges"""
+        with self._lock:
+            return {**self._counters, **self._gauges}
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind, series in (('counter', self._counters), ('gauge', self._gauges)):
+                declared = set()
+                for key in sorted(series):
+                    name = key.partition('{')[0]
+                    if name not in declared:
+                        declared.add(name)
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{key} {series[key]:g}")
+            declared = set()
+            for key in sorted(self._histograms):
+                histogram = self._histograms[key]
+                name = histogram.name
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{metric_key(name + '_bucket', dict(histogram.labels, le=bound))} {cumulative}")
+                lines.append(f"{metric_key(name + '_sum', histogram.labels)} {histogram.sum:g}")
+                lines.append(f"{metric_key(name + '_count', histogram.labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop all values"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+class MetricsServer:
+    """Local HTTP endpoint for Prometheus scrapes
+
+    GET /metrics returns every series of the registry; GET /debug/slow the
+    slowest requests recorded by the profiler, when one is given.
+    """
+
+    def __init__(self, registry: Metrics = None, host: str = '127.0.0.1', port: int = 9100, profiler=None):
+        self.registry = registry if registry is not None else metrics
+        self.profiler = profiler
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """Bound (host, port); useful when started on port 0"""
+        return self.httpd.server_address[:2]
+
+    def _make_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    self._reply(server.registry.render(), 'text/plain; version=0.0.4')
+                elif self.path == '/debug/slow' and server.profiler is not None:
+                    self._reply(server.profiler.report(), 'text/plain')
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+
+            def _reply(self, text: str, content_type: str):
+                body = text.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are too frequent for the bot log
+                pass
+
+        return RequestHandler
+
+    def start(self):
+        """Serve scrapes in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Shared registry for the whole bot process
+metrics = Metrics()
@@ -0,0 +1,20 @@
+"""
+Child process helpers, free of bot state so any worker process can import them
+"""
+
+import multiprocessing
+import os
+import threading
+
+
+def exit_with_parent():
+    """End this child process once its parent has exited"""
+    parent = multiprocessing.parent_process()
+    if parent is None:
+        return
+
+    def watch():
+        parent.join()
+        os._exit(1)
+
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
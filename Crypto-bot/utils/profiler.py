@@ -0,0 +1,135 @@
+"""
+Sampling profiler for the slowest handled requests
+"""
+
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from config import PROFILE_INTERVAL, PROFILE_SLOWEST
+
+# Frames kept per sampled stack, innermost last
+MAX_STACK_DEPTH = 40
+
+
+class _Request:
+    """A request in flight and the stacks sampled while it ran"""
+
+    __slots__ = ('name', 'frame', 'started', 'duration', 'samples')
+
+    def __init__(self, name: str, frame):
+        self.name = name
+        self.frame = frame
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.samples = Counter()
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of requests in flight and keeps the slowest ones
+
+    A request is the frame that called begin() (a handler wrapper, or the
+    coroutine of an async one). Every `interval` seconds the sampler thread
+    looks at the stack of each thread; the frames above a request frame are
+    counted for that request, so coroutines are only charged while they
+    run, not while they await. The `slowest` requests by duration are kept
+    with their stack breakdown for report(). Without start(), begin() and
+    end() cost next to nothing.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, slowest: int = PROFILE_SLOWEST):
+        self.interval = interval
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._active = {}
+        self._kept = []
+        self._order = itertools.count()
+        self._running = False
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def begin(self, name: str):
+        """Start profiling the calling frame as a request; returns a token for end()"""
+        if not self._running:
+            return None
+        request = _Request(name, sys._getframe(1))
+        with self._lock:
+            self._active[id(request.frame)] = request
+        return request
+
+    def end(self, request):
+        """The request finished: keep it if it is among the slowest"""
+        if request is None:
+            return
+        request.duration = time.perf_counter() - request.started
+        with self._lock:
+            self._active.pop(id(request.frame), None)
+            request.frame = None
+            entry = (request.duration, next(self._order), request)
+            if len(self._kept) < self.slowest:
+                heapq.heappush(self._kept, entry)
+            elif request.duration > self._kept[0][0]:
+                heapq.heapreplace(self._kept, entry)
+
+    def sample(self):
+        """Charge the current stack of every thread to the request it runs"""
+        frames = sys._current_frames()
+        with self._lock:
+            if not self._active:
+                return
+            for thread_id, frame in frames.items():
+                stack = []
+                while frame is not None:
+                    request = self._active.get(id(frame))
+                    if request is not None and request.frame is frame:
+                        stack.reverse()
+                        request.samples[";".join(stack[-MAX_STACK_DEPTH:]) or frame_label(frame)] += 1
+                        break
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            self.sample()
+
+    def start(self):
+        """Start the sampler thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+
+    def slowest_requests(self) -> list:
+        """Kept requests as (name, seconds, samples), slowest first"""
+        with self._lock:
+            kept = sorted(self._kept, reverse=True)
+            return [(request.name, duration, Counter(request.samples)) for duration, _, request in kept]
+
+    def report(self, stacks: int = 5) -> str:
+        """Slowest requests with the share of samples per stack"""
+        lines = []
+        for name, duration, samples in self.slowest_requests():
+            total = sum(samples.values())
+            lines.append(f"{name} {duration * 1000:.1f} ms, {total} samples")
+            for stack, count in samples.most_common(stacks):
+                lines.append(f"  {count / total:6.1%} {stack}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared profiler, started from main when PROFILE_INTERVAL is set
+profiler = SlowRequestProfiler()
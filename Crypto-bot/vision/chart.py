@@ -0,0 +1,239 @@
+"""
+Candlestick chart screenshot analysis with NumPy
+
+Everything here is a pure function of the image bytes so it can run in a
+worker process. Coordinates are image pixels; "levels" are fractions of the
+chart height (0 = bottom, 1 = top), since a screenshot has no price scale
+we could read reliably.
+"""
+
+import io
+import numpy as np
+from PIL import Image
+from market.formulas import rsi, macd
+
+# Longest image side analysed; larger images are downscaled while decoding
+MAX_SIDE = 1280
+
+# A pixel is bullish when green leads red by this much (covers the teal
+# used by TradingView and Binance), bearish when red leads green
+COLOR_MARGIN = 40
+MIN_CHANNEL = 70
+
+# Column runs with fewer colored pixels are noise, not candles
+MIN_CANDLE_PIXELS = 6
+
+# Side of the difference-hash grid; the hash has HASH_SIZE ** 2 bits
+HASH_SIZE = 16
+
+# Support/resistance histogram resolution and minimum touches per band
+LEVEL_BINS = 60
+MIN_TOUCHES = 3
+
+
+class ChartNotFound(ValueError):
+    """No candlesticks could be found in the image"""
+
+
+def decode_image(data: bytes, max_side: int = MAX_SIDE) -> np.ndarray:
+    """Image bytes -> (height, width, 3) uint8 RGB array"""
+    image = Image.open(io.BytesIO(data))
+    # JPEG can be decoded straight at a reduced scale, which is much cheaper
+    image.draft('RGB', (max_side, max_side))
+    image = image.convert('RGB')
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side))
+    return np.asarray(image)
+
+
+def image_hash(data: bytes, size: int = HASH_SIZE) -> bytes:
+    """Perceptual difference hash (dHash) of an image
+
+    Each bit tells whether a cell of a size x (size + 1) grayscale grid is
+    brighter than its right neighbour. Rescaled or recompressed copies of
+    the same screenshot land within a few bits of each other.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft('L', (size * 8, size * 8))
+    grid = np.asarray(image.convert('L').resize((size + 1, size), Image.BOX), dtype=np.int16)
+    return np.packbits(grid[:, 1:] > grid[:, :-1]).tobytes()
+
+
+def hamming(hashes: np.ndarray, value: bytes) -> np.ndarray:
+    """Bit distance from every row of an (n, bytes) uint8 array to one hash"""
+    diff = np.bitwise_xor(hashes, np.frombuffer(value, dtype=np.uint8))
+    return np.unpackbits(diff, axis=1).sum(axis=1)
+
+
+def color_masks(pixels: np.ndarray):
+    """Boolean masks of bullish (green) and bearish (red) pixels"""
+    rgb = pixels.astype(np.int16)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    green = (g - r > COLOR_MARGIN) & (g >= b) & (g > MIN_CHANNEL)
+    red = (r - g > COLOR_MARGIN) & (r > b) & (r > MIN_CHANNEL)
+    return green, red
+
+
+def _runs(mask: np.ndarray):
+    """Start and end (exclusive) indices of True runs in a 1-D mask"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _price_pane(colored: np.ndarray) -> slice:
+    """Rows of the price pane, without a volume pane below it"""
+    # A few stray pixels (JPEG ringing) do not make a row part of the chart
+    filled = colored.sum(axis=1) > max(2, colored.shape[1] // 500)
+    starts, ends = _runs(~filled)
+    rows = np.flatnonzero(filled)
+    if not len(rows):
+        return slice(0, colored.shape[0])
+    top, bottom = rows[0], rows[-1] + 1
+    # Interior gaps only; a volume pane is a short colored strip under the last one
+    inner = (starts > top) & (ends < bottom) & (ends - starts >= 2)
+    if inner.any():
+        split = starts[inner][-1]
+        if bottom - split < 0.35 * (bottom - top):
+            return slice(top, split)
+    return slice(top, bottom)
+
+
+def find_candles(pixels: np.ndarray) -> dict:
+    """Locate candlesticks and read their OHLC in chart-height units
+
+    Columns containing colored pixels are grouped into runs, one per candle.
+    Per run, rows where most of the run's columns are colored form the body
+    and rows with any colored pixel span the wicks. The computation is done
+    for all runs at once with np.add.reduceat.
+    """
+    green, red = color_masks(pixels)
+    colored = green | red
+    pane = _price_pane(colored)
+    colored, green = colored[pane], green[pane]
+    height = colored.shape[0]
+
+    starts, ends = _runs(colored.any(axis=0))
+    if not len(starts):
+        raise ChartNotFound("no colored candles found")
+    widths = ends - starts
+    cumulative = np.concatenate(([0], np.cumsum(colored.sum(axis=0))))
+    run_pixels = cumulative[ends] - cumulative[starts]
+    # Specks are compression noise; adjacent candles that touch merge into
+    # one wide run that cannot be read reliably. Drop both
+    keep = run_pixels >= MIN_CANDLE_PIXELS
+    if keep.any():
+        keep &= widths <= max(3 * np.median(widths[keep]), 3)
+    starts, ends, widths = starts[keep], ends[keep], widths[keep]
+    if len(starts) < 2:
+        raise ChartNotFound("not enough candles found")
+
+    # Per-row pixel counts of every run: reduceat over [start, end) pairs,
+    # with a zero column appended so an end at the image edge is a valid index
+    bounds = np.column_stack([starts, ends]).ravel()
+    counts = np.add.reduceat(np.pad(colored, ((0, 0), (0, 1))), bounds, axis=1, dtype=np.int32)[:, ::2]
+    green_counts = np.add.reduceat(np.pad(green, ((0, 0), (0, 1))), bounds, axis=1, dtype=np.int32)[:, ::2]
+
+    any_rows = counts > 0
+    body_rows = counts >= np.maximum(np.ceil(widths * 0.6), 1)[None, :]
+    thin = widths < 3
+    body_rows[:, thin] = any_rows[:, thin]
+
+    def top_bottom(rows):
+        top = rows.argmax(axis=0)
+        bottom = height - 1 - rows[::-1].argmax(axis=0)
+        return top, bottom
+
+    wick_top, wick_bottom = top_bottom(any_rows)
+    body_top, body_bottom = top_bottom(body_rows)
+    bullish = 2 * green_counts.sum(axis=0) >= counts.sum(axis=0)
+
+    def level(y):
+        return 1.0 - y / max(height - 1, 1)
+
+    high, low = level(wick_top), level(wick_bottom)
+    upper, lower = level(body_top), level(body_bottom)
+    return {
+        'x': (starts + ends) / 2.0,
+        'open': np.where(bullish, lower, upper),
+        'close': np.where(bullish, upper, lower),
+        'high': high,
+        'low': low,
+        'bullish': bullish
+    }
+
+
+def trendline(close: np.ndarray, lookback: int = 50) -> dict:
+    """Least-squares line through recent closes"""
+    y = close[-lookback:]
+    x = np.arange(len(y), dtype=np.float64)
+    slope, intercept = np.polyfit(x, y, 1)
+    fitted = slope * x + intercept
+    total = np.sum((y - y.mean()) ** 2)
+    r2 = 1.0 - np.sum((y - fitted) ** 2) / total if total else 0.0
+    return {'slope': float(slope), 'r2': float(r2), 'change': float(slope * (len(y) - 1))}
+
+
+def level_bands(high: np.ndarray, low: np.ndarray, bins: int = LEVEL_BINS,
+                min_touches: int = MIN_TOUCHES) -> list:
+    """Support/resistance bands where many highs or lows cluster
+
+    Returns (lower, upper, touches) tuples sorted by strength.
+    """
+    touches, edges = np.histogram(np.concatenate([high, low]), bins=bins, range=(0.0, 1.0))
+    smooth = np.convolve(touches, [1, 2, 1], mode='same') / 2.0
+    padded = np.concatenate(([-1], smooth, [-1]))
+    peaks = np.flatnonzero((smooth >= padded[:-2]) & (smooth > padded[2:]) & (touches >= min_touches))
+    bands = [(float(edges[i]), float(edges[i + 1]), int(touches[i])) for i in peaks]
+    return sorted(bands, key=lambda band: -band[2])
+
+
+def candle_patterns(candles: dict) -> list:
+    """Names of candlestick patterns formed by the last candles"""
+    o, c, h, l = (candles[key][-2:] for key in ('open', 'close', 'high', 'low'))
+    patterns = []
+    body = abs(c[-1] - o[-1])
+    span = max(h[-1] - l[-1], 1e-9)
+    upper = h[-1] - max(o[-1], c[-1])
+    lower = min(o[-1], c[-1]) - l[-1]
+    if body < 0.1 * span:
+        patterns.append('doji')
+    elif lower > 2 * body and upper < body:
+        patterns.append('hammer')
+    elif upper > 2 * body and lower < body:
+        patterns.append('shooting_star')
+    if len(o) == 2:
+        if c[-1] > o[-1] and c[-2] < o[-2] and c[-1] >= o[-2] and o[-1] <= c[-2]:
+            patterns.append('bullish_engulfing')
+        elif c[-1] < o[-1] and c[-2] > o[-2] and c[-1] <= o[-2] and o[-1] >= c[-2]:
+            patterns.append('bearish_engulfing')
+    return patterns
+
+
+def analyze_chart(pixels: np.ndarray) -> dict:
+    """Features of a candlestick chart image (plain Python values)"""
+    candles = find_candles(pixels)
+    close = candles['close']
+    last = float(close[-1])
+    bands = level_bands(candles['high'], candles['low'])
+    resistance = [band for band in bands if band[0] > last]
+    support = [band for band in bands if band[1] < last]
+    features = {
+        'candles': len(close),
+        'bullish_share': float(np.mean(candles['bullish'])),
+        'last_close': last,
+        'trend': trendline(close),
+        'resistance': min(resistance, key=lambda band: band[0]) if resistance else None,
+        'support': max(support, key=lambda band: band[1]) if support else None,
+        'patterns': candle_patterns(candles),
+        'rsi': None,
+        'macd_hist': None
+    }
+    if len(close) >= 30:
+        features['rsi'] = float(rsi(close)[-1])
+        features['macd_hist'] = float(macd(close)[2][-1])
+    return features
+
+
+def analyze_chart_image(data: bytes) -> dict:
+    """Decode image bytes and analyze the chart (process pool entry point)"""
+    return analyze_chart(decode_image(data))
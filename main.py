@@ -1,5 +1,8 @@
 import os
+import hmac
+import asyncio
 import logging
+from aiohttp import web
 from aiogram import Bot, Dispatcher, types, executor
 from dotenv import load_dotenv
 
@@ -7,6 +10,14 @@ load_dotenv()
 
 API_TOKEN = os.getenv("BOT_TOKEN")
 
+# Webhook mode is enabled by UPDATE_SOURCE=webhook
+UPDATE_SOURCE = os.getenv("UPDATE_SOURCE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
 logging.basicConfig(level=logging.INFO)
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher(bot)
@@ -15,5 +26,43 @@ dp = Dispatcher(bot)
 async def start_handler(message: types.Message):
     await message.answer("Бот работает. Ожидайте сигналы...")
 
+async def webhook_handler(request: web.Request):
+    """Accept one update or a JSON array of updates"""
+    # Compared as bytes: compare_digest() rejects non-ASCII str (aiohttp keeps
+    # undecodable header bytes as surrogates)
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if WEBHOOK_SECRET and not hmac.compare_digest(token.encode(errors="surrogateescape"), WEBHOOK_SECRET.encode()):
+        return web.Response(status=403)
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    if isinstance(payload, dict):
+        payload = [payload]
+
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    await asyncio.gather(*(dp.process_update(types.Update(**item)) for item in payload))
+    return web.Response()
+
+async def on_startup(app: web.Application):
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None)
+
+async def on_shutdown(app: web.Application):
+    session = await bot.get_session()
+    await session.close()
+
+def start_webhook():
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, webhook_handler)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
 if __name__ == "__main__":
-    executor.start_polling(dp, skip_updates=True)
\ No newline at end of file
+    if UPDATE_SOURCE == "webhook":
+        start_webhook()
+    else:
+        executor.start_polling(dp, skip_updates=True)